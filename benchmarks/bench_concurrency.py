@@ -0,0 +1,129 @@
+# benchmarks/bench_concurrency.py
+# 单个 uvicorn worker 在并发同步突发下的吞吐与延迟，对比同步驱动 (线程池) 与异步驱动:
+# python benchmarks/bench_concurrency.py --concurrency 10,50,200
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+import httpx
+
+from common import ROOT, fake_items
+
+# 在子进程中启动单 worker 服务端
+SERVER_SCRIPT = """
+import sys, uvicorn
+uvicorn.run("src.server.main:app", host="127.0.0.1", port=int(sys.argv[1]), log_level="warning", workers=1)
+"""
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(db_url: str, async_mode: bool, extra_env: dict | None = None) -> tuple:
+    port = free_port()
+    env = {
+        **os.environ, "DATABASE_URL": db_url, "DATABASE_ASYNC": str(async_mode).lower(),
+        "RATE_LIMIT_ENABLED": "false", **(extra_env or {}),
+    }
+    proc = subprocess.Popen(
+        [sys.executable, "-c", SERVER_SCRIPT, str(port)],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    for _ in range(200):
+        try:
+            httpx.get(base_url + "/", timeout=1).raise_for_status()
+            return proc, base_url
+        except httpx.HTTPError:
+            time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError("server did not start")
+
+
+def register(base_url: str, count: int) -> list:
+    headers = []
+    with httpx.Client(base_url=base_url, timeout=30) as client:
+        for _ in range(count):
+            username = f"bench_{uuid.uuid4().hex[:8]}"
+            client.post("/auth/register", json={"username": username, "password": "pw", "kdf_salt": "c2FsdA=="})
+            token = client.post("/auth/token", data={"username": username, "password": "pw"}).json()["access_token"]
+            headers.append({"Authorization": f"Bearer {token}"})
+    return headers
+
+
+async def burst(base_url: str, users: list, concurrency: int, rounds: int, batch: int) -> tuple:
+    """每个并发客户端循环执行: 推送一小批 -> 拉取 manifest -> 按 revision 增量拉取"""
+    latencies = []
+    errors = 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        async def worker(n: int):
+            nonlocal errors
+            headers = users[n % len(users)]
+            for _ in range(rounds):
+                for method, url, body in (
+                    ("POST", "/api/v1/sync", {"pull": False, "push_items": fake_items(batch)}),
+                    ("GET", "/api/v1/manifest", None),
+                    ("POST", "/api/v1/sync", {"since_revision": 0, "push_items": []}),
+                ):
+                    start = time.perf_counter()
+                    try:
+                        resp = await client.request(method, url, json=body, headers=headers)
+                        ok = resp.status_code == 200
+                    except httpx.HTTPError:
+                        # 连接池耗尽等服务端异常会直接断开连接
+                        ok = False
+                    latencies.append(time.perf_counter() - start)
+                    errors += not ok
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(n) for n in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return elapsed, latencies, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="同步 / 异步数据库模式的并发对比")
+    parser.add_argument("--concurrency", default="10,50,200")
+    parser.add_argument("--users", type=int, default=20, help="参与测试的用户数，同一用户的推送在服务端串行")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--batch", type=int, default=20)
+    parser.add_argument("--db-url", default=None, help="默认每种模式使用一个新的临时 SQLite 文件")
+    args = parser.parse_args()
+    levels = [int(c) for c in args.concurrency.split(",")]
+
+    print(f"{'mode':<6} {'conc':>5} {'req/s':>8} {'p50(ms)':>9} {'p99(ms)':>9} {'errors':>7}")
+    for async_mode in (False, True):
+        with tempfile.TemporaryDirectory() as tmp:
+            db_url = args.db_url or f"sqlite:///{tmp}/bench.db"
+            proc, base_url = start_server(db_url, async_mode)
+            try:
+                users = register(base_url, args.users)
+                for level in levels:
+                    elapsed, latencies, errors = asyncio.run(
+                        burst(base_url, users, level, args.rounds, args.batch)
+                    )
+                    latencies.sort()
+                    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+                    print(
+                        f"{'async' if async_mode else 'sync':<6} {level:>5} {len(latencies) / elapsed:>8.0f} "
+                        f"{statistics.median(latencies) * 1000:>9.1f} {p99 * 1000:>9.1f} {errors:>7}"
+                    )
+            finally:
+                proc.terminate()
+                proc.wait()
+
+
+if __name__ == "__main__":
+    main()
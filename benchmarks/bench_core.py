@@ -0,0 +1,206 @@
+# benchmarks/bench_core.py
+# 核心热路径的微基准: 密钥派生、条目加解密 (不同备注长度)、PasswordItem JSON 往返、密码生成、
+# 本地库 save_item / get_all_items / mark_synced (不同库大小)。
+# 结果与 benchmarks/baselines/core.json 比较，单次操作耗时超过基线 (1 + threshold) 倍即视为退化，退出码为 1。
+# 基线与机器相关: 在同一台参考机器上运行并用 --update-baseline 更新，随改动一起提交。
+#   python benchmarks/bench_core.py
+#   python benchmarks/bench_core.py --filter db. --sizes 1000,10000
+#   python benchmarks/bench_core.py --update-baseline
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import uuid
+from typing import Callable, Iterator, Tuple
+
+from common import ROOT  # 导入时会把仓库根目录加入 sys.path
+from src.core.crypto import CryptoManager
+from src.core.generator import generate_password
+from src.core.models import PasswordItem
+from src.client.database import DatabaseManager
+
+BASELINE = os.path.join(ROOT, "benchmarks", "baselines", "core.json")
+NOTE_SIZES = {"0": 0, "1k": 1024, "16k": 16 * 1024, "64k": 64 * 1024}
+# 每个样本至少运行的秒数 (快速操作自动增加循环次数)
+MIN_SAMPLE_TIME = 0.2
+# 单个样本超过该秒数的用例最多取 3 个样本
+SLOW_SAMPLE_TIME = 1.0
+# save_item 每个样本修改的条目数
+SAVE_SAMPLE = 100
+
+# (名称, 被测函数, 每次调用包含的操作数)
+Case = Tuple[str, Callable[[], object], int]
+
+
+def _size_label(n: int) -> str:
+    return f"{n // 1000}k" if n % 1000 == 0 else str(n)
+
+
+def _item(note_size: int) -> PasswordItem:
+    return PasswordItem(title="example.com", username="alice@example.com", password=generate_password(length=20),
+                        url="https://example.com/login", notes="n" * note_size)
+
+
+def crypto_cases(args) -> Iterator[Case]:
+    crypto = CryptoManager()
+    salt = crypto.generate_salt()
+    crypto.derive_key("correct horse battery staple", salt)
+    yield "crypto.derive_key", lambda: crypto.derive_key("correct horse battery staple", salt), 1
+    for label, size in NOTE_SIZES.items():
+        item = _item(size)
+        token = crypto.encrypt_item(item)
+        yield f"crypto.encrypt_item[notes={label}]", lambda item=item: crypto.encrypt_item(item), 1
+        yield f"crypto.decrypt_item[notes={label}]", lambda token=token: crypto.decrypt_item(token), 1
+
+
+def model_cases(args) -> Iterator[Case]:
+    for label, size in NOTE_SIZES.items():
+        item = _item(size)
+        yield (f"models.json_roundtrip[notes={label}]",
+               lambda item=item: PasswordItem.model_validate_json(item.model_dump_json()), 1)
+
+
+def generator_cases(args) -> Iterator[Case]:
+    for length in (12, 32, 128):
+        yield f"generator.generate_password[len={length}]", lambda length=length: generate_password(length=length), 1
+
+
+def db_cases(args) -> Iterator[Case]:
+    crypto = CryptoManager()
+    crypto.derive_key("bench", crypto.generate_salt())
+    token = crypto.encrypt_item(_item(200))
+    rng = random.Random(0)
+    for rows in args.sizes:
+        label = _size_label(rows)
+        names = [f"db.{op}[rows={label}]" for op in ("save_item", "get_all_items", "mark_synced")]
+        # 过滤掉的规模不必准备数据
+        if not any(args.filter in name for name in names):
+            continue
+        with tempfile.TemporaryDirectory() as tmp:
+            db = DatabaseManager()
+            with contextlib.redirect_stdout(io.StringIO()):
+                db.connect(os.path.join(tmp, "bench.db"))
+            ids = [str(uuid.uuid4()) for _ in range(rows)]
+            now = time.time()
+            db.ingest_snapshot(
+                ({"id": i, "encrypted_data": token, "is_deleted": False, "updated_at": now, "revision": 1, "version": 1}
+                 for i in ids), owner="bench",
+            )
+
+            def save_items():
+                # 每次调用都提交，包含读取旧条目与更新摘要树
+                for item_id in rng.sample(ids, min(SAVE_SAMPLE, rows)):
+                    db.save_item(item_id, token, owner="bench")
+
+            yield names[0], save_items, min(SAVE_SAMPLE, rows)
+            yield names[1], db.get_all_items, 1
+            versions = {i: 2 for i in ids}
+            yield names[2], lambda: db.mark_synced(ids, sync_time=now, owner="bench", revision=2, versions=versions), 1
+            db.engine.dispose()  # type: ignore
+
+
+SUITES = [crypto_cases, model_cases, generator_cases, db_cases]
+
+
+def measure(fn: Callable[[], object], ops: int, repeat: int) -> float:
+    """
+    返回单次操作耗时 (秒): 自动确定每个样本的循环次数，取 repeat 个样本中最快的一个。
+    与 timeit 相同，最小值受调度和其他进程干扰最少，比中位数更适合做回归比较
+    """
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= MIN_SAMPLE_TIME:
+            break
+        number = max(number * 2, int(number * MIN_SAMPLE_TIME / max(elapsed, 1e-9)) + 1)
+    samples = [elapsed]
+    if elapsed > SLOW_SAMPLE_TIME:
+        repeat = min(repeat, 3)
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append(time.perf_counter() - start)
+    return min(samples) / (number * ops)
+
+
+def _format_time(seconds: float) -> str:
+    if seconds >= 1:
+        return f"{seconds:.2f} s"
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.2f} ms"
+    return f"{seconds * 1e6:.2f} us"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="核心模块微基准与基线比较")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="本地库的条目数，逗号分隔")
+    parser.add_argument("--filter", default="", help="只运行名称包含该字符串的用例")
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--threshold", type=float, default=0.3, help="退化阈值 (比例)")
+    parser.add_argument("--update-baseline", action="store_true", help="把本次结果写入基线 (合并已有条目)")
+    parser.add_argument("--out", default=None, help="结果另存为 JSON")
+    args = parser.parse_args()
+    args.sizes = [int(s) for s in args.sizes.split(",")]
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    base_results = baseline.get("results", {})
+
+    results = {}
+    regressions = []
+    print(f"{'case':<44} {'time/op':>12} {'baseline':>12} {'change':>8}")
+    for suite in SUITES:
+        for name, fn, ops in suite(args):
+            if args.filter not in name:
+                continue
+            seconds = measure(fn, ops, args.repeat)
+            base = base_results.get(name)
+            if base and seconds > base * (1 + args.threshold):
+                # 疑似退化时再测一轮，排除偶发的调度干扰
+                seconds = min(seconds, measure(fn, ops, args.repeat))
+            results[name] = seconds
+            change = ""
+            if base:
+                ratio = seconds / base - 1
+                change = f"{ratio:+.0%}"
+                if ratio > args.threshold:
+                    regressions.append(f"{name}: {_format_time(base)} -> {_format_time(seconds)} ({change})")
+                    change += " !"
+            print(f"{name:<44} {_format_time(seconds):>12} {_format_time(base) if base else '-':>12} {change:>8}")
+
+    meta = {"timestamp": time.time(), "python": platform.python_version(), "platform": platform.platform(),
+            "machine": platform.machine()}
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"meta": meta, "results": results}, f, indent=2, sort_keys=True)
+    if args.update_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"meta": meta, "results": {**base_results, **results}}, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\nbaseline updated: {args.baseline}")
+        return
+    if regressions:
+        print(f"\nREGRESSIONS (threshold {args.threshold:.0%}):")
+        for line in regressions:
+            print("  " + line)
+        sys.exit(1)
+    if base_results:
+        print(f"\nno regressions (threshold {args.threshold:.0%})")
+
+
+if __name__ == "__main__":
+    main()
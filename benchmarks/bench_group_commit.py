@@ -0,0 +1,76 @@
+# benchmarks/bench_group_commit.py
+# 并发推送吞吐: 每个请求单独提交 vs 组提交 (默认 synchronous=FULL，即每次提交都落盘)
+# python benchmarks/bench_group_commit.py --concurrency 10,50,100
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+
+import httpx
+
+from bench_concurrency import register, start_server
+from common import fake_items
+
+
+async def push_burst(base_url: str, users: list, concurrency: int, pushes: int, batch: int) -> tuple:
+    latencies = []
+    errors = 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        async def worker(n: int):
+            nonlocal errors
+            headers = users[n % len(users)]
+            for _ in range(pushes):
+                body = {"pull": False, "push_items": fake_items(batch)}
+                start = time.perf_counter()
+                try:
+                    resp = await client.post("/api/v1/sync", json=body, headers=headers)
+                    ok = resp.status_code == 200
+                except httpx.HTTPError:
+                    ok = False
+                latencies.append(time.perf_counter() - start)
+                errors += not ok
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(n) for n in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return elapsed, latencies, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="推送组提交吞吐对比")
+    parser.add_argument("--concurrency", default="10,50,100")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--pushes", type=int, default=5, help="每个并发客户端的推送次数")
+    parser.add_argument("--batch", type=int, default=5, help="每次推送的条目数")
+    parser.add_argument("--synchronous", default="FULL", help="SQLITE_SYNCHRONOUS")
+    args = parser.parse_args()
+    levels = [int(c) for c in args.concurrency.split(",")]
+
+    print(f"{'mode':<8} {'conc':>5} {'push/s':>8} {'p50(ms)':>9} {'p99(ms)':>9} {'errors':>7}")
+    for group_commit in (False, True):
+        with tempfile.TemporaryDirectory() as tmp:
+            proc, base_url = start_server(
+                f"sqlite:///{tmp}/bench.db", async_mode=True,
+                extra_env={"SYNC_GROUP_COMMIT": str(group_commit).lower(), "SQLITE_SYNCHRONOUS": args.synchronous},
+            )
+            try:
+                users = register(base_url, args.users)
+                for level in levels:
+                    elapsed, latencies, errors = asyncio.run(
+                        push_burst(base_url, users, level, args.pushes, args.batch)
+                    )
+                    latencies.sort()
+                    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+                    print(
+                        f"{'group' if group_commit else 'single':<8} {level:>5} {len(latencies) / elapsed:>8.0f} "
+                        f"{statistics.median(latencies) * 1000:>9.1f} {p99 * 1000:>9.1f} {errors:>7}"
+                    )
+            finally:
+                proc.terminate()
+                proc.wait()
+
+
+if __name__ == "__main__":
+    main()
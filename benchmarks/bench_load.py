@@ -0,0 +1,282 @@
+# benchmarks/bench_load.py
+# 服务端容量测试: 在临时 SQLite 上启动 uvicorn (或指向已运行的服务端)，注册 N 个用户并预置指定大小的保险库，
+# 按权重混合执行登录、增量同步、批量推送、全量拉取，输出每类操作的吞吐与 p50/p95/p99，结果写入 JSON。
+# 与基线比较时，吞吐下降或 p95 上升超过阈值即视为退化，退出码为 1。
+#   python benchmarks/bench_load.py --users 50 --vault-size 1000 --concurrency 50 --duration 20 --out load.json
+#   python benchmarks/bench_load.py --workloads login-storm,mixed --compare load.json --threshold 0.2
+# 环境变量透传给服务端: --server-env DATABASE_ASYNC=true --server-env STORAGE_BACKEND=sharded
+import argparse
+import asyncio
+import json
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+import httpx
+
+from bench_concurrency import start_server
+from common import ROOT, fake_items, percentile
+
+PASSWORD = "bench-password"
+# 预置条目时每次推送的条目数
+SEED_BATCH = 5000
+
+# 预设的工作负载 (操作 -> 权重)
+WORKLOADS = {
+    # 大多数客户端在做增量同步，偶尔有推送、新设备全量拉取和重新登录
+    "mixed": {"sync": 70, "push": 15, "pull": 5, "login": 10},
+    # 服务重启或令牌批量过期后的集中登录 (Argon2 校验是 CPU 密集型)
+    "login-storm": {"login": 1},
+    "sync": {"sync": 1},
+    "push": {"push": 1},
+    "pull": {"pull": 1},
+}
+
+
+class User:
+    def __init__(self, username: str, headers: dict):
+        self.username = username
+        self.headers = headers
+        self.item_ids: list = []
+        # 增量同步的游标
+        self.revision = 0
+
+
+def parse_mix(spec: str) -> dict:
+    """预设名称，或 "sync=6,push=2" 形式的自定义权重"""
+    if spec in WORKLOADS:
+        return WORKLOADS[spec]
+    mix = {}
+    for part in spec.split("+"):
+        op, _, weight = part.partition("=")
+        if op not in OPERATIONS:
+            raise SystemExit(f"unknown operation {op!r} in workload {spec!r}")
+        mix[op] = float(weight or 1)
+    return mix
+
+
+async def setup_users(client: httpx.AsyncClient, count: int, vault_size: int, note_size: int) -> list:
+    users = []
+    for _ in range(count):
+        username = f"load_{uuid.uuid4().hex[:10]}"
+        resp = await client.post("/auth/register", json={"username": username, "password": PASSWORD, "kdf_salt": "c2FsdA=="})
+        resp.raise_for_status()
+        resp = await client.post("/auth/token", data={"username": username, "password": PASSWORD})
+        resp.raise_for_status()
+        user = User(username, {"Authorization": f"Bearer {resp.json()['access_token']}"})
+        for start in range(0, vault_size, SEED_BATCH):
+            items = fake_items(min(SEED_BATCH, vault_size - start), note_size)
+            resp = await client.post("/api/v1/sync", json={"pull": False, "push_items": items}, headers=user.headers)
+            resp.raise_for_status()
+            user.item_ids.extend(i["id"] for i in items)
+            user.revision = resp.json()["revision"]
+        users.append(user)
+    return users
+
+
+def _updates(user: User, count: int, note_size: int) -> list:
+    """修改已有条目 (保险库大小不随测试时间增长)，条目不足时新增"""
+    if len(user.item_ids) < count:
+        items = fake_items(count, note_size)
+        user.item_ids.extend(i["id"] for i in items)
+        return items
+    blob = uuid.uuid4().hex * (note_size // 32 + 1)
+    return [{"id": i, "encrypted_data": blob[:note_size], "is_deleted": False}
+            for i in random.sample(user.item_ids, count)]
+
+
+async def op_login(client: httpx.AsyncClient, user: User, args) -> httpx.Response:
+    return await client.post("/auth/token", data={"username": user.username, "password": PASSWORD})
+
+
+async def op_sync(client: httpx.AsyncClient, user: User, args) -> httpx.Response:
+    # 一次典型的增量同步: 上传一条修改，拉取游标之后的变更
+    body = {"since_revision": user.revision, "push_items": _updates(user, 1, args.note_size)}
+    resp = await client.post("/api/v1/sync", json=body, headers=user.headers)
+    if resp.status_code == 200:
+        user.revision = max(user.revision, resp.json()["revision"])
+    return resp
+
+
+async def op_push(client: httpx.AsyncClient, user: User, args) -> httpx.Response:
+    body = {"pull": False, "push_items": _updates(user, args.push_batch, args.note_size)}
+    return await client.post("/api/v1/sync", json=body, headers=user.headers)
+
+
+async def op_pull(client: httpx.AsyncClient, user: User, args) -> httpx.Response:
+    # 新设备的全量拉取
+    return await client.post("/api/v1/sync", json={"since_revision": 0, "push_items": []}, headers=user.headers)
+
+
+OPERATIONS = {"login": op_login, "sync": op_sync, "push": op_push, "pull": op_pull}
+
+
+async def drive(client: httpx.AsyncClient, users: list, mix: dict, args) -> tuple:
+    """concurrency 个客户端按权重随机选择操作，持续 duration 秒，返回 (耗时, {操作: [(延迟, 状态码)]})"""
+    ops = list(mix)
+    weights = [mix[op] for op in ops]
+    samples: dict = {op: [] for op in ops}
+    deadline = time.perf_counter() + args.duration
+
+    async def worker(n: int):
+        rng = random.Random(args.seed + n)
+        user = users[n % len(users)]
+        while time.perf_counter() < deadline:
+            op = rng.choices(ops, weights)[0]
+            start = time.perf_counter()
+            try:
+                resp = await OPERATIONS[op](client, user, args)
+                # 读完响应体才算完成
+                await resp.aread()
+                status = resp.status_code
+            except httpx.HTTPError:
+                # 连接被拒绝或超时
+                status = 0
+            samples[op].append((time.perf_counter() - start, status))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(n) for n in range(args.concurrency)))
+    return time.perf_counter() - start, samples
+
+
+def summarize(elapsed: float, samples: list) -> dict:
+    latencies = sorted(s[0] for s in samples)
+    statuses: dict = {}
+    for _, status in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    ok = statuses.get("200", 0)
+    return {
+        "requests": len(samples),
+        "errors": len(samples) - ok,
+        "throughput": round(ok / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "max_ms": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+        "statuses": statuses,
+    }
+
+
+async def run(base_url: str, args) -> dict:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    results = {}
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        started = time.perf_counter()
+        users = await setup_users(client, args.users, args.vault_size, args.note_size)
+        print(f"seeded {args.users} users x {args.vault_size} items in {time.perf_counter() - started:.1f}s")
+        for name in args.workloads.split(","):
+            elapsed, samples = await drive(client, users, parse_mix(name), args)
+            results[name] = {"seconds": round(elapsed, 2)}
+            results[name]["operations"] = {op: summarize(elapsed, s) for op, s in samples.items() if s}
+            results[name]["total"] = summarize(elapsed, [x for s in samples.values() for x in s])
+            print_workload(name, results[name])
+    return results
+
+
+def print_workload(name: str, result: dict):
+    print(f"\n[{name}] {result['seconds']}s")
+    print(f"{'operation':<10} {'requests':>9} {'errors':>7} {'req/s':>9} {'p50(ms)':>9} {'p95(ms)':>9} {'p99(ms)':>9}")
+    for op, r in [*result["operations"].items(), ("total", result["total"])]:
+        print(f"{op:<10} {r['requests']:>9} {r['errors']:>7} {r['throughput']:>9.1f} "
+              f"{r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} {r['p99_ms']:>9.1f}")
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """吞吐下降或 p95 上升超过 threshold (比例) 的 (工作负载, 操作)"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get("workloads", {}).get(name)
+        if not base:
+            continue
+        for op, r in result["operations"].items():
+            b = base["operations"].get(op)
+            if not b:
+                continue
+            if b["throughput"] and r["throughput"] < b["throughput"] * (1 - threshold):
+                regressions.append(f"{name}/{op}: throughput {b['throughput']} -> {r['throughput']} req/s")
+            if b["p95_ms"] and r["p95_ms"] > b["p95_ms"] * (1 + threshold):
+                regressions.append(f"{name}/{op}: p95 {b['p95_ms']} -> {r['p95_ms']} ms")
+            if r["errors"] > b["errors"]:
+                regressions.append(f"{name}/{op}: errors {b['errors']} -> {r['errors']}")
+    return regressions
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="服务端负载测试: 合成用户与保险库，混合工作负载")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--vault-size", type=int, default=500, help="每个用户预置的条目数")
+    parser.add_argument("--note-size", type=int, default=300, help="每条密文的字节数")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=10.0, help="每个工作负载的持续秒数")
+    parser.add_argument("--workloads", default="mixed",
+                        help=f"逗号分隔，预设 {', '.join(WORKLOADS)}，或自定义权重如 sync=6+push=2+pull=1")
+    parser.add_argument("--push-batch", type=int, default=200, help="批量推送的条目数")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--url", default=None, help="测试已运行的服务端，不启动临时实例")
+    parser.add_argument("--server-env", action="append", default=[], metavar="KEY=VALUE", help="临时服务端的配置")
+    parser.add_argument("--out", default=None, help="结果写入该 JSON 文件")
+    parser.add_argument("--compare", default=None, help="与该 JSON 结果比较")
+    parser.add_argument("--threshold", type=float, default=0.2, help="退化阈值 (比例)")
+    args = parser.parse_args()
+    server_env = dict(e.split("=", 1) for e in args.server_env)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        proc = None
+        if args.url:
+            base_url = args.url.rstrip("/")
+        else:
+            server_env.setdefault("SNAPSHOT_DIR", f"{tmp}/snapshots")
+            server_env.setdefault("SHARD_DIR", f"{tmp}/shards")
+            proc, base_url = start_server(f"sqlite:///{tmp}/load.db", server_env.pop("DATABASE_ASYNC", "true") == "true",
+                                          extra_env=server_env)
+        try:
+            results = asyncio.run(run(base_url, args))
+        finally:
+            if proc is not None:
+                proc.terminate()
+                proc.wait()
+
+    report = {
+        "meta": {
+            "timestamp": time.time(), "git": git_revision(), "python": platform.python_version(),
+            "platform": platform.platform(), "server_env": server_env,
+            "args": {k: v for k, v in vars(args).items() if k not in ("out", "compare")},
+        },
+        "workloads": results,
+    }
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nresults written to {args.out}")
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        # 规模或并发不同的两次运行没有可比性
+        changed = [k for k in ("users", "vault_size", "note_size", "concurrency", "push_batch")
+                   if baseline.get("meta", {}).get("args", {}).get(k) != getattr(args, k)]
+        if changed:
+            print(f"\nwarning: baseline was run with different {', '.join(changed)}")
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\nREGRESSIONS (threshold {args.threshold:.0%}):")
+            for line in regressions:
+                print("  " + line)
+            sys.exit(1)
+        print(f"\nno regressions against {args.compare} (threshold {args.threshold:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+# benchmarks/bench_sharding.py
+# 多用户并发推送: 单库 (shared) vs 每用户一个 SQLite 分片 (sharded)
+# python benchmarks/bench_sharding.py --concurrency 10,50 --batch 200
+import argparse
+import asyncio
+import statistics
+import tempfile
+
+from bench_concurrency import register, start_server
+from bench_group_commit import push_burst
+
+
+def main():
+    parser = argparse.ArgumentParser(description="共享库与按用户分片的推送吞吐对比")
+    parser.add_argument("--concurrency", default="10,50")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--pushes", type=int, default=5, help="每个并发客户端的推送次数")
+    parser.add_argument("--batch", type=int, default=200, help="每次推送的条目数")
+    parser.add_argument("--shard-cache", type=int, default=256, help="SHARD_CACHE_SIZE")
+    args = parser.parse_args()
+    levels = [int(c) for c in args.concurrency.split(",")]
+
+    print(f"{'backend':<8} {'conc':>5} {'push/s':>8} {'items/s':>8} {'p50(ms)':>9} {'p99(ms)':>9} {'errors':>7}")
+    for backend in ("shared", "sharded"):
+        with tempfile.TemporaryDirectory() as tmp:
+            proc, base_url = start_server(
+                f"sqlite:///{tmp}/bench.db", async_mode=True,
+                extra_env={
+                    "STORAGE_BACKEND": backend,
+                    "SHARD_DIR": f"{tmp}/shards",
+                    "SHARD_CACHE_SIZE": str(args.shard_cache),
+                },
+            )
+            try:
+                users = register(base_url, args.users)
+                for level in levels:
+                    elapsed, latencies, errors = asyncio.run(
+                        push_burst(base_url, users, level, args.pushes, args.batch)
+                    )
+                    latencies.sort()
+                    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+                    rate = len(latencies) / elapsed
+                    print(
+                        f"{backend:<8} {level:>5} {rate:>8.0f} {rate * args.batch:>8.0f} "
+                        f"{statistics.median(latencies) * 1000:>9.1f} {p99 * 1000:>9.1f} {errors:>7}"
+                    )
+            finally:
+                proc.terminate()
+                proc.wait()
+
+
+if __name__ == "__main__":
+    main()
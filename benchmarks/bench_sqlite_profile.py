@@ -0,0 +1,45 @@
+# benchmarks/bench_sqlite_profile.py
+# SQLite 默认设置 vs 生产配置 (WAL + pragmas + 进程内写锁) 下的并发同步吞吐:
+# python benchmarks/bench_sqlite_profile.py --concurrency 10,50
+import argparse
+import asyncio
+import statistics
+import tempfile
+
+from bench_concurrency import burst, register, start_server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite 默认 / 生产配置的并发同步吞吐对比")
+    parser.add_argument("--concurrency", default="10,50,100")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--batch", type=int, default=20)
+    args = parser.parse_args()
+    levels = [int(c) for c in args.concurrency.split(",")]
+
+    print(f"{'profile':<11} {'conc':>5} {'req/s':>8} {'p50(ms)':>9} {'p99(ms)':>9} {'errors':>7}")
+    for profile in ("default", "production"):
+        with tempfile.TemporaryDirectory() as tmp:
+            proc, base_url = start_server(
+                f"sqlite:///{tmp}/bench.db", async_mode=True, extra_env={"DATABASE_PROFILE": profile}
+            )
+            try:
+                users = register(base_url, args.users)
+                for level in levels:
+                    elapsed, latencies, errors = asyncio.run(
+                        burst(base_url, users, level, args.rounds, args.batch)
+                    )
+                    latencies.sort()
+                    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+                    print(
+                        f"{profile:<11} {level:>5} {len(latencies) / elapsed:>8.0f} "
+                        f"{statistics.median(latencies) * 1000:>9.1f} {p99 * 1000:>9.1f} {errors:>7}"
+                    )
+            finally:
+                proc.terminate()
+                proc.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+# benchmarks/bench_sync_network.py
+# 慢速网络下的端到端同步: 本地启动真实服务端，客户端 SyncService 经过进程内 TCP 代理访问，
+# 代理按网络配置注入往返延迟、带宽限制、丢包 (TCP 重传造成的停顿) 与连接重置。
+# 每个场景在新用户下预置云端与本地保险库，制造指定比例的差异，再计时 check_diff + execute_sync，
+# 报告耗时、HTTP 往返次数、TCP 连接数、线上字节数 (含请求头，压缩后)，并校验两端摘要树一致。
+#   python benchmarks/bench_sync_network.py --items 2000 --divergence 1,10 --profiles lan,broadband,mobile
+#   python benchmarks/bench_sync_network.py --rtt 0.2 --mbit 1 --loss 0.02 --scenarios remote,local
+import argparse
+import asyncio
+import base64
+import contextlib
+import io
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import uuid
+
+import httpx
+
+from bench_concurrency import free_port, start_server
+from src.client.database import db
+from src.client.profile_manager import Profile
+from src.client.state import state
+from src.client.sync_service import SyncService, SyncStatus
+
+PASSWORD = "bench-password"
+SALT = "c2FsdHNhbHRzYWx0c2FsdA=="
+CHUNK = 16 * 1024
+# 按以太网 MSS 把数据块折算成分组数，丢包概率按分组计
+MSS = 1460
+SEED_BATCH = 5000
+
+# rtt: 秒；mbit: 每个方向的带宽 (Mbit/s，0 为不限)；
+# loss: 每个分组的丢包概率 (按 TCP 重传计，该方向停顿一个 RTO)；reset: 每个数据块导致连接被重置的概率
+PROFILES = {
+    "lan": {"rtt": 0.001, "mbit": 0, "loss": 0.0, "reset": 0.0},
+    "broadband": {"rtt": 0.03, "mbit": 50, "loss": 0.0, "reset": 0.0},
+    "mobile": {"rtt": 0.15, "mbit": 2, "loss": 0.01, "reset": 0.0},
+    "flaky": {"rtt": 0.3, "mbit": 1, "loss": 0.02, "reset": 0.01},
+}
+
+
+class NetemProxy:
+    """单线程 asyncio TCP 代理。每个方向按 (发送完成时间 + 单程延迟) 依次投递，模拟带宽与传播延迟"""
+
+    def __init__(self, target_host: str, target_port: int):
+        self.target = (target_host, target_port)
+        self.rtt = 0.0
+        self.bandwidth = 0.0  # 字节/秒
+        self.loss = 0.0
+        self.reset = 0.0
+        self.rng = random.Random(0)
+        self.port = free_port()
+        self.loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self.reset_counters()
+
+    def configure(self, rtt: float, mbit: float, loss: float, reset: float, seed: int = 0):
+        self.rtt, self.bandwidth, self.loss, self.reset = rtt, mbit * 1_000_000 / 8, loss, reset
+        self.rng = random.Random(seed)
+
+    def reset_counters(self):
+        self.bytes_up = self.bytes_down = self.connections = self.stalls = self.resets = 0
+
+    def start(self) -> str:
+        threading.Thread(target=self._run, daemon=True).start()
+        self._ready.wait()
+        return f"http://127.0.0.1:{self.port}"
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(asyncio.start_server(self._handle, "127.0.0.1", self.port))
+        self._ready.set()
+        self.loop.run_forever()
+
+    async def _handle(self, client_reader: asyncio.StreamReader, client_writer: asyncio.StreamWriter):
+        self.connections += 1
+        try:
+            server_reader, server_writer = await asyncio.open_connection(*self.target)
+        except OSError:
+            client_writer.close()
+            return
+        writers = (client_writer, server_writer)
+        # 建立连接本身需要一个往返
+        await asyncio.sleep(self.rtt)
+        await asyncio.gather(
+            self._pipe(client_reader, server_writer, writers, upstream=True),
+            self._pipe(server_reader, client_writer, writers, upstream=False),
+            return_exceptions=True,
+        )
+        for w in writers:
+            w.close()
+
+    async def _pipe(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, writers: tuple, upstream: bool):
+        queue: asyncio.Queue = asyncio.Queue()
+        loop = asyncio.get_running_loop()
+
+        def abort():
+            for w in writers:
+                w.transport.abort()
+
+        async def deliver():
+            try:
+                while True:
+                    at, data = await queue.get()
+                    delay = at - loop.time()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    if data is None:
+                        writer.close()
+                        return
+                    writer.write(data)
+                    await writer.drain()
+            except OSError:
+                abort()
+
+        delivery = asyncio.ensure_future(deliver())
+        link_free = 0.0
+        try:
+            while True:
+                data = await reader.read(CHUNK)
+                now = loop.time()
+                if not data:
+                    queue.put_nowait((max(now, link_free) + self.rtt / 2, None))
+                    break
+                if self.reset and self.rng.random() < self.reset:
+                    self.resets += 1
+                    abort()
+                    return
+                if upstream:
+                    self.bytes_up += len(data)
+                else:
+                    self.bytes_down += len(data)
+                start = max(now, link_free)
+                link_free = start + (len(data) / self.bandwidth if self.bandwidth else 0.0)
+                packets = -(-len(data) // MSS)
+                if self.loss and self.rng.random() < 1 - (1 - self.loss) ** packets:
+                    # 重传超时: 之后的数据也被阻塞在这个数据块后面
+                    self.stalls += 1
+                    link_free += max(0.2, 2 * self.rtt)
+                queue.put_nowait((link_free + self.rtt / 2, data))
+            await delivery
+        except OSError:
+            # 一端断开 (包括客户端关闭连接时的 RST): 另一个方向也随之结束
+            abort()
+        finally:
+            delivery.cancel()
+
+
+def ciphertext(size: int) -> str:
+    # 真实密文是不可压缩的 base64，线上字节数才有参考意义 (common.fake_items 的重复字符会被压缩掉)
+    return base64.urlsafe_b64encode(os.urandom(size * 3 // 4)).decode("ascii")
+
+
+def random_items(ids: list, size: int) -> list:
+    return [{"id": i, "encrypted_data": ciphertext(size), "is_deleted": False} for i in ids]
+
+
+class Bench:
+    def __init__(self, server_url: str, proxy: NetemProxy, proxy_url: str, tmp: str, args):
+        self.server_url = server_url
+        self.proxy = proxy
+        self.proxy_url = proxy_url
+        self.tmp = tmp
+        self.args = args
+        self.http = httpx.Client(base_url=server_url, timeout=120)
+
+    def new_user(self) -> dict:
+        username = f"net_{uuid.uuid4().hex[:10]}"
+        self.http.post("/auth/register", json={"username": username, "password": PASSWORD, "kdf_salt": SALT})
+        resp = self.http.post("/auth/token", data={"username": username, "password": PASSWORD})
+        resp.raise_for_status()
+        state.token, state.username = resp.json()["access_token"], username
+        return {"Authorization": f"Bearer {state.token}"}
+
+    def push_remote(self, headers: dict, items: list):
+        for i in range(0, len(items), SEED_BATCH):
+            resp = self.http.post("/api/v1/sync", json={"pull": False, "push_items": items[i:i + SEED_BATCH]},
+                                  headers=headers)
+            resp.raise_for_status()
+
+    def service(self, url: str, name: str) -> SyncService:
+        return SyncService(Profile(name=name, db_filename=db.current_db_name or "", server_url=url, username=state.username))
+
+    def prepare(self, scenario: str, percent: float) -> dict:
+        """新用户 + 云端 N 条；除 new-device 外本地先直连完整同步一次，再按场景制造差异"""
+        headers = self.new_user()
+        items = random_items([str(uuid.uuid4()) for _ in range(self.args.items)], self.args.note_size)
+        self.push_remote(headers, items)
+        with contextlib.redirect_stdout(io.StringIO()):
+            db.connect(f"{self.tmp}/{uuid.uuid4().hex}.db")
+            if scenario != "new-device":
+                _sync(self.service(self.server_url, "seed"))
+        ids = [i["id"] for i in items]
+        changed = max(1, int(len(ids) * percent / 100)) if percent else 0
+        sample = random.Random(1).sample(ids, min(len(ids), 2 * changed))
+        remote_ids, local_ids = sample[:changed], sample[changed:]
+        if scenario in ("remote", "both"):
+            self.push_remote(headers, random_items(remote_ids, self.args.note_size))
+        if scenario in ("local", "both", "digest"):
+            for item_id in local_ids:
+                db.save_item(item_id, ciphertext(self.args.note_size), is_dirty=True)
+        if scenario == "digest":
+            # 丢失同步游标 (例如重装后恢复了旧备份): 走摘要树全量比对
+            db.update_config(last_sync_revision=0)
+        return headers
+
+    def converged(self, headers: dict) -> bool:
+        remote = self.http.post("/api/v1/digest", json={"prefixes": [""]}, headers=headers).json()
+        remote_root = {n["prefix"]: n["digest"] for n in remote["nodes"]}.get("")
+        return remote_root == db.get_digest_nodes([""]).get("") and not db.get_dirty_items()
+
+    def run(self, profile: str, scenario: str, percent: float, seed: int) -> dict:
+        headers = self.prepare(scenario, percent)
+        self.proxy.configure(**PROFILES[profile], seed=seed)
+        self.proxy.reset_counters()
+        service = self.service(self.proxy_url, "bench")
+        requests_made = [0]
+        service.http.hooks["response"].append(lambda resp, *a, **k: requests_made.__setitem__(0, requests_made[0] + 1))
+        errors = []
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            for _ in range(self.args.attempts):
+                try:
+                    _sync(service)
+                    break
+                except Exception as e:
+                    errors.append(type(e).__name__)
+        elapsed = time.perf_counter() - started
+        service.http.close()
+        return {
+            "profile": profile, "scenario": scenario, "divergence_pct": percent,
+            "seconds": round(elapsed, 3), "requests": requests_made[0], "connections": self.proxy.connections,
+            "bytes_up": self.proxy.bytes_up, "bytes_down": self.proxy.bytes_down,
+            "stalls": self.proxy.stalls, "resets": self.proxy.resets, "failed_attempts": len(errors),
+            "errors": errors, "converged": self.converged(headers),
+        }
+
+
+def _sync(service: SyncService):
+    diffs = service.check_diff()
+    for d in diffs:
+        if d.status in (SyncStatus.LOCAL_NEW, SyncStatus.LOCAL_MODIFIED):
+            d.action = "PUSH"
+        elif d.status in (SyncStatus.REMOTE_NEW, SyncStatus.REMOTE_MODIFIED, SyncStatus.CONFLICT):
+            d.action = "PULL"
+    service.execute_sync(diffs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模拟慢速网络下的端到端同步")
+    parser.add_argument("--items", type=int, default=2000, help="云端保险库条目数")
+    parser.add_argument("--note-size", type=int, default=300, help="每条密文的字节数")
+    parser.add_argument("--divergence", default="1,10", help="差异条目占比 (%%)，逗号分隔")
+    parser.add_argument("--scenarios", default="new-device,in-sync,remote,local,both,digest")
+    parser.add_argument("--profiles", default="lan,broadband,mobile", help=f"预设: {', '.join(PROFILES)}")
+    parser.add_argument("--rtt", type=float, default=None, help="自定义网络: 往返延迟 (秒)")
+    parser.add_argument("--mbit", type=float, default=0, help="自定义网络: 带宽 (Mbit/s)")
+    parser.add_argument("--loss", type=float, default=0.0, help="自定义网络: 每个分组的丢包概率")
+    parser.add_argument("--reset", type=float, default=0.0, help="自定义网络: 每个数据块的连接重置概率")
+    parser.add_argument("--attempts", type=int, default=3, help="同步失败后的重试次数上限")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=None, help="结果写入该 JSON 文件")
+    args = parser.parse_args()
+
+    profiles = args.profiles.split(",")
+    if args.rtt is not None:
+        PROFILES["custom"] = {"rtt": args.rtt, "mbit": args.mbit, "loss": args.loss, "reset": args.reset}
+        profiles = ["custom"]
+    cases = []
+    for scenario in args.scenarios.split(","):
+        # new-device 与 in-sync 没有差异比例
+        for percent in ([0.0] if scenario in ("new-device", "in-sync") else
+                        [float(p) for p in args.divergence.split(",")]):
+            cases.append((scenario, percent))
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        proc, server_url = start_server(
+            f"sqlite:///{tmp}/server.db", async_mode=True,
+            extra_env={"SNAPSHOT_DIR": f"{tmp}/snapshots", "LOG_LEVEL": "WARNING"},
+        )
+        try:
+            proxy = NetemProxy("127.0.0.1", int(server_url.rsplit(":", 1)[1]))
+            bench = Bench(server_url, proxy, proxy.start(), tmp, args)
+            state.crypto.derive_key(PASSWORD, SALT)
+            print(f"{'profile':<10} {'scenario':<11} {'diff%':>6} {'seconds':>8} {'requests':>9} {'conns':>6} "
+                  f"{'up(KB)':>8} {'down(KB)':>9} {'stalls':>7} {'failed':>7} {'ok':>4}")
+            for profile in profiles:
+                for n, (scenario, percent) in enumerate(cases):
+                    # 同一场景在不同网络配置下遇到相同的故障序列，结果可以横向比较
+                    r = bench.run(profile, scenario, percent, args.seed + n)
+                    results.append(r)
+                    print(f"{profile:<10} {scenario:<11} {percent:>6g} {r['seconds']:>8.2f} {r['requests']:>9} "
+                          f"{r['connections']:>6} {r['bytes_up'] / 1024:>8.1f} {r['bytes_down'] / 1024:>9.1f} "
+                          f"{r['stalls']:>7} {r['failed_attempts']:>7} {'yes' if r['converged'] else 'NO':>4}")
+        finally:
+            proc.terminate()
+            proc.wait()
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "profiles": {p: PROFILES[p] for p in profiles}, "results": results}, f, indent=2)
+        print(f"\nresults written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
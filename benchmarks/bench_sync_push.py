@@ -0,0 +1,36 @@
+# benchmarks/bench_sync_push.py
+# PUSH 延迟随批量大小变化: python benchmarks/bench_sync_push.py
+import argparse
+import contextlib
+import io
+import time
+
+from common import server_client, register_user, fake_items
+
+
+def main():
+    parser = argparse.ArgumentParser(description="sync_vault PUSH 延迟 vs 批量大小")
+    parser.add_argument("--sizes", default="10,100,1000,5000")
+    parser.add_argument("--db-url", default=None)
+    args = parser.parse_args()
+    sizes = [int(s) for s in args.sizes.split(",")]
+
+    with server_client(args.db_url) as client:
+        headers = register_user(client)
+        print(f"{'batch':>8} {'insert(ms)':>12} {'update(ms)':>12} {'items/s':>10}")
+        for size in sizes:
+            items = fake_items(size)
+            payload = {"last_sync_timestamp": 1e12, "push_items": items}
+            # 屏蔽路由中的诊断输出，避免 stdout 成为瓶颈
+            with contextlib.redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                client.post("/api/v1/sync", json=payload, headers=headers).raise_for_status()
+                insert_t = time.perf_counter() - start
+                start = time.perf_counter()
+                client.post("/api/v1/sync", json=payload, headers=headers).raise_for_status()
+                update_t = time.perf_counter() - start
+            print(f"{size:>8} {insert_t * 1000:>12.1f} {update_t * 1000:>12.1f} {size / update_t:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# benchmarks/bench_wire_format.py
+# 拉取响应的序列化开销: JSON (pydantic 校验) / JSON (直接序列化) / msgpack (密文为原始字节)
+# python benchmarks/bench_wire_format.py
+import argparse
+import asyncio
+import base64
+import json
+import os
+import time
+import uuid
+
+from common import timed  # 导入时会把仓库根目录加入 sys.path
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+from src.core import wire
+from src.core.crypto import content_hash
+from src.server.models import VaultItem
+from src.server.routers.sync import SyncResponse, _to_wire
+
+
+def fake_vault_items(n: int, note_size: int) -> list:
+    now = time.time()
+    items = []
+    for i in range(n):
+        token = base64.urlsafe_b64encode(os.urandom(note_size)).decode("ascii")
+        items.append(VaultItem(
+            id=str(uuid.uuid4()), encrypted_data=token, content_hash=content_hash(token),
+            updated_at=now + i, is_deleted=False, revision=i + 1, version=1, owner_id=1,
+        ))
+    return items
+
+
+RESPONSE_FIELD = create_model_field(name="Response_sync_vault", type_=SyncResponse, mode="serialization")
+
+
+def fastapi_json(response: SyncResponse) -> bytes:
+    """与路由返回模型时相同的流程: response_model 校验 -> 序列化 -> JSONResponse 渲染"""
+    content = asyncio.run(serialize_response(field=RESPONSE_FIELD, response_content=response))
+    return JSONResponse(content).body
+
+
+def main():
+    parser = argparse.ArgumentParser(description="同步响应序列化 CPU 与字节数对比")
+    parser.add_argument("--sizes", default="1000,10000,50000")
+    parser.add_argument("--note-size", type=int, default=200, help="每条密文的原始字节数")
+    args = parser.parse_args()
+    sizes = [int(s) for s in args.sizes.split(",")]
+    if not wire.MSGPACK_AVAILABLE:
+        raise SystemExit("需要安装 msgpack")
+
+    print(f"{'items':>7} {'format':<14} {'encode(ms)':>11} {'decode(ms)':>11} {'bytes':>12}")
+    for size in sizes:
+        items = fake_vault_items(size, args.note_size)
+
+        def build():
+            return SyncResponse(server_timestamp=time.time(), revision=size, pull_items=items)
+
+        # 1. 原有路径: response_model 校验 + JSON 序列化
+        pydantic_body = fastapi_json(build())
+        pydantic_enc = timed(lambda: fastapi_json(build()))
+        pydantic_dec = timed(lambda: json.loads(pydantic_body))
+
+        # 2. 跳过 response_model 校验，model_dump 后直接 json.dumps
+        json_body = json.dumps(build().model_dump(), separators=(",", ":")).encode("utf-8")
+        json_enc = timed(lambda: json.dumps(build().model_dump(), separators=(",", ":")))
+        json_dec = timed(lambda: json.loads(json_body))
+
+        # 3. msgpack 路径 (与 _respond 相同)，密文以原始字节传输，解码时还原为 token
+        packed = wire.pack(_to_wire(build().model_dump()))
+        msgpack_enc = timed(lambda: wire.pack(_to_wire(build().model_dump())))
+        msgpack_dec = timed(lambda: wire.unpack(packed))
+
+        for name, enc, dec, body in (
+            ("json+pydantic", pydantic_enc, pydantic_dec, pydantic_body),
+            ("json", json_enc, json_dec, json_body),
+            ("msgpack", msgpack_enc, msgpack_dec, packed),
+        ):
+            print(f"{size:>7} {name:<14} {enc * 1000:>11.1f} {dec * 1000:>11.1f} {len(body):>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+# benchmarks/common.py
+# 基准测试公共工具: 在临时 SQLite 上启动服务端 (进程内 TestClient)，并注册测试用户
+import math
+import os
+import sys
+import time
+import uuid
+import tempfile
+import statistics
+from contextlib import contextmanager
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+
+@contextmanager
+def server_client(db_url: str | None = None):
+    """
+    启动进程内服务端。必须在导入 src.server 之前设置 DATABASE_URL，
+    因为配置在导入时即被读取并缓存。
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = db_url or f"sqlite:///{tmp}/bench.db"
+        # 基准测试从同一 IP 高频请求，关闭限流
+        os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+        from fastapi.testclient import TestClient  # 需要 httpx
+        from src.server.main import app
+        with TestClient(app) as client:
+            yield client
+
+
+def register_user(client, username: str | None = None, password: str = "bench-password") -> dict:
+    username = username or f"bench_{uuid.uuid4().hex[:8]}"
+    client.post("/auth/register", json={"username": username, "password": password, "kdf_salt": "c2FsdA=="})
+    resp = client.post("/auth/token", data={"username": username, "password": password})
+    resp.raise_for_status()
+    return {"Authorization": f"Bearer {resp.json()['access_token']}"}
+
+
+def fake_items(n: int, note_size: int = 200) -> list[dict]:
+    blob = "g" * note_size
+    return [{"id": str(uuid.uuid4()), "encrypted_data": blob, "is_deleted": False} for _ in range(n)]
+
+
+def timed(fn, repeat: int = 3) -> float:
+    """返回多次执行的中位耗时 (秒)"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def percentile(sorted_samples: list, q: float) -> float:
+    """已排序样本的 q 分位数 (最近秩)，q 取 0~100"""
+    if not sorted_samples:
+        return 0.0
+    index = max(0, min(len(sorted_samples) - 1, math.ceil(q / 100 * len(sorted_samples)) - 1))
+    return sorted_samples[index]
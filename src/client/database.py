@@ -1,7 +1,12 @@
-from typing import Optional, List
+import uuid
+from typing import Optional, List, Dict, Iterable
 from datetime import datetime
-from sqlmodel import SQLModel, Field, Session, create_engine, select
+from sqlalchemy import bindparam, delete, insert, update
+from sqlmodel import SQLModel, Field, Session, create_engine, select, col
 from pathlib import Path
+from src.core.crypto import content_hash
+from src.core.schema import add_missing_columns
+from src.core import digest
 
 # --- 1. 本地数据模型 ---
 
@@ -10,7 +15,10 @@ class ClientConfig(SQLModel, table=True):
     id: int = Field(default=1, primary_key=True)
     kdf_salt: Optional[str] = None 
     validation_token: Optional[str] = None
-    last_sync_timestamp: float = 0.0
+    # 已完整同步到的服务端 revision，下次只拉取此后的变更
+    last_sync_revision: int = 0
+    # 本设备在服务端的标识，用于确认同步游标
+    device_id: Optional[str] = None
 
 class LocalVaultItem(SQLModel, table=True):
     __table_args__ = {"extend_existing": True}
@@ -19,8 +27,19 @@ class LocalVaultItem(SQLModel, table=True):
     is_deleted: bool = Field(default=False)
     is_dirty: bool = Field(default=False)
     updated_at: float = Field(default_factory=lambda: datetime.now().timestamp())
+    # 最后一次与服务端一致时该条目的 revision，0 表示从未同步
+    revision: int = Field(default=0)
+    # 最后一次与服务端一致时该条目的服务端版本号，推送时作为 base_version
+    version: int = Field(default=0)
     
     owner: Optional[str] = Field(default=None)
+
+class LocalVaultDigest(SQLModel, table=True):
+    # 与服务端结构相同的摘要树，prefix 为空串的是根节点
+    __table_args__ = {"extend_existing": True}
+    prefix: str = Field(primary_key=True)
+    digest: str
+    item_count: int = Field(default=0)
     
 # --- 数据库管理 ---
 
@@ -39,11 +58,17 @@ class DatabaseManager:
     def init_db(self):
         if not self.engine: raise ValueError("DB not connected")
         SQLModel.metadata.create_all(self.engine)
+        add_missing_columns(self.engine, SQLModel.metadata)
         with Session(self.engine) as session:
             config = session.get(ClientConfig, 1)
             if not config:
                 session.add(ClientConfig(id=1))
                 session.commit()
+            # 旧版本的库没有摘要树，首次打开时补建
+            has_digest = session.exec(select(LocalVaultDigest).limit(1)).first() is not None
+            has_items = session.exec(select(LocalVaultItem.id).limit(1)).first() is not None
+        if has_items and not has_digest:
+            self.rebuild_digest()
 
     # --- 配置相关 ---
     def get_config(self) -> ClientConfig:
@@ -74,11 +99,19 @@ class DatabaseManager:
             session.refresh(config)
             return config
 
+    def get_device_id(self) -> str:
+        """本设备的标识，首次使用时生成并保存"""
+        config = self.get_config()
+        if not config.device_id:
+            config = self.update_config(device_id=uuid.uuid4().hex)
+        return config.device_id  # type: ignore
+
     # --- 密码 ---
-    def save_item(self, item_id: str, encrypted_data: str, is_deleted: bool = False, is_dirty: bool = True, owner: Optional[str] = None):
+    def save_item(self, item_id: str, encrypted_data: str, is_deleted: bool = False, is_dirty: bool = True, owner: Optional[str] = None, revision: Optional[int] = None, version: Optional[int] = None):
         if not self.engine: raise ValueError("DB not connected")
         with Session(self.engine) as session:
             item = session.get(LocalVaultItem, item_id)
+            old_entry = digest.entry_digest(item.id, content_hash(item.encrypted_data), item.is_deleted) if item else None
             if not item:
                 item = LocalVaultItem(
                     id=item_id, 
@@ -93,9 +126,43 @@ class DatabaseManager:
                 item.is_dirty = is_dirty
                 if owner is not None:
                     item.owner = owner
+            if revision is not None:
+                item.revision = revision
+            if version is not None:
+                item.version = version
             
             item.updated_at = datetime.now().timestamp()
             session.add(item)
+            new_entry = digest.entry_digest(item.id, content_hash(encrypted_data), is_deleted)
+            self._apply_digest_delta(session, item_id, old_entry, new_entry)
+            session.commit()
+
+    def save_remote_items(self, items: List[dict], owner: Optional[str] = None):
+        """批量写入从云端拉取的条目 (已同步状态)，一个事务内完成并增量更新摘要树"""
+        if not self.engine: raise ValueError("DB not connected")
+        now = datetime.now().timestamp()
+        with Session(self.engine) as session:
+            existing: Dict[str, LocalVaultItem] = {}
+            ids = [remote["id"] for remote in items]
+            for i in range(0, len(ids), 500):
+                statement = select(LocalVaultItem).where(col(LocalVaultItem.id).in_(ids[i:i + 500]))
+                existing.update((item.id, item) for item in session.exec(statement).all())
+            for remote in items:
+                item = existing.get(remote["id"])
+                old_entry = digest.entry_digest(item.id, content_hash(item.encrypted_data), item.is_deleted) if item else None
+                if item is None:
+                    item = existing[remote["id"]] = LocalVaultItem(id=remote["id"], encrypted_data=remote["encrypted_data"])
+                item.encrypted_data = remote["encrypted_data"]
+                item.is_deleted = remote["is_deleted"]
+                item.is_dirty = False
+                item.revision = remote.get("revision", 0)
+                item.version = remote.get("version", 0)
+                item.updated_at = now
+                if owner is not None:
+                    item.owner = owner
+                session.add(item)
+                new_entry = digest.entry_digest(item.id, content_hash(item.encrypted_data), item.is_deleted)
+                self._apply_digest_delta(session, item.id, old_entry, new_entry)
             session.commit()
 
     def get_item(self, item_id: str) -> Optional[LocalVaultItem]:
@@ -111,23 +178,187 @@ class DatabaseManager:
                 statement = statement.where(LocalVaultItem.is_deleted == False)
             return list(session.exec(statement).all())
 
+    def is_empty(self) -> bool:
+        """本地没有任何条目 (包括删除标记)"""
+        if not self.engine: raise ValueError("DB not connected")
+        with Session(self.engine) as session:
+            return session.exec(select(LocalVaultItem.id).limit(1)).first() is None
+
     def get_dirty_items(self) -> List[LocalVaultItem]:
         if not self.engine: raise ValueError("DB not connected")
         with Session(self.engine) as session:
             statement = select(LocalVaultItem).where(LocalVaultItem.is_dirty == True)
             return list(session.exec(statement).all())
 
-    def mark_synced(self, item_ids: List[str], sync_time: Optional[float] = None, owner: Optional[str] = None):
+    def get_items_by_ids(self, item_ids: List[str]) -> List[LocalVaultItem]:
+        if not self.engine: raise ValueError("DB not connected")
+        items: List[LocalVaultItem] = []
+        with Session(self.engine) as session:
+            for i in range(0, len(item_ids), 500):
+                statement = select(LocalVaultItem).where(col(LocalVaultItem.id).in_(item_ids[i:i + 500]))
+                items.extend(session.exec(statement).all())
+        return items
+
+    def get_items_by_prefixes(self, prefixes: List[str]) -> List[LocalVaultItem]:
+        """取出 ID 以指定前缀开头的条目 (摘要树叶子桶)"""
+        if not self.engine: raise ValueError("DB not connected")
+        items: List[LocalVaultItem] = []
+        with Session(self.engine) as session:
+            for prefix in prefixes:
+                statement = select(LocalVaultItem).where(
+                    col(LocalVaultItem.id) >= prefix,
+                    col(LocalVaultItem.id) < digest.prefix_upper_bound(prefix)
+                )
+                items.extend(i for i in session.exec(statement).all() if i.id.startswith(prefix))
+        return items
+
+    # --- 摘要树 ---
+    def _apply_digest_delta(self, session: Session, item_id: str, old_entry: Optional[int], new_entry: Optional[int]):
+        # 本地只有一个写入者，按异或增量更新路径上的节点即可；new_entry 为 None 表示条目被删除
+        delta = (new_entry or 0) ^ (old_entry or 0)
+        count_delta = (new_entry is not None) - (old_entry is not None)
+        if delta == 0 and count_delta == 0:
+            return
+        for prefix in digest.node_prefixes(item_id):
+            node = session.get(LocalVaultDigest, prefix)
+            if node is None:
+                node = LocalVaultDigest(prefix=prefix, digest=digest.to_hex(0))
+            node.digest = digest.to_hex(digest.from_hex(node.digest) ^ delta)
+            node.item_count += count_delta
+            session.add(node)
+
+    def rebuild_digest(self):
+        if not self.engine: raise ValueError("DB not connected")
+        with Session(self.engine) as session:
+            self._rebuild_digest(session)
+            session.commit()
+
+    def _rebuild_digest(self, session: Session):
+        nodes: dict = {}
+        rows = session.exec(select(LocalVaultItem.id, LocalVaultItem.encrypted_data, LocalVaultItem.is_deleted)).all()
+        for item_id, encrypted_data, is_deleted in rows:
+            entry = digest.entry_digest(item_id, content_hash(encrypted_data), is_deleted)
+            for prefix in digest.node_prefixes(item_id):
+                value, count = nodes.get(prefix, (0, 0))
+                nodes[prefix] = (value ^ entry, count + 1)
+        session.exec(delete(LocalVaultDigest))  # type: ignore
+        if nodes:
+            session.execute(insert(LocalVaultDigest), [
+                {"prefix": prefix, "digest": digest.to_hex(value), "item_count": count}
+                for prefix, (value, count) in nodes.items()
+            ])
+
+    def ingest_snapshot(self, items: Iterable[dict], owner: Optional[str] = None, batch_size: int = 5000) -> int:
+        """
+        新设备导入云端快照: 所有条目与重建的摘要树在同一个事务中写入，返回导入条数。
+        同 ID 的本地条目被覆盖 (调用方只在本地没有已同步数据时使用)
+        """
+        if not self.engine: raise ValueError("DB not connected")
+        statement = insert(LocalVaultItem).prefix_with("OR REPLACE")
+        count = 0
+        batch: List[dict] = []
+        with Session(self.engine) as session:
+            for item in items:
+                batch.append({
+                    "id": item["id"],
+                    "encrypted_data": item["encrypted_data"],
+                    "is_deleted": item["is_deleted"],
+                    "is_dirty": False,
+                    "updated_at": item["updated_at"],
+                    "revision": item.get("revision", 0),
+                    "version": item.get("version", 0),
+                    "owner": owner,
+                })
+                if len(batch) >= batch_size:
+                    session.execute(statement, batch)
+                    count += len(batch)
+                    batch = []
+            if batch:
+                session.execute(statement, batch)
+                count += len(batch)
+            self._rebuild_digest(session)
+            session.commit()
+        return count
+
+    def get_digest_nodes(self, prefixes: List[str]) -> dict:
+        """返回 {prefix: digest}，不存在的节点视为空桶"""
+        if not self.engine: raise ValueError("DB not connected")
+        with Session(self.engine) as session:
+            statement = select(LocalVaultDigest).where(col(LocalVaultDigest.prefix).in_(prefixes))
+            return {n.prefix: n.digest for n in session.exec(statement).all()}
+
+    def get_digest_children(self, prefixes: List[str]) -> dict:
+        if not self.engine: raise ValueError("DB not connected")
+        wanted = set(prefixes)
+        with Session(self.engine) as session:
+            nodes = session.exec(select(LocalVaultDigest)).all()
+            return {n.prefix: n.digest for n in nodes if n.prefix and n.prefix[:-1] in wanted}
+
+    def mark_synced(self, item_ids: List[str], sync_time: Optional[float] = None, owner: Optional[str] = None, revision: Optional[int] = None, versions: Optional[Dict[str, int]] = None):
+        """推送成功的条目: 每 500 个一条 UPDATE 写入共同的字段，各自的新版本号按主键批量更新"""
+        if not self.engine: raise ValueError("DB not connected")
+        values: dict = {"is_dirty": False}
+        if sync_time:
+            values["updated_at"] = sync_time
+        if owner:
+            values["owner"] = owner
+        if revision is not None:
+            values["revision"] = revision
+        with Session(self.engine) as session:
+            for i in range(0, len(item_ids), 500):
+                session.exec(  # type: ignore
+                    update(LocalVaultItem).where(col(LocalVaultItem.id).in_(item_ids[i:i + 500])).values(**values)
+                )
+            if versions:
+                # Core 的 executemany: 一条预编译语句按主键逐行更新，本地不存在的 ID 只是不命中
+                table = LocalVaultItem.__table__  # type: ignore
+                statement = update(table).where(table.c.id == bindparam("pid")).values(version=bindparam("new_version"))
+                session.connection().execute(statement, [
+                    {"pid": pid, "new_version": versions[pid]} for pid in item_ids if pid in versions
+                ])
+            session.commit()
+
+    def purge_items(self, item_ids: List[str]):
+        """彻底删除条目 (云端已压缩掉的删除)，同步更新摘要树"""
         if not self.engine: raise ValueError("DB not connected")
         with Session(self.engine) as session:
             for pid in item_ids:
+                item = session.get(LocalVaultItem, pid)
+                if item is None:
+                    continue
+                old_entry = digest.entry_digest(item.id, content_hash(item.encrypted_data), item.is_deleted)
+                session.delete(item)
+                self._apply_digest_delta(session, pid, old_entry, None)
+            session.commit()
+
+    def purge_tombstones(self, max_revision: int) -> int:
+        """清理已同步、revision 不大于 max_revision 的删除标记 (云端已压缩)，返回清理数量"""
+        if not self.engine: raise ValueError("DB not connected")
+        if max_revision <= 0:
+            return 0
+        with Session(self.engine) as session:
+            ids = list(session.exec(
+                select(LocalVaultItem.id).where(
+                    LocalVaultItem.is_deleted == True,
+                    LocalVaultItem.is_dirty == False,
+                    LocalVaultItem.revision > 0,
+                    LocalVaultItem.revision <= max_revision,
+                )
+            ).all())
+        if ids:
+            self.purge_items(ids)
+        return len(ids)
+
+    def apply_remote_meta(self, rows: Dict[str, dict]):
+        """内容已与云端一致的条目: 记录云端的 revision/version 并清除脏标记"""
+        if not self.engine: raise ValueError("DB not connected")
+        with Session(self.engine) as session:
+            for pid, row in rows.items():
                 item = session.get(LocalVaultItem, pid)
                 if item:
+                    item.revision = row.get("revision", item.revision)
+                    item.version = row.get("version", item.version)
                     item.is_dirty = False
-                    if sync_time:
-                        item.updated_at = sync_time
-                    if owner:
-                        item.owner = owner
                     session.add(item)
             session.commit()
     
@@ -1,11 +1,59 @@
 # sandbox/client/sync_service.py
+import io
+import json
+import os
+import threading
+from collections import OrderedDict
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from enum import Enum
-from typing import List, Optional
+from typing import Dict, Iterator, List, Optional, Tuple
+from src.core import compression, tracing, wire
+from src.core.crypto import content_hash
+from src.core.digest import EMPTY_DIGEST, to_hex
 from src.client.database import db, LocalVaultItem
 from src.client.state import state
 from src.client.profile_manager import Profile
 
+# 每页拉取的条目数，服务端上限为 5000
+PULL_PAGE_SIZE = 500
+# 请求体小于该字节数时不压缩
+COMPRESS_THRESHOLD = 4096
+# 服务端限流 (429) 或繁忙 (503) 时按 Retry-After 等待后重试的次数，这两种响应都表示请求未被处理
+RETRY_ON_BUSY = 3
+# 变更通知长连接: 服务端每 25 秒发一次心跳，超过这个时间没有任何数据视为断线
+STREAM_READ_TIMEOUT = 60
+# 断线后重连前的等待秒数
+STREAM_RECONNECT_DELAY = 5
+# 流式拉取时每写入一次本地库的条目数
+STREAM_WRITE_BATCH = 1000
+# 流式取回密文时每个请求携带的 ID 数 (响应逐行读取，不受此影响)
+STREAM_FETCH_IDS = 20000
+# 快照下载中断后续传的次数
+SNAPSHOT_RETRIES = 3
+SNAPSHOT_CHUNK_SIZE = 256 * 1024
+# 条件请求缓存的响应数 (按 URL 和参数)，revision 未变化时服务端返回 304，直接复用缓存的响应
+ETAG_CACHE_SIZE = 32
+# 设置该环境变量时把同步过程的 span 写入对应的 JSONL 文件 (python -m src.core.tracing 查看)
+TRACE_ENV = "VAULT_TRACE_FILE"
+
+if os.environ.get(TRACE_ENV):
+    tracing.configure(os.environ[TRACE_ENV], "client")
+
+def _to_wire(payload: dict) -> dict:
+    # 推送条目的密文以原始字节发送
+    items = payload.get("push_items")
+    if not items:
+        return payload
+    return {**payload, "push_items": wire.items_to_wire(items)}
+
+class HistoryCompacted(Exception):
+    """服务端已压缩掉本地游标之后需要的变更日志，只能改走全量比对"""
+    def __init__(self, compacted_revision: int):
+        super().__init__(f"history compacted up to revision {compacted_revision}")
+        self.compacted_revision = compacted_revision
+
 class SyncStatus(Enum):
     SYNCED = "已同步"
     LOCAL_NEW = "本地新增"
@@ -22,132 +70,586 @@ class SyncDiffItem:
         self.remote_item = remote_item
         self.action = "SKIP"
 
+class _TracingAdapter(HTTPAdapter):
+    """每个 HTTP 请求一个 span，并在请求头中带上 traceparent 让服务端接续同一条链路"""
+
+    def send(self, request, *args, **kwargs):
+        if not tracing.enabled():
+            return super().send(request, *args, **kwargs)
+        path = (request.path_url or "").split("?", 1)[0]
+        with tracing.span(f"http {request.method} {path}") as span:
+            tracing.inject(request.headers)
+            resp = super().send(request, *args, **kwargs)
+            # 流式响应在收到响应头时返回，读取响应体的时间记在调用方的 span 里
+            span.set(status=resp.status_code, bytes=resp.headers.get("Content-Length"),
+                     server_trace=resp.headers.get("X-Trace-Id"))
+            return resp
+
+
 class SyncService:
     def __init__(self, profile: Profile):
         self.profile = profile
         if not self.profile.server_url or not state.token:
             raise ValueError("未登录或无服务器配置")
+        # 复用 TCP/TLS 连接，分页拉取时不必每页重新握手
+        self.http = requests.Session()
+        retry = Retry(
+            total=RETRY_ON_BUSY, connect=0, read=0, status_forcelist=[429, 503],
+            allowed_methods=None, respect_retry_after_header=True, raise_on_status=False,
+        )
+        self.http.mount("http://", _TracingAdapter(max_retries=retry))
+        self.http.mount("https://", _TracingAdapter(max_retries=retry))
+        # 响应压缩由 requests 按其能解码的编码自动协商；
+        # 请求体压缩要等服务端在响应的 Accept-Encoding 中声明支持后才启用
+        self.server_encodings: List[str] = []
+        self.http.hooks["response"].append(self._remember_encodings)
+        # 安装了 msgpack 时优先请求二进制格式，服务端不支持时仍返回 JSON；
+        # 收到过 msgpack 响应后请求体也改用 msgpack 发送
+        self.server_msgpack = False
+        if wire.MSGPACK_AVAILABLE:
+            self.http.headers["Accept"] = f"{wire.MSGPACK_MEDIA_TYPE}, application/json;q=0.9"
+        # check_diff 时服务端的 revision，execute_sync 完成后据此推进本地游标
+        self.observed_revision = 0
+        # 上次 check_diff 的结果还没有被 execute_sync 用过: 只有这时才能把游标推进到 observed_revision，
+        # 之后处理冲突等单独的 execute_sync 不代表已处理完这次比对的全部差异
+        self.cursor_pending = False
+        # 服务端的压缩位置: 不大于它的删除标记已被清理
+        self.compacted_revision = 0
+        # 最近一次成功向服务端确认的游标
+        self.acked_revision = 0
+        # (url, 参数) -> (ETag, 解码后的响应)
+        self._etag_cache: "OrderedDict[tuple, Tuple[str, dict]]" = OrderedDict()
+        # 一次同步 (check_diff + execute_sync) 共用一个 trace_id，追踪文件中显示为一棵调用树
+        self.trace_id: Optional[str] = None
+
+    def _remember_encodings(self, resp, *args, **kwargs):
+        advertised = resp.headers.get("Accept-Encoding")
+        if advertised:
+            self.server_encodings = compression.parse_encodings(advertised)
+
+    def _decode(self, resp: requests.Response):
+        if wire.is_msgpack(resp.headers.get("Content-Type")):
+            self.server_msgpack = True
+            return wire.unpack(resp.content)
+        return resp.json()
+
+    def _get(self, url: str, params: dict, timeout: float, tag: str) -> dict:
+        """GET 并解码响应。带上该 URL 上次的 ETag，服务端返回 304 时复用上次的结果"""
+        headers = {"Authorization": f"Bearer {state.token}"}
+        key = (url, tuple(sorted(params.items())))
+        cached = self._etag_cache.get(key)
+        if cached is not None:
+            headers["If-None-Match"] = cached[0]
+        resp = self.http.get(url, params=params, headers=headers, timeout=timeout)
+        if resp.status_code == 304 and cached is not None:
+            self._etag_cache.move_to_end(key)
+            return cached[1]
+        if resp.status_code == 410:
+            raise HistoryCompacted(resp.json().get("compacted_revision", 0))
+        if resp.status_code != 200:
+            print(f"[{tag}] Error {resp.status_code}: {resp.text}")
+            raise Exception(f"服务器返回错误: {resp.status_code}")
+
+        data = self._decode(resp)
+        etag = resp.headers.get("ETag")
+        if etag:
+            self._etag_cache[key] = (etag, data)
+            self._etag_cache.move_to_end(key)
+            while len(self._etag_cache) > ETAG_CACHE_SIZE:
+                self._etag_cache.popitem(last=False)
+        return data
+
+    def _post_json(self, url: str, payload: dict, headers: dict, timeout: float, stream: bool = False) -> requests.Response:
+        with tracing.span("encode") as span:
+            if self.server_msgpack:
+                body = wire.pack(_to_wire(payload))
+                headers = {**headers, "Content-Type": wire.MSGPACK_MEDIA_TYPE}
+            else:
+                body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+                headers = {**headers, "Content-Type": "application/json"}
+            encoding = next((e for e in compression.SUPPORTED_ENCODINGS if e in self.server_encodings), None)
+            if encoding and len(body) >= COMPRESS_THRESHOLD:
+                body = compression.compress(body, encoding)
+                headers["Content-Encoding"] = encoding
+            span.set(bytes=len(body))
+        return self.http.post(url, data=body, headers=headers, timeout=timeout, stream=stream)
+
+    def _post_stream(self, url: str, payload: dict, list_key: str, timeout: float) -> Iterator[Tuple[dict, List[dict]]]:
+        """
+        POST 并请求 NDJSON 流式响应，逐批产出 (响应头部, 至多 STREAM_WRITE_BATCH 个条目)，
+        调用方边读边写本地库，内存占用与条目总数无关。服务端不支持流式时退回普通响应，整体作为一批
+        """
+        headers = {"Authorization": f"Bearer {state.token}", "Accept": f"{wire.NDJSON_MEDIA_TYPE}, application/json;q=0.5"}
+        with self._post_json(url, payload, headers, timeout=timeout, stream=True) as resp:
+            if resp.status_code != 200:
+                raise Exception(f"下载失败 {resp.status_code}: {resp.text}")
+            if not resp.headers.get("Content-Type", "").startswith(wire.NDJSON_MEDIA_TYPE):
+                data = self._decode(resp)
+                yield data, data.get(list_key, [])
+                return
+            lines = resp.iter_lines(chunk_size=64 * 1024)
+            header = json.loads(next(lines))
+            fields = header.pop("fields")
+            batch: List[dict] = []
+            for line in lines:
+                if not line:
+                    continue
+                row = json.loads(line)
+                if isinstance(row, dict):
+                    # 结束行 (没有条目时也产出一次头部)。先读到响应末尾 (分块编码的结束块)，
+                    # 否则关闭响应时连接被断开而不是放回连接池，下一个请求要重新握手
+                    for _ in lines:
+                        pass
+                    yield header, batch
+                    return
+                batch.append(dict(zip(fields, row)))
+                if len(batch) >= STREAM_WRITE_BATCH:
+                    yield header, batch
+                    batch = []
+        # 连接在结束行之前断开: 已写入的条目都是云端的真实内容，但不能推进同步游标
+        raise Exception("流式响应不完整")
+
+    def pull_items(self, ids: List[str], owner: Optional[str] = None) -> int:
+        """按 ID 流式取回密文并分批写入本地库，返回写入条数"""
+        server_url = self.profile.server_url or ""
+        count = 0
+        with tracing.span("pull_items", ids=len(ids)):
+            for i in range(0, len(ids), STREAM_FETCH_IDS):
+                for _, batch in self._post_stream(
+                    f"{server_url.rstrip('/')}/api/v1/items", {"ids": ids[i:i + STREAM_FETCH_IDS]}, "items", timeout=30
+                ):
+                    with tracing.span("db.save_remote_items", items=len(batch)):
+                        db.save_remote_items(batch, owner=owner)
+                    count += len(batch)
+        return count
+
+    def _post_digest(self, prefixes: List[str]) -> dict:
+        server_url = self.profile.server_url or ""
+        headers = {"Authorization": f"Bearer {state.token}"}
+        resp = self._post_json(
+            f"{server_url.rstrip('/')}/api/v1/digest",
+            {"prefixes": prefixes}, headers, timeout=10
+        )
+        if resp.status_code != 200:
+            print(f"[Digest] Error {resp.status_code}: {resp.text}")
+            raise Exception(f"服务器返回错误: {resp.status_code}")
+        return self._decode(resp)
+
+    def fetch_changes(self, since: int) -> Tuple[Dict[str, dict], int]:
+        """
+        读取 revision > since 的全部变更，返回 ({id: 最新变更}, 已完整读到的 revision)。
+        同一条目多次变更时以 revision 最大的一条为准。
+        """
+        server_url = self.profile.server_url or ""
+        api_url = f"{server_url.rstrip('/')}/api/v1/changes"
+        changes: Dict[str, dict] = {}
+        revision = since
+        cursor: Optional[int] = None
+        while True:
+            params = {"since": since, "limit": PULL_PAGE_SIZE}
+            if cursor is not None:
+                params["cursor"] = cursor
+            page = self._get(api_url, params, timeout=10, tag="Changes")
+            revision = max(revision, page["revision"])
+            self.compacted_revision = page.get("compacted_revision", 0)
+            fields = page["fields"]
+            for row in page["items"]:
+                change = dict(zip(fields, row))
+                changes[change["id"]] = change
+                revision = max(revision, change["revision"])
+            cursor = page.get("next_cursor")
+            if cursor is None:
+                break
+        return changes, revision
+
+    def download_snapshot(self, path: str) -> Tuple[int, str]:
+        """
+        下载云端快照到 path，返回 (快照 revision, 压缩编码)。
+        中断后带 Range/If-Range 从已下载的位置续传；期间快照被重建时服务端返回完整的新快照。
+        """
+        server_url = self.profile.server_url or ""
+        api_url = f"{server_url.rstrip('/')}/api/v1/snapshot"
+        etag: Optional[str] = None
+        for attempt in range(SNAPSHOT_RETRIES + 1):
+            headers = {"Authorization": f"Bearer {state.token}"}
+            offset = os.path.getsize(path) if etag and os.path.exists(path) else 0
+            if offset:
+                headers["Range"] = f"bytes={offset}-"
+                headers["If-Range"] = etag  # type: ignore
+            try:
+                with self.http.get(api_url, headers=headers, stream=True, timeout=(10, 60)) as resp:
+                    if resp.status_code not in (200, 206):
+                        raise Exception(f"快照下载失败 {resp.status_code}: {resp.text}")
+                    etag = resp.headers.get("ETag")
+                    revision = int(resp.headers["X-Snapshot-Revision"])
+                    encoding = "zstd" if resp.headers.get("Content-Type", "").startswith("application/zstd") else "gzip"
+                    with open(path, "ab" if resp.status_code == 206 else "wb") as f:
+                        for chunk in resp.iter_content(SNAPSHOT_CHUNK_SIZE):
+                            f.write(chunk)
+                    return revision, encoding
+            except requests.RequestException as e:
+                if attempt == SNAPSHOT_RETRIES:
+                    raise
+                print(f"[Snapshot] Download interrupted ({e}), resuming...")
+        raise Exception("快照下载失败")
+
+    def bootstrap(self) -> int:
+        """
+        新设备首次同步: 一次顺序下载快照并在一个事务中导入，再拉取快照之后的增量。
+        返回已同步到的 revision
+        """
+        server_url = self.profile.server_url or ""
+        path = f"{db.current_db_name}.snapshot"
+        try:
+            with tracing.span("snapshot.download") as span:
+                revision, encoding = self.download_snapshot(path)
+                span.set(revision=revision, bytes=os.path.getsize(path))
+            with tracing.span("db.ingest_snapshot") as span, \
+                    open(path, "rb") as raw, compression.open_decompressed(raw, encoding) as reader:
+                lines = io.TextIOWrapper(reader, encoding="utf-8")
+                fields = json.loads(next(lines))["fields"]
+                count = db.ingest_snapshot(
+                    (dict(zip(fields, json.loads(line))) for line in lines), owner=state.username
+                )
+                span.set(items=count)
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+        print(f"[Sync] Snapshot imported: {count} items at revision {revision}")
+
+        # 快照之后的增量
+        delta_revision = revision
+        for header, batch in self._post_stream(
+            f"{server_url.rstrip('/')}/api/v1/sync",
+            {"since_revision": revision, "push_items": []}, "pull_items", timeout=15
+        ):
+            delta_revision = header.get("revision", delta_revision)
+            with tracing.span("db.save_remote_items", items=len(batch)):
+                db.save_remote_items(batch, owner=state.username)
+        revision = max(revision, delta_revision)
+        db.update_config(last_sync_revision=revision)
+        # 向服务端确认游标由随后的 execute_sync 完成
+        self.observed_revision = revision
+        return revision
+
+    def watch_changes(self, since: Optional[int] = None, stop: Optional[threading.Event] = None) -> Iterator[int]:
+        """
+        订阅 /changes/stream，云端 revision 前进时产出新的 revision；
+        调用方据此用 fetch_changes 只拉取变更部分。断线后等待片刻自动重连，stop 被设置后结束。
+        """
+        server_url = self.profile.server_url or ""
+        api_url = f"{server_url.rstrip('/')}/api/v1/changes/stream"
+        stop = stop or threading.Event()
+        # 在后台线程中运行，使用独立的连接，不与界面线程共用 self.http
+        http = requests.Session()
+        try:
+            while not stop.is_set():
+                headers = {"Authorization": f"Bearer {state.token}", "Accept": "text/event-stream"}
+                params = {"since": since} if since is not None else {}
+                try:
+                    with http.get(api_url, params=params, headers=headers, stream=True,
+                                  timeout=(10, STREAM_READ_TIMEOUT)) as resp:
+                        if resp.status_code != 200:
+                            print(f"[Stream] Error {resp.status_code}: {resp.text}")
+                            if resp.status_code == 401:
+                                return
+                        else:
+                            for line in resp.iter_lines(decode_unicode=True):
+                                if stop.is_set():
+                                    return
+                                # 只关心 data 行，心跳 (以冒号开头) 和 id/event 行忽略
+                                if line and line.startswith("data:"):
+                                    revision = json.loads(line[5:])["revision"]
+                                    if since is None or revision > since:
+                                        since = revision
+                                        yield revision
+                except requests.RequestException as e:
+                    print(f"[Stream] Disconnected: {e}")
+                stop.wait(STREAM_RECONNECT_DELAY)
+        finally:
+            http.close()
+
+    def find_diverged_buckets(self) -> Tuple[List[str], Dict[str, dict], int]:
+        """
+        沿摘要树下探，只进入两端摘要不一致的分支。
+        返回 (不一致的叶子桶前缀, 这些桶内云端条目的元数据, 服务端 revision)；
+        两端一致时只需一次根节点比对。
+        """
+        empty = to_hex(EMPTY_DIGEST)
+        resp = self._post_digest([""])
+        revision = resp.get("revision", 0)
+        self.compacted_revision = resp.get("compacted_revision", 0)
+        remote_root = {n["prefix"]: n["digest"] for n in resp["nodes"]}.get("", empty)
+        local_root = db.get_digest_nodes([""]).get("", empty)
+        if remote_root == local_root:
+            return [], {}, revision
+
+        depth = resp["depth"]
+        prefixes = [""]
+        while True:
+            remote_children = {n["prefix"]: n["digest"] for n in resp["children"]}
+            local_children = db.get_digest_children(prefixes)
+            diverged = sorted(
+                p for p in set(remote_children) | set(local_children)
+                if remote_children.get(p, empty) != local_children.get(p, empty)
+            )
+            if not diverged:
+                return [], {}, revision
+            resp = self._post_digest(diverged)
+            if len(diverged[0]) >= depth:
+                fields = resp["fields"]
+                return diverged, {row[0]: dict(zip(fields, row)) for row in resp["items"]}, revision
+            prefixes = diverged
 
     def check_diff(self) -> List[SyncDiffItem]:
+        # 新的一次同步开始: execute_sync 沿用这里的 trace_id
+        self.trace_id = tracing.new_trace_id() if tracing.enabled() else None
+        with tracing.span("sync.check_diff", trace_id=self.trace_id) as span:
+            diff_list = self._check_diff()
+            span.set(diff=len(diff_list))
+        self.cursor_pending = True
+        return diff_list
+
+    def _check_diff(self) -> List[SyncDiffItem]:
         server_url = self.profile.server_url or ""
         if not server_url: return []
         
         current_user = state.username
         if not current_user:
             return []
-        # 获取本地数据
-        local_items_map = {item.id: item for item in db.get_all_items(include_deleted=True)}
-        
-        headers = {"Authorization": f"Bearer {state.token}"}
+
+        config = db.get_config()
+        full_scan = config.last_sync_revision <= 0
+        if full_scan and db.is_empty():
+            # 新设备: 本地没有任何数据，无需比对，直接导入云端快照
+            try:
+                with tracing.span("bootstrap"):
+                    self.bootstrap()
+                return []
+            except Exception as e:
+                print(f"[Sync] Snapshot bootstrap failed ({e}), falling back to full comparison")
         try:
-            api_url = f"{server_url.rstrip('/')}/api/v1/sync"
-            resp = requests.post(
-                api_url,
-                json={"last_sync_timestamp": 0, "push_items": []}, 
-                headers=headers, timeout=10
-            )
-            
-            if resp.status_code != 200:
-                print(f"[Check Diff] Error {resp.status_code}: {resp.text}")
-                raise Exception(f"服务器返回错误: {resp.status_code}")
-            
-            remote_items_list = resp.json()["pull_items"]
-            remote_items_map = {item["id"]: item for item in remote_items_list}
-            
+            if not full_scan:
+                # 增量: 云端自上次同步以来的变更 + 本地未同步的修改
+                try:
+                    with tracing.span("fetch_changes"):
+                        remote_items_map, revision = self.fetch_changes(config.last_sync_revision)
+                    with tracing.span("db.load_local", remote=len(remote_items_map)):
+                        local_items = db.get_dirty_items() + db.get_items_by_ids(list(remote_items_map))
+                except HistoryCompacted as e:
+                    # 离线太久，云端已清理了中间的变更日志
+                    print(f"[Sync] {e}, falling back to full comparison")
+                    full_scan = True
+            if full_scan:
+                # 首次同步: 沿摘要树找出不一致的桶
+                with tracing.span("find_diverged_buckets") as span:
+                    buckets, remote_items_map, revision = self.find_diverged_buckets()
+                    span.set(buckets=len(buckets))
+                with tracing.span("db.load_local", buckets=len(buckets)):
+                    local_items = db.get_items_by_prefixes(buckets) if buckets else []
+            local_items_map = {item.id: item for item in local_items}
         except Exception as e:
             print(f"Check diff failed: {e}")
             raise e
+        self.observed_revision = revision
+        compacted = self.compacted_revision
 
         diff_list = []
+        in_sync: Dict[str, dict] = {}
         all_ids = set(local_items_map.keys()) | set(remote_items_map.keys())
-        config = db.get_config()
 
-        for pid in all_ids:
-            local = local_items_map.get(pid)
-            remote = remote_items_map.get(pid)
+        with tracing.span("compare", items=len(all_ids)):
+            for pid in all_ids:
+                local = local_items_map.get(pid)
+                remote = remote_items_map.get(pid)
 
-            if local and local.owner and local.owner != current_user:
-                continue
+                if local and local.owner and local.owner != current_user:
+                    continue
             
-            if local and not remote:
-                diff_list.append(SyncDiffItem(pid, SyncStatus.LOCAL_NEW, local_item=local))
+                if local and not remote:
+                    # 已同步过的删除标记无需再上传
+                    if local.is_deleted and not local.is_dirty:
+                        continue
+                    # 全量比对时，同步过且早于压缩位置的条目在云端已不存在: 它在云端被删除，删除标记已被压缩
+                    if full_scan and not local.is_dirty and 0 < local.revision <= compacted:
+                        tombstone = {"id": pid, "is_deleted": True, "revision": compacted, "version": 0, "compacted": True}
+                        diff_list.append(SyncDiffItem(pid, SyncStatus.REMOTE_MODIFIED, local, tombstone))
+                        continue
+                    # 增量模式下云端没有变更记录的条目，按本地是否同步过区分新增与修改
+                    status = SyncStatus.LOCAL_NEW if local.revision == 0 else SyncStatus.LOCAL_MODIFIED
+                    diff_list.append(SyncDiffItem(pid, status, local_item=local))
             
-            elif remote and not local:
-                diff_list.append(SyncDiffItem(pid, SyncStatus.REMOTE_NEW, remote_item=remote))
+                elif remote and not local:
+                    diff_list.append(SyncDiffItem(pid, SyncStatus.REMOTE_NEW, remote_item=remote))
             
-            elif local and remote:
-                remote_ts = remote.get("updated_at", 0)
-                local_sync_ts = config.last_sync_timestamp
-                
-                if local.is_dirty:
-                    if remote_ts > local_sync_ts + 1.0:
-                        diff_list.append(SyncDiffItem(pid, SyncStatus.CONFLICT, local, remote))
-                    else:
-                        diff_list.append(SyncDiffItem(pid, SyncStatus.LOCAL_MODIFIED, local, remote))
-                elif remote_ts > local.updated_at:
-                    diff_list.append(SyncDiffItem(pid, SyncStatus.REMOTE_MODIFIED, local, remote))
-        
+                elif local and remote:
+                    # 密文一致即视为已同步，顺带记下云端的版本信息
+                    if remote.get("content_hash") == content_hash(local.encrypted_data) \
+                            and remote.get("is_deleted") == local.is_deleted:
+                        if local.is_dirty or local.version != remote.get("version", local.version):
+                            in_sync[pid] = remote
+                        continue
+
+                    # 云端 revision 比本地记录的新，说明上次同步之后云端被修改过
+                    remote_changed = remote.get("revision", 0) > local.revision
+                    if local.is_dirty:
+                        status = SyncStatus.CONFLICT if remote_changed else SyncStatus.LOCAL_MODIFIED
+                        diff_list.append(SyncDiffItem(pid, status, local, remote))
+                    elif remote_changed:
+                        diff_list.append(SyncDiffItem(pid, SyncStatus.REMOTE_MODIFIED, local, remote))
+
+        with tracing.span("db.apply_remote_meta", items=len(in_sync)):
+            if in_sync:
+                db.apply_remote_meta(in_sync)
+            # 云端已压缩的删除标记本地也不再保留
+            db.purge_tombstones(compacted)
+        # 游标的推进与确认统一在 execute_sync 中进行 (没有差异时调用方以空列表调用)
         return diff_list
 
-    def execute_sync(self, diff_items: List[SyncDiffItem]):
+    def ack_cursor(self, revision: int):
+        """向服务端确认本设备已同步到 revision，失败不影响同步结果。同一 revision 只确认一次"""
+        if revision == self.acked_revision:
+            return
+        server_url = self.profile.server_url or ""
+        headers = {"Authorization": f"Bearer {state.token}"}
+        try:
+            resp = self.http.put(
+                f"{server_url.rstrip('/')}/api/v1/devices/{db.get_device_id()}/cursor",
+                json={"revision": revision}, headers=headers, timeout=5
+            )
+            if resp.status_code != 200:
+                print(f"[Cursor] Ack failed {resp.status_code}")
+            else:
+                self.acked_revision = revision
+        except requests.RequestException as e:
+            print(f"[Cursor] Ack failed: {e}")
+
+    def _push(self, push_list: List[dict]) -> dict:
         server_url = self.profile.server_url or ""
-        if not server_url: return
+        headers = {"Authorization": f"Bearer {state.token}"}
+        # 只需要推送结果，拉取由 check_diff/execute_sync 单独完成
+        payload = {"pull": False, "push_items": push_list}
+        resp = self._post_json(
+            f"{server_url.rstrip('/')}/api/v1/sync",
+            payload, headers, timeout=15
+        )
+        if resp.status_code != 200:
+            raise Exception(f"上传失败 {resp.status_code}: {resp.text}")
+
+        resp_data = self._decode(resp)
+        succeeded_ids = resp_data.get("processed_ids", [p["id"] for p in push_list])
+        print(f"[Sync] Push Success. Requested: {len(push_list)}, Accepted: {len(succeeded_ids)}, Conflicts: {len(resp_data.get('conflicts', []))}")
+        with tracing.span("db.mark_synced", items=len(succeeded_ids)):
+            db.mark_synced(
+                succeeded_ids,
+                sync_time=resp_data["server_timestamp"],
+                owner=state.username or "unknown",
+                revision=resp_data.get("revision", 0),
+                versions=resp_data.get("versions", {})
+            )
+        return resp_data
+
+    def _conflict_items(self, resp_data: dict, local_map: Dict[str, LocalVaultItem]) -> List[SyncDiffItem]:
+        items = []
+        for c in resp_data.get("conflicts", []):
+            if c.get("version", 0) == 0:
+                # 云端已没有这一条 (删除标记已被压缩): 保留云端即本地彻底删除，保留本地则以版本 0 重新创建
+                c = {**c, "compacted": True}
+            items.append(SyncDiffItem(c["id"], SyncStatus.CONFLICT, local_map.get(c["id"]), c))
+        return items
+
+    def push_changes(self) -> List[SyncDiffItem]:
+        """
+        不做差异比对，直接以各条目的 base_version 推送全部本地修改。
+        版本不一致的条目由服务端拒绝，连同云端当前内容作为冲突返回。
+        由界面上的"直接上传"显式触发，不推进同步游标 (之后重新 check_diff + execute_sync 完成)
+        """
+        dirty = [i for i in db.get_dirty_items() if not i.owner or i.owner == state.username]
+        if not dirty:
+            return []
+        print(f"[Sync] Pushing {len(dirty)} local changes...")
+        with tracing.span("push", items=len(dirty)):
+            resp_data = self._push([
+                {"id": i.id, "encrypted_data": i.encrypted_data, "is_deleted": i.is_deleted, "base_version": i.version}
+                for i in dirty
+            ])
+        return self._conflict_items(resp_data, {i.id: i for i in dirty})
+
+    def execute_sync(self, diff_items: List[SyncDiffItem]) -> List[SyncDiffItem]:
+        """
+        执行同步，返回推送时被服务端拒绝的冲突条目。
+        全部差异处理完后推进本地游标并向服务端确认一次；diff_items 为空时只做这一步
+        """
+        with tracing.span("sync.execute", trace_id=self.trace_id, items=len(diff_items)):
+            conflicts = self._execute_sync(diff_items)
+        if self.trace_id is not None:
+            print(f"[Trace] {self.trace_id}")
+        return conflicts
+
+    def _execute_sync(self, diff_items: List[SyncDiffItem]) -> List[SyncDiffItem]:
+        server_url = self.profile.server_url or ""
+        if not server_url: return []
 
         current_username = state.username or "unknown"
+        observed_revision = self.observed_revision
         push_list = []
+        push_locals: Dict[str, LocalVaultItem] = {}
+        pull_ids = []
+        # 云端已删除且删除标记已被压缩的条目，接受云端结果即本地彻底删除
+        purge_ids = []
+        # 有云端变更被忽略时不推进游标，下次仍会看到它们
+        skipped_remote = False
         
         for item in diff_items:
-            # PULL: 远程 -> 本地
+            # PULL: 远程 -> 本地 (check_diff 只拿到元数据，密文稍后按需下载)
             if item.action == "PULL" and item.remote_item:
-                db.save_item(
-                    item_id=item.remote_item["id"],
-                    encrypted_data=item.remote_item["encrypted_data"],
-                    is_deleted=item.remote_item["is_deleted"],
-                    is_dirty=False,
-                    owner=current_username 
-                )
+                if item.remote_item.get("compacted"):
+                    purge_ids.append(item.id)
+                else:
+                    pull_ids.append(item.remote_item["id"])
             
             # PUSH
             elif (item.action == "PUSH" or item.action == "MERGE_USE_LOCAL") and item.local_item:
+                # 覆盖云端时以比对时看到的云端版本为基准，比对之后云端再被修改则会被拒绝
+                base_version = item.remote_item.get("version", 0) if item.remote_item else item.local_item.version
                 push_list.append({
                     "id": item.local_item.id,
                     "encrypted_data": item.local_item.encrypted_data,
-                    "is_deleted": item.local_item.is_deleted
+                    "is_deleted": item.local_item.is_deleted,
+                    "base_version": base_version
                 })
+                push_locals[item.local_item.id] = item.local_item
 
+            elif item.status in (SyncStatus.REMOTE_NEW, SyncStatus.REMOTE_MODIFIED, SyncStatus.CONFLICT):
+                skipped_remote = True
+
+        if pull_ids:
+            print(f"[Sync] Pulling {len(pull_ids)} items...")
+            self.pull_items(pull_ids, owner=current_username)
+
+        if purge_ids:
+            with tracing.span("db.purge_items", items=len(purge_ids)):
+                db.purge_items(purge_ids)
+
+        new_revision = observed_revision
+        conflicts: List[SyncDiffItem] = []
         if push_list:
             print(f"[Sync] Pushing {len(push_list)} items...")
-            
-            headers = {"Authorization": f"Bearer {state.token}"}
-            payload = {
-                "last_sync_timestamp": db.get_config().last_sync_timestamp,
-                "push_items": push_list
-            }
-            
             try:
-                resp = requests.post(
-                    f"{server_url.rstrip('/')}/api/v1/sync",
-                    json=payload, headers=headers, timeout=15
-                )
-                
-                if resp.status_code == 200:
-                    # print("[Sync] Push Success!")
-                    # server_ts = resp.json()["server_timestamp"]
-                    # pushed_ids = [p["id"] for p in push_list]
-                    
-                    # db.mark_synced(pushed_ids, sync_time=server_ts, owner=current_username)
-                    
-                    # db.update_config(last_sync_timestamp=server_ts)
-                    
-                    resp_data = resp.json()
-                    server_ts = resp_data["server_timestamp"]
-                    succeeded_ids = resp_data.get("processed_ids", [p["id"] for p in push_list])
-                    print(f"[Sync] Push Success. Requested: {len(push_list)}, Accepted: {len(succeeded_ids)}")
-                    db.mark_synced(succeeded_ids, sync_time=server_ts, owner=current_username)
-                    db.update_config(last_sync_timestamp=server_ts)
-                else:
-                    raise Exception(f"上传失败 {resp.status_code}: {resp.text}")
-                    
+                with tracing.span("push", items=len(push_list)):
+                    resp_data = self._push(push_list)
             except Exception as e:
                 print(f"[Sync Exception] {e}")
-                raise e
\ No newline at end of file
+                raise e
+
+            conflicts = self._conflict_items(resp_data, push_locals)
+            skipped_remote = skipped_remote or bool(conflicts)
+            # 推送期间没有其他设备提交时，可以直接跳到推送后的 revision
+            if resp_data.get("revision", 0) == observed_revision + 1:
+                new_revision = resp_data["revision"]
+
+        if not skipped_remote and self.cursor_pending:
+            db.update_config(last_sync_revision=new_revision)
+            self.ack_cursor(new_revision)
+        self.cursor_pending = False
+        return conflicts
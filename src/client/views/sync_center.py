@@ -1,5 +1,6 @@
 # sandbox/client/views/sync_center.py
 import flet as ft
+import threading
 from typing import cast
 from src.client.state import state
 from src.client.sync_service import SyncService, SyncStatus, SyncDiffItem
@@ -45,14 +46,34 @@ def SyncCenterView(page: ft.Page):
         render_list()
         page.open(ft.SnackBar(ft.Text(f"已批量设置 {count} 项为 {action_type}")))
 
+    # 其他设备提交了新的变更时提示刷新，不自动刷新以免打断正在进行的选择
+    refresh_btn = ft.TextButton("云端有新的变更，点击刷新", icon="refresh", visible=False,
+                                on_click=lambda e: load_diffs())
+    stop_watch = threading.Event()
+
+    def watch_remote():
+        try:
+            for revision in service.watch_changes(stop=stop_watch):
+                if revision > service.observed_revision and not refresh_btn.visible:
+                    refresh_btn.visible = True
+                    page.update()
+        except Exception as e:
+            print(f"[Stream] Watch stopped: {e}")
+
+    def go_back():
+        stop_watch.set()
+        page.go("/vault")
+
     batch_actions_row = ft.Row([
         ft.Text("批量操作:", weight=ft.FontWeight.BOLD),
         ft.TextButton("全部上传 (Local->Cloud)", on_click=lambda e: batch_set_action("PUSH")),
         ft.TextButton("全部下载 (Cloud->Local)", on_click=lambda e: batch_set_action("PULL")),
         ft.TextButton("全部忽略", on_click=lambda e: batch_set_action("SKIP")),
+        ft.TextButton("直接上传本地修改", icon="upload", on_click=lambda e: push_local()),
     ], visible=False) 
     
     def load_diffs():
+        refresh_btn.visible = False
         status_text.value = "正在连接服务器比对数据..."
         diff_list_col.controls.clear() # 清空列表
         page.update()
@@ -65,6 +86,8 @@ def SyncCenterView(page: ft.Page):
             render_list()
             
             if not diffs:
+                # 没有需要处理的差异，直接推进同步游标
+                service.execute_sync([])
                 status_text.value = "本地与云端数据一致，无需同步。"
                 status_text.color = "green"
                 batch_actions_row.visible = False
@@ -87,8 +110,11 @@ def SyncCenterView(page: ft.Page):
             target_data = ""
             if item.local_item:
                 target_data = item.local_item.encrypted_data
-            elif item.remote_item:
+            elif item.remote_item and "encrypted_data" in item.remote_item:
                 target_data = item.remote_item["encrypted_data"]
+            elif item.remote_item:
+                # 差异比对只下载元数据，云端新增条目在下载前无法解密标题
+                return f"云端条目 ({item.id[:8]}...)"
             else:
                 return "未知数据"
             p_item = state.crypto.decrypt_item(target_data)
@@ -149,14 +175,43 @@ def SyncCenterView(page: ft.Page):
         
         page.update()
 
+    def show_conflicts(conflicts: list[SyncDiffItem]):
+        # 推送时云端已被其他设备修改 (或已删除) 的条目，由用户逐条选择保留哪一端
+        diff_items.clear()
+        diff_items.extend(conflicts)
+        render_list()
+        status_text.value = f"{len(conflicts)} 项在云端已被修改，请重新选择："
+        status_text.color = "red"
+        page.open(ft.SnackBar(ft.Text("部分条目存在冲突")))
+
+    def push_local():
+        # 不逐条确认，按各条目的版本直接上传全部本地修改，云端期间被修改的条目作为冲突返回
+        action_btn.disabled = True
+        page.update()
+        try:
+            conflicts = service.push_changes()
+            if conflicts:
+                show_conflicts(conflicts)
+            else:
+                page.open(ft.SnackBar(ft.Text("本地修改已上传")))
+                load_diffs()
+        except Exception as e:
+            page.open(ft.SnackBar(ft.Text(f"上传错误: {e}")))
+        finally:
+            action_btn.disabled = False
+            page.update()
+
     def execute_sync():
         action_btn.disabled = True
         action_btn.text = "同步中..."
         page.update()
         try:
-            service.execute_sync(diff_items)
-            page.open(ft.SnackBar(ft.Text("同步执行完毕")))
-            load_diffs()
+            conflicts = service.execute_sync(diff_items)
+            if conflicts:
+                show_conflicts(conflicts)
+            else:
+                page.open(ft.SnackBar(ft.Text("同步执行完毕")))
+                load_diffs()
         except Exception as e:
             page.open(ft.SnackBar(ft.Text(f"同步错误: {e}")))
         finally:
@@ -165,6 +220,7 @@ def SyncCenterView(page: ft.Page):
             page.update()
 
     load_diffs()
+    threading.Thread(target=watch_remote, daemon=True).start()
 
     return ft.View(
         "/sync_center",
@@ -172,9 +228,10 @@ def SyncCenterView(page: ft.Page):
             ft.AppBar(
                 title=ft.Text("同步差异对比"),
                 bgcolor="surfaceVariant",
-                leading=ft.IconButton(icon="arrow_back", on_click=lambda _: page.go("/vault"))
+                leading=ft.IconButton(icon="arrow_back", on_click=lambda _: go_back())
             ),
             ft.Container(content=status_text, padding=10, bgcolor="blue50"),
+            refresh_btn,
             ft.Container(content=batch_actions_row, padding=5),
             diff_list_col,
             ft.Container(content=action_btn, padding=20, alignment=ft.alignment.center)
@@ -0,0 +1,101 @@
+# 客户端与服务端共用的 HTTP 内容压缩: 优先 zstd，不可用时退回 gzip
+import gzip
+import io
+import zlib
+from typing import Optional
+
+try:
+    import zstandard
+except ImportError:  # zstd 是可选依赖
+    zstandard = None
+
+ZSTD_AVAILABLE = zstandard is not None
+
+# 按优先级排列的可用编码
+SUPPORTED_ENCODINGS = ["zstd", "gzip"] if ZSTD_AVAILABLE else ["gzip"]
+
+# 解压后的请求体上限，防止压缩炸弹
+MAX_DECOMPRESSED_SIZE = 256 * 1024 * 1024
+
+
+def parse_encodings(header: Optional[str]) -> list:
+    """解析 Accept-Encoding，忽略 q=0 的编码"""
+    result = []
+    for part in (header or "").split(","):
+        name, _, params = part.strip().partition(";")
+        if not name:
+            continue
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0"):
+            continue
+        result.append(name.strip().lower())
+    return result
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    accepted = parse_encodings(accept_encoding)
+    for encoding in SUPPORTED_ENCODINGS:
+        if encoding in accepted:
+            return encoding
+    return None
+
+
+def compress(data: bytes, encoding: str, level: Optional[int] = None) -> bytes:
+    if encoding == "zstd" and zstandard is not None:
+        return zstandard.ZstdCompressor(level=level or 3).compress(data)
+    if encoding == "gzip":
+        co = zlib.compressobj(level or 6, zlib.DEFLATED, 31)
+        return co.compress(data) + co.flush()
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+def compressobj(encoding: str, level: Optional[int] = None):
+    """流式压缩器，flush() 输出当前已压缩的数据块，finish() 结束压缩流"""
+    return _StreamCompressor(encoding, level)
+
+
+def decompress(data: bytes, encoding: str, max_size: int = MAX_DECOMPRESSED_SIZE) -> bytes:
+    if encoding == "zstd" and zstandard is not None:
+        buf = bytearray()
+        with zstandard.ZstdDecompressor().stream_reader(io.BytesIO(data)) as reader:
+            while len(buf) <= max_size:
+                chunk = reader.read(max_size + 1 - len(buf))
+                if not chunk:
+                    break
+                buf += chunk
+        out = bytes(buf)
+    elif encoding == "gzip":
+        dobj = zlib.decompressobj(47)  # 自动识别 gzip/zlib 头
+        out = dobj.decompress(data, max_size + 1)
+    else:
+        raise ValueError(f"Unsupported encoding: {encoding}")
+    if len(out) > max_size:
+        raise ValueError("Decompressed body too large")
+    return out
+
+
+def open_decompressed(fileobj, encoding: str):
+    """以可读文件对象的方式流式解压 (用于快照等大文件)，不把整个内容读入内存"""
+    if encoding == "zstd" and zstandard is not None:
+        return zstandard.ZstdDecompressor().stream_reader(fileobj, read_across_frames=True)
+    if encoding == "gzip":
+        return gzip.GzipFile(fileobj=fileobj, mode="rb")
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+class _StreamCompressor:
+    def __init__(self, encoding: str, level: Optional[int] = None):
+        self.encoding = encoding
+        if encoding == "zstd" and zstandard is not None:
+            self._obj = zstandard.ZstdCompressor(level=level or 3).compressobj()
+        elif encoding == "gzip":
+            self._obj = zlib.compressobj(level or 6, zlib.DEFLATED, 31)
+        else:
+            raise ValueError(f"Unsupported encoding: {encoding}")
+
+    def flush(self, data: bytes) -> bytes:
+        if self.encoding == "zstd":
+            return self._obj.compress(data) + self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        return self._obj.compress(data) + self._obj.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._obj.flush()
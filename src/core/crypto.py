@@ -1,10 +1,15 @@
 import base64
+import hashlib
 import os
 from cryptography.fernet import Fernet, InvalidToken
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 from .models import PasswordItem
 
+def content_hash(encrypted_data: str) -> str:
+    """密文摘要，用于两端比对条目内容而不传输密文 (128 bit 足够检测变化)"""
+    return hashlib.sha256(encrypted_data.encode('utf-8')).hexdigest()[:32]
+
 class CryptoManager:
     def __init__(self):
         self._key: bytes | None = None
@@ -0,0 +1,47 @@
+# 客户端与服务端共用的保险库摘要树 (按条目 ID 前缀分桶)
+# 每个节点的摘要是其前缀下所有条目摘要的异或，
+# 因此父节点 = 子节点异或，单个条目变化只需增量更新路径上的节点。
+import hashlib
+from typing import Iterable, List
+
+# 树深度: 根 ("") -> 1 字符前缀 -> 2 字符前缀 (叶子桶)
+DIGEST_DEPTH = 2
+
+EMPTY_DIGEST = 0
+
+
+def entry_digest(item_id: str, content_hash: str | None, is_deleted: bool) -> int:
+    raw = f"{item_id}:{content_hash or ''}:{int(bool(is_deleted))}".encode("utf-8")
+    return int.from_bytes(hashlib.sha256(raw).digest()[:16], "big")
+
+
+def combine(digests: Iterable[int]) -> int:
+    result = EMPTY_DIGEST
+    for d in digests:
+        result ^= d
+    return result
+
+
+def to_hex(digest: int) -> str:
+    return f"{digest:032x}"
+
+
+def from_hex(digest: str | None) -> int:
+    return int(digest, 16) if digest else EMPTY_DIGEST
+
+
+def leaf_prefix(item_id: str) -> str:
+    return item_id[:DIGEST_DEPTH]
+
+
+def node_prefixes(item_id: str) -> List[str]:
+    """条目所在路径上的全部节点前缀，从根到叶子"""
+    return [item_id[:level] for level in range(DIGEST_DEPTH + 1)]
+
+
+def prefix_upper_bound(prefix: str) -> str:
+    """前缀区间的上界，用于 id >= prefix AND id < upper 的索引范围扫描"""
+    last = prefix[-1]
+    # UUID 只含 0-9a-f，'9' 之后直接跳到 'a'，避免在非 C 排序规则下落到标点字符上
+    nxt = "a" if last == "9" else chr(ord(last) + 1)
+    return prefix[:-1] + nxt
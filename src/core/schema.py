@@ -0,0 +1,22 @@
+# 轻量的表结构升级: create_all 不会修改已存在的表，这里补上新增的列和索引
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import MetaData
+
+
+def add_missing_columns(engine: Engine, metadata: MetaData):
+    inspector = inspect(engine)
+    tables = [t for t in metadata.sorted_tables if inspector.has_table(t.name)]
+    with engine.begin() as conn:
+        for table in tables:
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=engine.dialect)}"
+                if column.default is not None and column.default.is_scalar:
+                    ddl += f" DEFAULT {column.default.arg!r}"
+                conn.execute(text(ddl))
+    for table in tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
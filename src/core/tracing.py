@@ -0,0 +1,243 @@
+# 客户端与服务端共用的轻量级链路追踪
+# - span("名称", 属性=...) 是上下文管理器，嵌套关系通过 contextvars 传递 (asyncio 任务与线程池中都有效)
+# - 跨进程: 客户端在请求头 traceparent (W3C 格式) 中带上 trace_id 与当前 span_id，服务端据此接续
+# - 导出: 每个结束的 span 写成 JSONL 文件中的一行；未调用 configure() 时 span() 返回共享的空对象，几乎没有开销
+# 查看一次同步的耗时分布:
+#   python -m src.core.tracing client_trace.jsonl server_trace.jsonl [trace_id]
+import atexit
+import json
+import os
+import secrets
+import sys
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+TRACEPARENT = "traceparent"
+
+_current: ContextVar[Optional["Span"]] = ContextVar("vault_trace_span", default=None)
+
+
+class _Exporter:
+    def __init__(self, path: str, service: str):
+        self.service = service
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    def write(self, span: "Span", duration: float, flush: bool):
+        line = json.dumps({
+            "trace_id": span.trace_id,
+            "span_id": span.span_id,
+            "parent_id": span.parent_id,
+            "name": span.name,
+            "service": self.service,
+            "start": round(span.start, 6),
+            "duration_ms": round(duration * 1000, 3),
+            "attrs": span.attrs,
+        }, ensure_ascii=False, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            # 每个根 span 结束时落盘一次，而不是每个 span 都 flush
+            if flush:
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+
+_exporter: Optional[_Exporter] = None
+
+
+def configure(path: Optional[str], service: str):
+    """path 为空时关闭追踪"""
+    global _exporter
+    if _exporter is not None:
+        _exporter.close()
+    _exporter = _Exporter(path, service) if path else None
+
+
+def enabled() -> bool:
+    return _exporter is not None
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "attrs", "start", "_t0", "_token", "_remote")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attrs: dict, remote: bool = False):
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.attrs = attrs
+        self.start = time.time()
+        self._t0 = 0.0
+        self._token = None
+        # 父 span 在另一个进程中: 本进程内这是根 span
+        self._remote = remote
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self) -> "Span":
+        self._token = _current.set(self)
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self._t0
+        _current.reset(self._token)  # type: ignore
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        exporter = _exporter
+        if exporter is not None:
+            exporter.write(self, duration, flush=self.parent_id is None or self._remote)
+
+
+class _NoopSpan:
+    __slots__ = ()
+    trace_id = span_id = None
+
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return None
+
+
+_NOOP = _NoopSpan()
+
+
+def span(name: str, trace_id: Optional[str] = None, **attrs):
+    """
+    开始一个 span。在已有 span 内调用时成为其子 span；
+    否则是新的根 span，trace_id 可由调用方指定 (把多次调用归入同一条链路)
+    """
+    if _exporter is None:
+        return _NOOP
+    parent = _current.get()
+    if parent is not None:
+        return Span(name, parent.trace_id, parent.span_id, attrs)
+    return Span(name, trace_id or new_trace_id(), None, attrs)
+
+
+def new_trace_id() -> str:
+    return secrets.token_hex(16)
+
+
+def current() -> Optional[Span]:
+    return _current.get()
+
+
+class use:
+    """在另一个任务中继续某个 span (例如组提交的后台任务执行请求提交的写入)"""
+    __slots__ = ("span", "_token")
+
+    def __init__(self, span: Optional[Span]):
+        self.span = span
+        self._token = None
+
+    def __enter__(self):
+        if self.span is not None:
+            self._token = _current.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._token is not None:
+            _current.reset(self._token)
+
+
+def inject(headers: dict):
+    """在请求头中写入当前 span 的 traceparent"""
+    if _exporter is None:
+        return
+    parent = _current.get()
+    if parent is not None:
+        headers[TRACEPARENT] = f"00-{parent.trace_id}-{parent.span_id}-01"
+
+
+def remote_span(name: str, traceparent: Optional[str], **attrs):
+    """服务端: 按请求头中的 traceparent 接续客户端的链路，没有或格式错误时开始新的链路"""
+    if _exporter is None:
+        return _NOOP
+    parts = (traceparent or "").split("-")
+    if len(parts) == 4 and len(parts[1]) == 32 and len(parts[2]) == 16:
+        return Span(name, parts[1], parts[2], attrs, remote=True)
+    return Span(name, new_trace_id(), None, attrs)
+
+
+# --- 命令行: 按调用树打印一条链路的耗时 ---
+
+def load(paths: List[str]) -> List[dict]:
+    spans = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            spans.extend(json.loads(line) for line in f if line.strip())
+    return spans
+
+
+def _tree(spans: List[dict]) -> Tuple[List[dict], Dict[str, List[dict]]]:
+    ids = {s["span_id"] for s in spans}
+    children: Dict[str, List[dict]] = {}
+    roots = []
+    for s in sorted(spans, key=lambda s: s["start"]):
+        if s["parent_id"] in ids:
+            children.setdefault(s["parent_id"], []).append(s)
+        else:
+            roots.append(s)
+    return roots, children
+
+
+def render(spans: List[dict], width: int = 40) -> str:
+    """
+    火焰图式的文本输出: 每行一个调用，条形长度与耗时成正比，同一父节点下的同名调用合并显示 (×次数)。
+    self 是扣除子调用后的自身耗时 (服务端根 span 的 self 主要是框架与响应序列化)
+    """
+    roots, children = _tree(spans)
+    total = sum(r["duration_ms"] for r in roots) or 1.0
+    lines: List[str] = []
+
+    def walk(group: List[dict], depth: int):
+        merged: Dict[Tuple[str, str], List[dict]] = {}
+        for s in group:
+            merged.setdefault((s["service"], s["name"]), []).append(s)
+        for (service, name), same in merged.items():
+            duration = sum(s["duration_ms"] for s in same)
+            kids = [c for s in same for c in children.get(s["span_id"], [])]
+            self_ms = duration - sum(c["duration_ms"] for c in kids)
+            bar = "█" * max(1, round(width * duration / total))
+            label = f"{'  ' * depth}{name}" + (f" ×{len(same)}" if len(same) > 1 else "")
+            lines.append(f"{label:<48} {service:<6} {duration:>10.1f} ms {100 * duration / total:>5.1f}%  "
+                         f"self {max(self_ms, 0):>8.1f} ms  {bar}")
+            walk(kids, depth + 1)
+
+    walk(roots, 0)
+    return "\n".join(lines)
+
+
+def main(argv: List[str]) -> int:
+    files = [a for a in argv if os.path.exists(a)]
+    wanted = [a for a in argv if a not in files]
+    if not files:
+        print("usage: python -m src.core.tracing TRACE.jsonl [MORE.jsonl ...] [TRACE_ID]")
+        return 2
+    spans = load(files)
+    if not spans:
+        print("no spans")
+        return 1
+    # 默认显示最后开始的一条客户端链路
+    trace_id = wanted[0] if wanted else max(spans, key=lambda s: (s["service"] == "client", s["start"]))["trace_id"]
+    spans = [s for s in spans if s["trace_id"] == trace_id]
+    print(f"trace {trace_id}  ({len(spans)} spans)")
+    print(render(spans))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,97 @@
+# 同步接口的二进制传输格式 (MessagePack)
+# 密文 (Fernet token, urlsafe base64 文本) 的 encrypted_data 字段以 bin 类型携带原始字节，
+# 比 JSON 中的 base64 文本小约 1/4；解码时再还原成 token 字符串，上层代码看到的数据与 JSON 格式完全一致。
+import binascii
+from typing import Any, Optional
+
+try:
+    import msgpack
+except ImportError:  # msgpack 是可选依赖，缺失时只使用 JSON
+    msgpack = None
+
+MSGPACK_AVAILABLE = msgpack is not None
+
+MSGPACK_MEDIA_TYPE = "application/x-msgpack"
+# 流式拉取: 每行一个 JSON，第一行是响应头部，最后一行是结束标记
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+_MSGPACK_TYPES = {"application/x-msgpack", "application/msgpack", "application/vnd.msgpack"}
+
+# urlsafe base64 与标准 base64 的字母表互换，直接调用 binascii 比 base64.urlsafe_* 少几层转换
+_FROM_URLSAFE = bytes.maketrans(b"-_", b"+/")
+_TO_URLSAFE = bytes.maketrans(b"+/", b"-_")
+
+
+def _media_types(header: Optional[str]) -> dict:
+    """解析 Accept / Content-Type，返回 {媒体类型: q 值}"""
+    result = {}
+    for part in (header or "").split(","):
+        media, *params = [p.strip() for p in part.split(";")]
+        if not media:
+            continue
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        result[media.lower()] = q
+    return result
+
+
+def is_msgpack(content_type: Optional[str]) -> bool:
+    return any(m in _MSGPACK_TYPES for m in _media_types(content_type))
+
+
+def prefers_msgpack(accept: Optional[str]) -> bool:
+    """Accept 中 msgpack 的权重不低于 JSON 时返回 True"""
+    if not MSGPACK_AVAILABLE:
+        return False
+    types = _media_types(accept)
+    packed = max((q for m, q in types.items() if m in _MSGPACK_TYPES), default=0.0)
+    plain = max(types.get("application/json", 0.0), types.get("*/*", 0.0))
+    return packed > 0 and packed >= plain
+
+
+def accepts_ndjson(accept: Optional[str]) -> bool:
+    """客户端在 Accept 中明确列出 NDJSON 时使用流式响应 (*/* 不算)"""
+    return _media_types(accept).get(NDJSON_MEDIA_TYPE, 0.0) > 0
+
+
+def token_to_wire(token: str) -> Any:
+    """Fernet token -> 原始字节；无法无损还原的字符串原样保留"""
+    try:
+        std = token.encode("ascii").translate(_FROM_URLSAFE)
+        raw = binascii.a2b_base64(std, strict_mode=True)
+    except (binascii.Error, ValueError):
+        return token
+    if binascii.b2a_base64(raw, newline=False) != std:
+        return token
+    return raw
+
+
+def items_to_wire(items: list) -> list:
+    """条目字典列表中的 encrypted_data 转成原始字节"""
+    return [
+        {**item, "encrypted_data": token_to_wire(item["encrypted_data"])} if "encrypted_data" in item else item
+        for item in items
+    ]
+
+
+def _restore_token(obj: dict) -> dict:
+    value = obj.get("encrypted_data")
+    if value.__class__ is bytes:
+        obj["encrypted_data"] = binascii.b2a_base64(value, newline=False).translate(_TO_URLSAFE).decode("ascii")
+    return obj
+
+
+def pack(obj: Any) -> bytes:
+    if msgpack is None:
+        raise RuntimeError("msgpack is not installed")
+    return msgpack.packb(obj, use_bin_type=True)
+
+
+def unpack(data: bytes) -> Any:
+    if msgpack is None:
+        raise RuntimeError("msgpack is not installed")
+    return msgpack.unpackb(data, raw=False, object_hook=_restore_token)
@@ -0,0 +1,114 @@
+# src/server/cache.py
+# 进程内的 token -> 用户缓存: 命中时跳过 JWT 验签和按用户名查库。
+# 只缓存不会随同步变化的身份字段 (id, username, kdf_salt)，revision 仍由路由按需从数据库读取。
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Set, Tuple
+
+from sqlalchemy import event
+
+from .config import settings
+from .models import User
+
+
+@dataclass(frozen=True)
+class CachedUser:
+    id: int
+    username: str
+    kdf_salt: str
+
+
+class UserCache:
+    """按 token 索引的 LRU 缓存，条目在 TTL 或 token 过期 (取较早者) 后失效"""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[CachedUser, float]]" = OrderedDict()
+        # user_id -> tokens，用户被修改或删除时据此清除
+        self._tokens: Dict[int, Set[str]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, token: str) -> Optional[CachedUser]:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                self.misses += 1
+                return None
+            user, expires_at = entry
+            if time.time() >= expires_at:
+                self._remove(token)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return user
+
+    def peek(self, token: str) -> Optional[CachedUser]:
+        """只读查询，不计入命中统计也不调整 LRU 顺序"""
+        entry = self._entries.get(token)
+        if entry is None or time.time() >= entry[1]:
+            return None
+        return entry[0]
+
+    def put(self, token: str, user: CachedUser, token_exp: Optional[float] = None):
+        if self.max_size <= 0:
+            return
+        expires_at = time.time() + self.ttl
+        if token_exp is not None:
+            expires_at = min(expires_at, token_exp)
+        with self._lock:
+            if token in self._entries:
+                self._remove(token)
+            self._entries[token] = (user, expires_at)
+            self._tokens.setdefault(user.id, set()).add(token)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate_user(self, user_id: int):
+        with self._lock:
+            for token in list(self._tokens.get(user_id, ())):
+                self._remove(token)
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tokens.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    def _remove(self, token: str):
+        user, _ = self._entries.pop(token)
+        tokens = self._tokens.get(user.id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens[user.id]
+
+
+user_cache = UserCache(settings.USER_CACHE_SIZE, settings.USER_CACHE_TTL)
+
+
+# 通过 ORM 修改或删除用户时清除其缓存。
+# 多 worker 部署时其他进程的缓存只能等 TTL 过期，因此 TTL 不宜过长
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_user(mapper, connection, target: User):
+    if target.id is not None:
+        user_cache.invalidate_user(target.id)
@@ -0,0 +1,133 @@
+# src/server/compression.py
+# 请求/响应体压缩中间件 (纯 ASGI 实现，支持流式响应)
+# - 请求: 按 Content-Encoding 解压 zstd/gzip 请求体
+# - 响应: 按 Accept-Encoding 协商，优先 zstd，小于阈值的响应不压缩
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import PlainTextResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.core import compression
+
+
+class CompressionMiddleware:
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        request_encoding = headers.get("content-encoding", "").strip().lower()
+        if request_encoding and request_encoding != "identity":
+            if request_encoding not in compression.SUPPORTED_ENCODINGS:
+                response = PlainTextResponse(
+                    "Unsupported Content-Encoding", status_code=415,
+                    headers={"Accept-Encoding": ", ".join(compression.SUPPORTED_ENCODINGS)}
+                )
+                await response(scope, receive, send)
+                return
+            try:
+                scope, receive = await self._decompress_request(scope, receive, request_encoding)
+            except ValueError:
+                response = PlainTextResponse("Malformed request body", status_code=400)
+                await response(scope, receive, send)
+                return
+
+        encoding = compression.choose_encoding(headers.get("accept-encoding"))
+        responder = _CompressingSender(send, encoding, self.minimum_size)
+        await self.app(scope, receive, responder.send)
+
+    async def _decompress_request(self, scope: Scope, receive: Receive, encoding: str):
+        chunks = []
+        more_body = True
+        while more_body:
+            message = await receive()
+            chunks.append(message.get("body", b""))
+            more_body = message.get("more_body", False)
+        try:
+            body = compression.decompress(b"".join(chunks), encoding)
+        except Exception as e:
+            raise ValueError(str(e))
+
+        # 改写请求头，让下游看到的是未压缩的请求体
+        raw_headers = [
+            (k, v) for k, v in scope["headers"] if k not in (b"content-encoding", b"content-length")
+        ]
+        raw_headers.append((b"content-length", str(len(body)).encode("latin-1")))
+        scope = dict(scope, headers=raw_headers)
+
+        sent = False
+
+        async def replay() -> Message:
+            nonlocal sent
+            if sent:
+                return await receive()
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        return scope, replay
+
+
+class _CompressingSender:
+    def __init__(self, send: Send, encoding: str | None, minimum_size: int):
+        self._send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.start_message: Message | None = None
+        self.compressor = None
+        self.passthrough = encoding is None
+
+    async def send(self, message: Message):
+        if message["type"] == "http.response.start":
+            headers = MutableHeaders(raw=message["headers"])
+            # 告知客户端服务端能解压哪些请求编码
+            headers["Accept-Encoding"] = ", ".join(compression.SUPPORTED_ENCODINGS)
+            # 事件流每条消息只有几十字节，压缩没有收益还会拖慢刷出；
+            # 支持 Range 的响应 (快照文件) 本身已压缩，且字节偏移必须对应原文件
+            if "content-encoding" in headers or "accept-ranges" in headers \
+                    or headers.get("content-type", "").startswith("text/event-stream"):
+                self.passthrough = True
+            self.start_message = message
+            return
+
+        if message["type"] != "http.response.body":
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.start_message is not None:
+            start, self.start_message = self.start_message, None
+            headers = MutableHeaders(raw=start["headers"])
+            if self.passthrough or (not more_body and len(body) < self.minimum_size):
+                await self._send(start)
+                await self._send(message)
+                return
+
+            headers["Content-Encoding"] = self.encoding  # type: ignore
+            headers.add_vary_header("Accept-Encoding")
+            if not more_body:
+                # 一次性响应: 整体压缩并修正 Content-Length
+                body = compression.compress(body, self.encoding)  # type: ignore
+                headers["Content-Length"] = str(len(body))
+                await self._send(start)
+                await self._send({"type": "http.response.body", "body": body, "more_body": False})
+                return
+
+            # 流式响应: 每个数据块压缩后立即刷出，保证接收端能增量解析
+            del headers["Content-Length"]
+            self.compressor = compression.compressobj(self.encoding)  # type: ignore
+            await self._send(start)
+
+        if self.compressor is None:
+            await self._send(message)
+            return
+
+        data = self.compressor.flush(body) if body else b""
+        if not more_body:
+            data += self.compressor.finish()
+        await self._send({"type": "http.response.body", "body": data, "more_body": more_body})
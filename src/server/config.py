@@ -20,9 +20,118 @@ class Settings(BaseSettings):
     # Token 过期时间 (分钟)，默认 30 天 (30 * 24 * 60)
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 43200 
 
+    # token -> 用户缓存的容量与有效期 (秒)，容量为 0 时关闭缓存
+    USER_CACHE_SIZE: int = 10000
+    USER_CACHE_TTL: int = 300
+
+    # --- 密码哈希 (Argon2id) ---
+    # 修改成本参数后，旧哈希会在用户下次登录时按新参数重算
+    ARGON2_TIME_COST: int = 3
+    ARGON2_MEMORY_COST: int = 65536  # KiB
+    ARGON2_PARALLELISM: int = 4
+    # 哈希专用工作池: 工作线程 (或进程) 数与排队上限，排满后登录/注册直接返回 503
+    HASH_WORKERS: int = 2
+    HASH_QUEUE_SIZE: int = 16
+    HASH_USE_PROCESSES: bool = False
+    HASH_RETRY_AFTER: int = 2  # 秒
+
+    # --- 准入控制与限流 (进程内令牌桶) ---
+    RATE_LIMIT_ENABLED: bool = True
+    # 同时处理中的 API 请求上限，超出返回 503
+    MAX_CONCURRENT_REQUESTS: int = 256
+    # 每秒补充的令牌数 / 桶容量。认证接口按 IP 和用户名计量，同步接口按 IP 和用户计量
+    AUTH_RATE_PER_IP: float = 1.0
+    AUTH_BURST_PER_IP: int = 20
+    AUTH_RATE_PER_USER: float = 0.2
+    AUTH_BURST_PER_USER: int = 10
+    SYNC_RATE_PER_IP: float = 50.0
+    SYNC_BURST_PER_IP: int = 200
+    SYNC_RATE_PER_USER: float = 20.0
+    SYNC_BURST_PER_USER: int = 120
+    # 每类桶最多跟踪的键数，超出后淘汰最久未用的
+    RATE_LIMIT_MAX_KEYS: int = 100000
+
     # --- 数据库配置 ---
     # 默认使用本地 SQLite 文件，生产环境可以改为 PostgreSQL 链接
     DATABASE_URL: str = "sqlite:///./cloud_vault.db"
+    # 请求处理使用异步驱动 (aiosqlite / asyncpg)；
+    # 设为 False 时改用同步驱动，每次数据库调用在线程池中执行
+    DATABASE_ASYNC: bool = True
+    # 打印全部 SQL，仅用于调试
+    DATABASE_ECHO: bool = False
+    # production: SQLite 启用 WAL 等连接参数并在进程内串行化写事务；default: 保持 SQLite 默认设置
+    DATABASE_PROFILE: str = "production"
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    # WAL 下 NORMAL 只在检查点时 fsync；需要每次提交都落盘时设为 FULL，并配合 SYNC_GROUP_COMMIT 摊薄开销
+    SQLITE_SYNCHRONOUS: str = "NORMAL"
+    SQLITE_CACHE_SIZE_KB: int = 65536
+    SQLITE_MMAP_SIZE: int = 268435456  # 256 MiB
+    # 连接池 (PostgreSQL 与文件 SQLite)
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: float = 30.0
+    DB_POOL_RECYCLE: int = 1800  # 秒，-1 表示不回收
+    DB_POOL_PRE_PING: bool = True
+
+    # --- 存储后端 ---
+    # shared: 全部用户的条目在 DATABASE_URL 同一个库里
+    # sharded: DATABASE_URL 只作为目录库保存用户表，每个用户的条目、变更日志和摘要树
+    # 放在 SHARD_DIR 下单独的 SQLite 文件中，不同用户的写入可以并行。两种后端之间切换不会迁移数据
+    STORAGE_BACKEND: str = "shared"
+    # 分片就是用户数据本身，须位于持久化的数据目录 (Docker 部署中挂载为卷的 /app/data) 下
+    SHARD_DIR: str = "./data/vault_shards"
+    # 同时保持打开的分片引擎数，超出后关闭最久未用且空闲的分片
+    SHARD_CACHE_SIZE: int = 256
+    # 每个分片的连接池大小
+    SHARD_POOL_SIZE: int = 2
+
+    # --- 首次同步快照 ---
+    # 每个用户一个压缩快照文件，新设备先整体下载快照，再拉取快照之后的增量
+    SNAPSHOT_DIR: str = "./data/vault_snapshots"
+    # 快照落后当前 revision 超过该值时，下次请求重建
+    SNAPSHOT_MAX_LAG: int = 50
+
+    # --- 推送组提交 ---
+    # 启用后并发推送在同一事务中批量提交，每批最多等待 WINDOW 毫秒或攒够 MAX_ITEMS 个条目。
+    # 只对 shared 后端生效，分片之间不能共用一个事务
+    SYNC_GROUP_COMMIT: bool = False
+    GROUP_COMMIT_WINDOW_MS: float = 5.0
+    GROUP_COMMIT_MAX_ITEMS: int = 2000
+
+    # --- 维护任务 ---
+    # 压缩与 SQLite 优化的执行间隔 (小时)，0 表示不在服务进程内执行
+    MAINTENANCE_INTERVAL_HOURS: float = 24.0
+    # 删除标记最长保留天数，超过后即使仍有设备未确认也会清理 (该设备下次同步时改走全量比对)
+    TOMBSTONE_RETENTION_DAYS: int = 90
+    # 最近多少天内确认过游标的设备算活跃设备，只有活跃设备会阻止压缩
+    DEVICE_ACTIVE_DAYS: int = 30
+    # SQLite 空闲页占比超过该值时 VACUUM
+    SQLITE_VACUUM_FREE_RATIO: float = 0.2
+
+    # --- 变更通知 (/changes/stream) ---
+    # 空闲连接的心跳间隔 (秒)，需小于反向代理的空闲超时
+    CHANGE_STREAM_HEARTBEAT: float = 25.0
+    # 单个连接的最长存活时间 (秒)，到期后客户端重连并重新校验 token
+    CHANGE_STREAM_MAX_SECONDS: int = 3600
+    # 每个 worker 的最大连接数，超出返回 503
+    CHANGE_STREAM_MAX_CONNECTIONS: int = 10000
+
+    # --- 日志与指标 ---
+    # DEBUG 时输出每个同步请求的明细
+    LOG_LEVEL: str = "INFO"
+    # json: 每行一个 JSON 对象，便于日志系统采集；text: 便于本地阅读
+    LOG_FORMAT: str = "json"
+    # 同一事件每个窗口 (秒) 内最多输出的条数，0 表示不限
+    LOG_RATE_LIMIT: int = 20
+    LOG_RATE_WINDOW: float = 60.0
+    # 统计请求延迟、字节数等指标并在 /metrics 输出
+    METRICS_ENABLED: bool = True
+    # 链路追踪: 非空时把 span 写入该 JSONL 文件 (python -m src.core.tracing 查看)，空表示关闭
+    TRACE_FILE: str = ""
+
+    # --- 传输压缩 ---
+    # 小于该字节数的响应不压缩，压缩收益抵不过 CPU 开销
+    COMPRESSION_MINIMUM_SIZE: int = 1024
 
     # --- Pydantic 配置 ---
     # 告诉 Pydantic 去读取根目录下的 .env 文件
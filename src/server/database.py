@@ -1,23 +1,138 @@
 # src/server/database.py
-from typing import Generator
-from sqlmodel import SQLModel, Session, create_engine
+import asyncio
+import time
+import weakref
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator, Hashable, Optional, Tuple, Union
+from sqlalchemy import event, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlmodel import SQLModel, Session, create_engine, select, col
+from sqlmodel.ext.asyncio.session import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from src.core.crypto import content_hash
+from src.core.schema import add_missing_columns
 from .config import settings
+from .models import User, VaultItem, VaultDigest
+from . import digest, metrics
 
 # 1. 配置连接参数
 # SQLite 需要特殊配置 check_same_thread=False，
 # 因为 FastAPI 是多线程/异步的，而 SQLite 默认只允许单线程访问同一个连接。
-connect_args = {}
-if settings.DATABASE_URL.startswith("sqlite"):
-    connect_args["check_same_thread"] = False
+IS_SQLITE = settings.DATABASE_URL.startswith("sqlite")
+
+def _pool_args(url: str, **overrides) -> dict:
+    # 连接池参数。内存 SQLite 使用单连接池，不接受这些参数
+    if ":memory:" in url:
+        return {}
+    args = dict(
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING and not url.startswith("sqlite"),
+    )
+    args.update(overrides)
+    return args
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    # 生产配置: WAL 让读者不再被写者阻塞；默认 synchronous=NORMAL 只在检查点时 fsync，
+    # 断电最多丢失最后几个事务但不会损坏数据库 (SQLITE_SYNCHRONOUS=FULL 则每次提交都落盘)
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={settings.SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA cache_size=-{settings.SQLITE_CACHE_SIZE_KB}")
+    cursor.execute(f"PRAGMA mmap_size={settings.SQLITE_MMAP_SIZE}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+# 连接池: 记录每次取连接的等待时间 (池满时的排队时间)，在 /metrics 中观察池是否过小
+class _TimedPoolMixin:
+    metrics_label = "sync"
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()  # type: ignore
+        finally:
+            metrics.DB_POOL_WAIT.labels(self.metrics_label).observe(time.perf_counter() - started)
+
+class TimedQueuePool(_TimedPoolMixin, QueuePool):
+    pass
+
+class TimedAsyncQueuePool(_TimedPoolMixin, AsyncAdaptedQueuePool):
+    metrics_label = "async"
+
+# 异步引擎: SQLite 用 aiosqlite，PostgreSQL 用 asyncpg，与同步引擎指向同一个库。
+# 建表和启动时的回填仍走同步引擎，请求处理走异步引擎。
+def _async_url(url: str) -> str:
+    scheme, sep, rest = url.partition("://")
+    driver = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg", "postgres": "postgresql+asyncpg"}
+    return driver.get(scheme.split("+")[0], scheme) + sep + rest
 
 # 2. 创建引擎 (Engine)
-# echo=True 会在控制台打印出生成的 SQL 语句，非常有助于开发和调试。
-# 生产环境建议设置为 False。
-engine = create_engine(
-    settings.DATABASE_URL, 
-    echo=True, 
-    connect_args=connect_args
-)
+# DATABASE_ECHO=True 会在控制台打印出生成的 SQL 语句，非常有助于开发和调试。
+def create_engines(url: str, **pool_overrides) -> Tuple[Engine, Optional[AsyncEngine]]:
+    """创建同步引擎和 (DATABASE_ASYNC 时的) 异步引擎，主库与用户分片共用同一套参数"""
+    is_sqlite = url.startswith("sqlite")
+    pool_args = _pool_args(url, **pool_overrides)
+    sync_engine = create_engine(
+        url,
+        echo=settings.DATABASE_ECHO,
+        connect_args={"check_same_thread": False} if is_sqlite else {},
+        **({"poolclass": TimedQueuePool, **pool_args} if pool_args else {})
+    )
+    a_engine = None
+    if settings.DATABASE_ASYNC:
+        a_engine = create_async_engine(
+            _async_url(url), echo=settings.DATABASE_ECHO,
+            **({"poolclass": TimedAsyncQueuePool, **pool_args} if pool_args else {})
+        )
+    if is_sqlite and settings.DATABASE_PROFILE == "production":
+        event.listen(sync_engine, "connect", _sqlite_pragmas)
+        if a_engine is not None:
+            event.listen(a_engine.sync_engine, "connect", _sqlite_pragmas)
+    return sync_engine, a_engine
+
+engine, async_engine = create_engines(settings.DATABASE_URL)
+
+@metrics.registry.collector
+def _pool_metrics():
+    # 主库连接池的当前状态 (分片各自的小连接池不单独输出)
+    pools = [("sync", engine.pool)]
+    if async_engine is not None:
+        pools.append(("async", async_engine.sync_engine.pool))
+    pools = [(label, pool) for label, pool in pools if isinstance(pool, QueuePool)]
+    for name, documentation, read in (
+        ("vault_db_pool_size", "Configured pool size", lambda p: p.size()),
+        ("vault_db_pool_checked_out", "Connections currently checked out", lambda p: p.checkedout()),
+        ("vault_db_pool_overflow", "Overflow connections in use (negative: not yet opened)", lambda p: p.overflow()),
+    ):
+        yield name, "gauge", documentation, [({"engine": label}, read(pool)) for label, pool in pools]
+
+# SQLite 同一时刻只允许一个写事务。写请求先在进程内排队，拿到锁后再开始事务，
+# 比多个连接同时争抢、在 busy_timeout 里退避重试吞吐更高。
+# 每个事件循环、每个数据库文件一把锁: key 为 None 是主库，分片模式下每个用户的分片各有一把，
+# 不同用户的写入互不等待
+_write_locks: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, weakref.WeakValueDictionary]" = weakref.WeakKeyDictionary()
+
+@asynccontextmanager
+async def write_lock(key: Hashable = None):
+    if settings.DATABASE_PROFILE != "production" or (key is None and not IS_SQLITE):
+        yield
+        return
+    loop = asyncio.get_running_loop()
+    locks = _write_locks.get(loop)
+    if locks is None:
+        locks = _write_locks[loop] = weakref.WeakValueDictionary()
+    # 没有人持有或等待的锁会被回收，不随用户数增长
+    lock = locks.get(key)
+    if lock is None:
+        lock = locks[key] = asyncio.Lock()
+    async with lock:
+        yield
 
 # 3. 初始化数据库函数
 # 这个函数会在 main.py 启动时被调用，用于自动创建表结构
@@ -25,11 +140,123 @@ def init_db():
     # SQLModel 会自动扫描所有继承自 SQLModel 的类，并创建对应的表
     # 注意：在使用此函数前，必须在 main.py 中导入所有的 models
     SQLModel.metadata.create_all(engine)
+    add_missing_columns(engine, SQLModel.metadata)
+    _backfill_content_hash()
+    _backfill_digests()
+    _backfill_revisions()
+    _backfill_versions()
+
+def _backfill_content_hash():
+    # 升级前写入的条目没有摘要，启动时补算一次
+    with Session(engine) as session:
+        rows = session.exec(
+            select(VaultItem).where(VaultItem.content_hash == None)  # noqa: E711
+        ).all()
+        for item in rows:
+            item.content_hash = content_hash(item.encrypted_data)
+            session.add(item)
+        session.commit()
+
+def _backfill_digests():
+    # 摘要树表为空但已有条目，说明是从旧版本升级上来的
+    with Session(engine) as session:
+        if session.exec(select(VaultDigest).limit(1)).first() is not None:
+            return
+        if session.exec(select(VaultItem.id).limit(1)).first() is None:
+            return
+        digest.rebuild_all(session)
+
+def _backfill_revisions():
+    # 升级前写入的条目没有 revision，统一记为版本 1，客户端首次同步时按内容摘要比对
+    with Session(engine) as session:
+        owners = session.exec(select(VaultItem.owner_id).where(VaultItem.revision == 0).distinct()).all()
+        if not owners:
+            return
+        session.exec(update(VaultItem).where(col(VaultItem.revision) == 0).values(revision=1))  # type: ignore
+        session.exec(update(User).where(col(User.id).in_(owners), col(User.revision) == 0).values(revision=1))  # type: ignore
+        session.commit()
+
+def _backfill_versions():
+    # 升级前写入的条目没有版本号，记为 1；尚未记录版本的旧客户端推送时会按冲突处理
+    with Session(engine) as session:
+        session.exec(update(VaultItem).where(col(VaultItem.version) == 0).values(version=1))  # type: ignore
+        session.commit()
+
+async def dispose_engines():
+    if async_engine is not None:
+        await async_engine.dispose()
+    engine.dispose()
+
+def _threaded(name: str):
+    async def method(self, *args, **kwargs):
+        return await run_in_threadpool(getattr(self.sync_session, name), *args, **kwargs)
+    return method
+
+class ThreadedSession:
+    """
+    同步模式 (DATABASE_ASYNC=False) 下的会话: 提供与 AsyncSession 相同的 await 接口，
+    每次数据库调用放到线程池里用同步驱动执行。路由代码在两种模式下保持一致。
+    """
+    def __init__(self, session: Session):
+        self.sync_session = session
+
+    def add(self, instance):
+        self.sync_session.add(instance)
+
+    async def exec(self, statement, **kwargs):
+        # 与 AsyncSession 一样预先取完结果行，之后的 .all()/.first() 不再碰数据库
+        kwargs["execution_options"] = {**kwargs.get("execution_options", {}), "prebuffer_rows": True}
+        return await run_in_threadpool(self.sync_session.exec, statement, **kwargs)
+
+    async def run_sync(self, fn, *args, **kwargs):
+        return await run_in_threadpool(fn, self.sync_session, *args, **kwargs)
+
+    get = _threaded("get")
+    refresh = _threaded("refresh")
+    flush = _threaded("flush")
+    commit = _threaded("commit")
+    rollback = _threaded("rollback")
+    close = _threaded("close")
+
+DBSession = Union[AsyncSession, ThreadedSession]
+
+async def stream_partitions(session: DBSession, statement, size: int) -> AsyncGenerator[list, None]:
+    """用服务端游标分批读取结果行，每批最多 size 行，整个结果集不会同时放在内存里"""
+    statement = statement.execution_options(yield_per=size)
+    if isinstance(session, ThreadedSession):
+        result = await run_in_threadpool(session.sync_session.execute, statement)
+        partitions = result.partitions()
+        while True:
+            rows = await run_in_threadpool(next, partitions, None)
+            if rows is None:
+                return
+            yield rows
+    else:
+        result = await session.stream(statement)
+        async for rows in result.partitions():
+            yield rows
+
+# expire_on_commit=False: 提交后仍可直接读取对象属性，异步会话中不能隐式懒加载
+# bind 为 (同步引擎, 异步引擎)，默认是主库
+@asynccontextmanager
+async def session_scope(
+    bind: Optional[Tuple[Engine, Optional[AsyncEngine]]] = None
+) -> AsyncGenerator[DBSession, None]:
+    sync_engine, a_engine = bind or (engine, async_engine)
+    if a_engine is not None:
+        async with AsyncSession(a_engine, expire_on_commit=False) as session:
+            yield session
+        return
+    session = ThreadedSession(Session(sync_engine, expire_on_commit=False))
+    try:
+        yield session
+    finally:
+        # Session 关闭后连接放回连接池
+        await session.close()
 
 # 4. 获取数据库会话 (Dependency)
 # 这是一个生成器函数，专门配合 FastAPI 的 Depends 使用
-def get_session() -> Generator[Session, None, None]:
-    with Session(engine) as session:
+async def get_session() -> AsyncGenerator[DBSession, None]:
+    async with session_scope() as session:
         yield session
-        # 这里的代码会在请求处理完成后执行 (即使发生异常)
-        # Session 会自动关闭，连接放回连接池
\ No newline at end of file
+        # 这里的代码会在请求处理完成后执行 (即使发生异常)
\ No newline at end of file
@@ -0,0 +1,122 @@
+# src/server/digest.py
+# 服务端摘要树维护: 在 sync_vault 的同一事务内重算被修改条目所在的桶及其祖先节点
+from typing import Dict, Iterable, List, Set, Tuple
+from sqlalchemy import func, or_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import Session, select, col
+
+from src.core.digest import (
+    DIGEST_DEPTH, entry_digest, combine, to_hex, from_hex, leaf_prefix, prefix_upper_bound
+)
+from .models import VaultItem, VaultDigest
+
+# 被修改的桶超过这个数量时，一次扫描该用户全部条目比逐桶查询更便宜
+FULL_SCAN_THRESHOLD = 32
+
+
+def _leaf_entries(session: Session, user_id: int, leaves: Set[str]) -> Dict[str, List[int]]:
+    columns = select(VaultItem.id, VaultItem.content_hash, VaultItem.is_deleted).where(
+        VaultItem.owner_id == user_id
+    )
+    if len(leaves) > FULL_SCAN_THRESHOLD:
+        statements = [columns]
+    else:
+        statements = [
+            columns.where(col(VaultItem.id) >= p, col(VaultItem.id) < prefix_upper_bound(p))
+            for p in leaves
+        ]
+
+    entries: Dict[str, List[int]] = {p: [] for p in leaves}
+    for statement in statements:
+        for item_id, c_hash, is_deleted in session.exec(statement).all():
+            bucket = entries.get(leaf_prefix(item_id))
+            if bucket is not None:
+                bucket.append(entry_digest(item_id, c_hash, is_deleted))
+    return entries
+
+
+def _save_nodes(session: Session, user_id: int, nodes: Dict[str, Tuple[int, int]]):
+    """写入 prefix -> (digest, count)。SQLite/PostgreSQL 用一条 upsert，不经过 ORM 对象"""
+    if not nodes:
+        return
+    dialect = session.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+        stmt = insert(VaultDigest).values([
+            {"owner_id": user_id, "prefix": p, "digest": to_hex(d), "item_count": n}
+            for p, (d, n) in nodes.items()
+        ])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[VaultDigest.owner_id, VaultDigest.prefix],
+            set_={"digest": stmt.excluded.digest, "item_count": stmt.excluded.item_count},
+        )
+        session.exec(stmt)  # type: ignore
+        return
+
+    for prefix, (digest, count) in nodes.items():
+        node = session.get(VaultDigest, (user_id, prefix))
+        if node is None:
+            node = VaultDigest(owner_id=user_id, prefix=prefix, digest=to_hex(digest))
+        node.digest = to_hex(digest)
+        node.item_count = count
+        session.add(node)
+    session.flush()
+
+
+def refresh_digests(session: Session, user_id: int, item_ids: Iterable[str]):
+    """
+    重算 item_ids 所在叶子桶及其祖先。必须在写入条目之后、提交之前调用，
+    此时已持有写锁，读到的就是本事务提交后的最终状态。
+    """
+    touched = {leaf_prefix(i) for i in item_ids}
+    if not touched:
+        return
+
+    _save_nodes(session, user_id, {
+        prefix: (combine(digests), len(digests))
+        for prefix, digests in _leaf_entries(session, user_id, touched).items()
+    })
+
+    for level in range(DIGEST_DEPTH - 1, -1, -1):
+        touched = {p[:level] for p in touched}
+        grouped: Dict[str, List] = {p: [] for p in touched}
+        for child in get_children(session, user_id, list(touched)):
+            grouped[child.prefix[:-1]].append(child)
+        _save_nodes(session, user_id, {
+            prefix: (combine(from_hex(c.digest) for c in children), sum(c.item_count for c in children))
+            for prefix, children in grouped.items()
+        })
+
+
+def get_nodes(session: Session, user_id: int, prefixes: List[str]) -> List[VaultDigest]:
+    statement = select(VaultDigest).where(
+        VaultDigest.owner_id == user_id, col(VaultDigest.prefix).in_(prefixes)
+    )
+    return list(session.exec(statement).all())
+
+
+def get_children(session: Session, user_id: int, prefixes: List[str]) -> List:
+    """返回 prefixes 的直接子节点 (prefix, digest, item_count)，只查询列，不构造 ORM 对象"""
+    wanted = set(prefixes)
+    # 非根节点按前缀区间走主键索引，只扫描各自的 16 个子节点
+    ranges = [
+        (col(VaultDigest.prefix) >= p) & (col(VaultDigest.prefix) < prefix_upper_bound(p))
+        for p in wanted if p
+    ]
+    if "" in wanted:
+        ranges.append(col(VaultDigest.prefix) >= "")
+    statement = select(VaultDigest.prefix, VaultDigest.digest, VaultDigest.item_count).where(
+        VaultDigest.owner_id == user_id,
+        or_(*ranges),
+        func.length(VaultDigest.prefix).in_({len(p) + 1 for p in wanted}),
+    )
+    return [n for n in session.exec(statement).all() if n.prefix[:-1] in wanted]
+
+
+def rebuild_all(session: Session):
+    """为升级前已有的条目补建摘要树"""
+    owners = session.exec(select(VaultItem.owner_id).distinct()).all()
+    for user_id in owners:
+        ids = session.exec(select(VaultItem.id).where(VaultItem.owner_id == user_id)).all()
+        refresh_digests(session, user_id, ids)
+    session.commit()
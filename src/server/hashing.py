@@ -0,0 +1,74 @@
+# src/server/hashing.py
+# 密码哈希专用的有界工作池: Argon2 计算与同步请求使用的默认线程池隔离，
+# 排队数超过上限时立即拒绝 (503)，登录风暴不会拖慢 /sync。
+import asyncio
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+from .config import settings
+
+
+class HashPoolFull(Exception):
+    pass
+
+
+class HashingPool:
+    def __init__(self, workers: int, queue_size: int, use_processes: bool = False):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.use_processes = use_processes
+        # 正在计算 + 排队中的任务上限
+        self.capacity = workers + queue_size
+        self._executor: Executor | None = None
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def _get_executor(self) -> Executor:
+        # 延迟创建，避免导入时就启动子进程
+        if self._executor is None:
+            if self.use_processes:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="argon2")
+        return self._executor
+
+    async def run(self, fn, *args):
+        with self._lock:
+            if self.pending >= self.capacity:
+                self.rejected += 1
+                raise HashPoolFull()
+            self.pending += 1
+        try:
+            result = await asyncio.wrap_future(self._get_executor().submit(fn, *args))
+        except BaseException:
+            # 计算抛错或请求被取消都记为失败，不计入 completed
+            with self._lock:
+                self.pending -= 1
+                self.failed += 1
+            raise
+        with self._lock:
+            self.pending -= 1
+            self.completed += 1
+        return result
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "capacity": self.capacity,
+                "pending": self.pending,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+            }
+
+
+hash_pool = HashingPool(settings.HASH_WORKERS, settings.HASH_QUEUE_SIZE, settings.HASH_USE_PROCESSES)
@@ -1,7 +1,24 @@
 from fastapi import FastAPI
-from .database import init_db
+from fastapi.responses import PlainTextResponse
+from .database import init_db, dispose_engines
 from .routers import auth, sync
 from .config import settings
+from .compression import CompressionMiddleware
+from .cache import user_cache
+from .hashing import hash_pool
+from .ratelimit import RateLimitMiddleware, rate_limiter
+from .writer import group_writer
+from .shards import shard_store
+from .notify import change_hub
+from .maintenance import maintenance
+from .snapshot import snapshot_store
+from .logs import setup_logging
+from .tracing import TracingMiddleware
+from . import metrics
+from src.core import tracing
+
+setup_logging()
+tracing.configure(settings.TRACE_FILE, "server")
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
@@ -9,9 +26,40 @@ app = FastAPI(
     openapi_url=f"{settings.API_V1_STR}/openapi.json"
 )
 
+# 请求体按 Content-Encoding 解压，响应按 Accept-Encoding 协商压缩 (zstd 优先，gzip 兜底)
+app.add_middleware(CompressionMiddleware, minimum_size=settings.COMPRESSION_MINIMUM_SIZE)
+# 最后添加的中间件在最外层: 超出预算的请求在解压和路由之前就被拒绝
+app.add_middleware(RateLimitMiddleware)
+# 追踪的根 span 覆盖限流、解压与压缩；未配置 TRACE_FILE 时直接透传
+app.add_middleware(TracingMiddleware)
+# 指标在限流之外统计，被拒绝的请求也计入
+if settings.METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+
+# /stats 中的各组件计数同时以 gauge 形式出现在 /metrics
+metrics.stats_collector("user_cache", "Token cache", user_cache.stats)
+metrics.stats_collector("hash_pool", "Password hashing pool", hash_pool.stats)
+metrics.stats_collector("rate_limit", "Admission control", rate_limiter.stats)
+metrics.stats_collector("group_commit", "Push group commit", group_writer.stats)
+metrics.stats_collector("change_stream", "Change notification streams", change_hub.stats)
+metrics.stats_collector("maintenance", "Compaction and SQLite maintenance", maintenance.stats)
+metrics.stats_collector("snapshots", "Bootstrap snapshots", snapshot_store.stats)
+if shard_store is not None:
+    metrics.stats_collector("shards", "Per-user shard engines", shard_store.stats)
+
 @app.on_event("startup")
-def on_startup():
+async def on_startup():
     init_db()
+    maintenance.start()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    group_writer.stop()
+    maintenance.stop()
+    if shard_store is not None:
+        await shard_store.dispose_all()
+    await dispose_engines()
+    hash_pool.shutdown()
 
 app.include_router(auth.router, prefix="/auth", tags=["Authentication"])
 
@@ -19,4 +67,18 @@ app.include_router(sync.router, prefix=settings.API_V1_STR, tags=["Sync"])
 
 @app.get("/")
 def root():
-    return {"message": "Password Manager Server is running"}
\ No newline at end of file
+    return {"message": "Password Manager Server is running"}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """Prometheus 文本格式的指标"""
+    return PlainTextResponse(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/stats")
+def stats():
+    """进程内计数器，便于观察缓存效果"""
+    return {"user_cache": user_cache.stats(), "hash_pool": hash_pool.stats(),
+            "rate_limit": rate_limiter.stats(), "group_commit": group_writer.stats(),
+            "shards": shard_store.stats() if shard_store is not None else None,
+            "change_stream": change_hub.stats(), "maintenance": maintenance.stats(),
+            "snapshots": snapshot_store.stats()}
@@ -0,0 +1,186 @@
+# src/server/maintenance.py
+# 后台维护任务 (每 MAINTENANCE_INTERVAL_HOURS 小时一次):
+# - 压缩: 删除标记和变更日志只保留到 "所有活跃设备都已确认" 或 "超过保留期" 为止，
+#   之后硬删除，并记下 compacted_revision。游标早于它的设备请求 /changes 会收到 410，改走摘要树全量比对
+# - SQLite: 每轮执行 PRAGMA optimize (按需 ANALYZE)，空闲页比例超过阈值时 VACUUM
+# 多 worker 部署时只需在一个进程中启用 (其他进程设 MAINTENANCE_INTERVAL_HOURS=0)，或改用命令行定时执行:
+#   python -m src.server.maintenance
+import asyncio
+import time
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, func
+from sqlalchemy.engine import Engine
+from sqlmodel import Session, select, col
+from starlette.concurrency import run_in_threadpool
+
+from .config import settings
+from .database import IS_SQLITE, engine, session_scope, write_lock
+from .models import DeviceCursor, User, VaultChange, VaultItem
+from .repository import open_vault
+from .shards import shard_store
+from . import digest
+from .logs import get_logger
+
+logger = get_logger("maintenance")
+
+DAY = 86400
+# 每批删除的条目数 (SQLite 绑定参数上限)
+DELETE_CHUNK = 500
+
+
+def compaction_horizon(session: Session, user_id: int, now: float) -> int:
+    """可以安全清理到的 revision: 活跃设备中最慢的游标，与保留期之前的最后一个 revision，取较大者"""
+    active_since = now - settings.DEVICE_ACTIVE_DAYS * DAY
+    device_min = session.exec(
+        select(func.min(DeviceCursor.revision)).where(
+            DeviceCursor.owner_id == user_id, DeviceCursor.last_seen >= active_since
+        )
+    ).one()
+    # 条目表里保留期之前写入的最大 revision 即保留期起点的近似值 (之后又被修改的条目只会让它偏小)
+    retained = session.exec(
+        select(func.max(VaultItem.revision)).where(
+            VaultItem.owner_id == user_id,
+            VaultItem.updated_at < now - settings.TOMBSTONE_RETENTION_DAYS * DAY,
+        )
+    ).one()
+    return max(device_min or 0, retained or 0)
+
+
+def compact_vault(session: Session, user_id: int, horizon: int) -> Tuple[int, int]:
+    """硬删除 revision <= horizon 的删除标记与变更日志，并更新摘要树。返回 (删除标记数, 变更日志数)"""
+    ids = list(session.exec(
+        select(VaultItem.id).where(
+            VaultItem.owner_id == user_id,
+            VaultItem.is_deleted == True,  # noqa: E712
+            col(VaultItem.revision) <= horizon,
+        )
+    ).all())
+    for i in range(0, len(ids), DELETE_CHUNK):
+        session.exec(delete(VaultItem).where(col(VaultItem.id).in_(ids[i:i + DELETE_CHUNK])))  # type: ignore
+    changes = session.exec(  # type: ignore
+        delete(VaultChange).where(VaultChange.owner_id == user_id, col(VaultChange.revision) <= horizon)
+    ).rowcount
+    digest.refresh_digests(session, user_id, ids)
+    return len(ids), changes
+
+
+def optimize_sqlite(sqlite_engine: Engine) -> bool:
+    """PRAGMA optimize，空闲页超过 SQLITE_VACUUM_FREE_RATIO 时 VACUUM。返回是否执行了 VACUUM"""
+    with sqlite_engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.exec_driver_sql("PRAGMA optimize")
+        pages = conn.exec_driver_sql("PRAGMA page_count").scalar() or 0
+        free = conn.exec_driver_sql("PRAGMA freelist_count").scalar() or 0
+        if not pages or free / pages < settings.SQLITE_VACUUM_FREE_RATIO:
+            return False
+        conn.exec_driver_sql("VACUUM")
+        # VACUUM 之后重新收集统计信息
+        conn.exec_driver_sql("ANALYZE")
+        return True
+
+
+class Maintenance:
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self.runs = 0
+        self.last_run: Optional[float] = None
+        self.last_duration = 0.0
+        self.tombstones = 0
+        self.changes = 0
+        self.vacuums = 0
+
+    async def compact_user(self, user_id: int, now: float) -> Tuple[int, int]:
+        async with session_scope() as catalog, open_vault(catalog, user_id) as vault:
+            async with vault.write_lock():
+                _, compacted = await vault.state()
+                horizon = await vault.session.run_sync(compaction_horizon, user_id, now)
+                if horizon <= compacted:
+                    return 0, 0
+                removed = await vault.session.run_sync(compact_vault, user_id, horizon)
+                await vault.set_compacted(horizon)
+                await vault.session.commit()
+        if shard_store is not None:
+            await self._optimize_shard(user_id)
+        return removed
+
+    async def _optimize_shard(self, user_id: int):
+        shard = await shard_store.acquire(user_id)  # type: ignore
+        try:
+            async with write_lock(("shard", user_id)):
+                self.vacuums += await run_in_threadpool(optimize_sqlite, shard.engine)
+        finally:
+            await shard_store.release(shard)  # type: ignore
+
+    async def run_once(self) -> Dict[str, int]:
+        started = time.time()
+        async with session_scope() as catalog:
+            user_ids: List[int] = list((await catalog.exec(select(User.id))).all())  # type: ignore
+        tombstones = changes = 0
+        for user_id in user_ids:
+            try:
+                t, c = await self.compact_user(user_id, started)
+            except Exception:
+                logger.error("compaction failed", exc_info=True, extra={"user_id": user_id})
+                continue
+            tombstones += t
+            changes += c
+        if IS_SQLITE and shard_store is None:
+            async with write_lock():
+                self.vacuums += await run_in_threadpool(optimize_sqlite, engine)
+
+        self.runs += 1
+        self.last_run = started
+        self.last_duration = time.time() - started
+        self.tombstones += tombstones
+        self.changes += changes
+        logger.info("maintenance finished", extra={
+            "users": len(user_ids), "tombstones": tombstones, "changes": changes,
+            "seconds": round(self.last_duration, 3),
+        })
+        return {"users": len(user_ids), "tombstones": tombstones, "changes": changes}
+
+    async def _loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.run_once()
+            except Exception:
+                logger.error("maintenance run failed", exc_info=True)
+
+    def start(self):
+        interval = settings.MAINTENANCE_INTERVAL_HOURS * 3600
+        if interval > 0 and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._loop(interval))
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "runs": self.runs,
+            "last_run": self.last_run,
+            "last_duration": round(self.last_duration, 3),
+            "tombstones": self.tombstones,
+            "changes": self.changes,
+            "vacuums": self.vacuums,
+        }
+
+
+maintenance = Maintenance()
+
+
+if __name__ == "__main__":
+    from .database import init_db, dispose_engines
+    from .logs import setup_logging
+
+    async def _main():
+        setup_logging()
+        init_db()
+        print(await maintenance.run_once())
+        if shard_store is not None:
+            await shard_store.dispose_all()
+        await dispose_engines()
+
+    asyncio.run(_main())
@@ -0,0 +1,274 @@
+# src/server/metrics.py
+# 进程内指标，GET /metrics 以 Prometheus 文本格式输出 (不依赖 prometheus_client)。
+# - MetricsMiddleware: 按路由模板统计延迟直方图、处理中的请求数、请求/响应字节数 (压缩后的线上字节)
+# - 同步条目计数、数据库连接池取连接的等待时间在各自的调用处记录
+# - 各组件已有的 stats() (缓存、限流、哈希池等) 在输出时读取，转换成 gauge
+# 多 worker 部署时每个进程各自计数，由 Prometheus 按实例汇总。
+import bisect
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from starlette.routing import Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# 秒。覆盖从缓存命中的几毫秒到大库全量拉取的数十秒
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+POOL_WAIT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+# 路由模板缓存的路径数上限 (带参数的路径各不相同，超出后不再缓存)
+_ROUTE_CACHE_SIZE = 4096
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List["_Metric"] = []
+        # 输出时调用，返回 [(名称, 类型, 说明, [(标签, 值)])]
+        self._collectors: List[Callable[[], Iterable[Tuple[str, str, str, List[Tuple[dict, float]]]]]] = []
+
+    def register(self, metric: "_Metric"):
+        self._metrics.append(metric)
+
+    def collector(self, fn: Callable):
+        self._collectors.append(fn)
+        return fn
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for suffix, labels, value in metric.samples():
+                lines.append(f"{metric.name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+        for fn in self._collectors:
+            for name, kind, documentation, samples in fn():
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[tuple, object] = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def samples(self):
+        for values, child in list(self._children.items()):
+            labels = dict(zip(self.labelnames, values))
+            for suffix, extra, value in child.samples():  # type: ignore
+                yield suffix, {**labels, **extra}, value
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+    def samples(self):
+        yield "", {}, self.value
+
+
+class Counter(_Metric):
+    kind = "counter"
+    _new_child = _Value
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+    _new_child = _Value
+
+
+class _HistogramValue:
+    __slots__ = ("buckets", "counts", "sum", "_lock")
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        # 连接池等待时间可能在线程池的线程里记录
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    def samples(self):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield "_bucket", {"le": str(float(bound))}, cumulative
+        cumulative += self.counts[-1]
+        yield "_bucket", {"le": "+Inf"}, cumulative
+        yield "_sum", {}, self.sum
+        yield "_count", {}, cumulative
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+
+HTTP_LATENCY = Histogram(
+    "vault_http_request_duration_seconds", "Request latency until the last body byte is sent",
+    ["method", "route"],
+)
+HTTP_REQUESTS = Counter("vault_http_requests_total", "Completed requests", ["method", "route", "status"])
+HTTP_IN_FLIGHT = Gauge("vault_http_requests_in_flight", "Requests currently being processed", ["route"])
+HTTP_BYTES_IN = Counter("vault_http_request_bytes_total", "Request body bytes as received on the wire", ["route"])
+HTTP_BYTES_OUT = Counter("vault_http_response_bytes_total", "Response body bytes as sent on the wire", ["route"])
+SYNC_PUSHED = Counter("vault_sync_pushed_items_total", "Items accepted by /sync pushes")
+SYNC_CONFLICTS = Counter("vault_sync_push_conflicts_total", "Pushed items rejected by the version check")
+SYNC_PULLED = Counter("vault_sync_pulled_items_total", "Items returned to clients", ["endpoint"])
+DB_POOL_WAIT = Histogram(
+    "vault_db_pool_checkout_seconds", "Time spent waiting for a pooled database connection",
+    ["engine"], buckets=POOL_WAIT_BUCKETS,
+)
+
+
+def stats_collector(name: str, documentation: str, stats: Callable[[], Optional[dict]]):
+    """把组件的 stats() 字典 (数值与一层嵌套) 输出为 vault_<name>_<key> gauge"""
+    @registry.collector
+    def collect():
+        data = stats()
+        if not data:
+            return
+        for key, value in data.items():
+            if isinstance(value, dict):
+                samples = [({"kind": k}, v) for k, v in value.items() if isinstance(v, (int, float))]
+            elif isinstance(value, (int, float)):
+                samples = [({}, value)]
+            else:
+                continue
+            if samples:
+                yield f"vault_{name}_{key}", "gauge", f"{documentation}: {key}", samples
+    return collect
+
+
+class RouteLabels:
+    """按路由模板而不是原始路径打标签，避免 ID 等参数让序列数无限增长 (链路追踪的 span 名也用它)"""
+
+    def __init__(self):
+        self._routes: Dict[str, str] = {}
+
+    def __call__(self, scope: Scope) -> str:
+        key = scope["method"] + " " + scope["path"]
+        label = self._routes.get(key)
+        if label is not None:
+            return label
+        label = "unmatched"
+        app = scope.get("app")
+        for route in getattr(app, "routes", ()):
+            match, _ = route.matches(scope)
+            if match != Match.NONE:
+                label = getattr(route, "path", label)
+                if match == Match.FULL:
+                    break
+        if "{" not in label and len(self._routes) < _ROUTE_CACHE_SIZE:
+            self._routes[key] = label
+        return label
+
+
+class MetricsMiddleware:
+    """放在最外层: 计入被限流拒绝的请求，字节数为压缩后的实际传输量"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self._route = RouteLabels()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        route = self._route(scope)
+        method = scope["method"]
+        status = 500
+        bytes_in = HTTP_BYTES_IN.labels(route)
+        bytes_out = HTTP_BYTES_OUT.labels(route)
+        in_flight = HTTP_IN_FLIGHT.labels(route)
+
+        async def counting_receive() -> Message:
+            message = await receive()
+            if message["type"] == "http.request":
+                bytes_in.inc(len(message.get("body", b"")))
+            return message
+
+        async def counting_send(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                bytes_out.inc(len(message.get("body", b"")))
+            await send(message)
+
+        in_flight.inc()
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        finally:
+            in_flight.dec()
+            HTTP_LATENCY.labels(method, route).observe(time.perf_counter() - started)
+            HTTP_REQUESTS.labels(method, route, str(status)).inc()
@@ -1,5 +1,6 @@
 from typing import List, Optional, ClassVar
 from datetime import datetime
+from sqlalchemy import Index
 from sqlmodel import SQLModel, Field, Relationship
 
 class User(SQLModel, table=True):
@@ -9,14 +10,74 @@ class User(SQLModel, table=True):
     hashed_password: str
     kdf_salt: str
     created_at: datetime = Field(default_factory=datetime.now)
+    # 每次提交推送时加一的单调版本号，客户端以 "自版本 N 以来的变更" 增量同步
+    revision: int = Field(default=0)
+    # 压缩任务已清理到的 revision: 此前的删除标记和变更日志可能已不存在
+    compacted_revision: int = Field(default=0)
     items: List["VaultItem"] = Relationship(back_populates="owner", sa_relationship_kwargs={"cascade": "all, delete"})
 
 
 class VaultItem(SQLModel, table=True):
     __tablename__: ClassVar[str] = "vault_items"
+    # 增量拉取按 (owner_id, updated_at, id) 做键集分页，复合索引覆盖过滤与排序
+    __table_args__: ClassVar[tuple] = (
+        Index("ix_vault_items_owner_updated", "owner_id", "updated_at", "id"),
+        # 摘要树按 ID 前缀分桶重算，(owner_id, id) 让桶内扫描走索引范围
+        Index("ix_vault_items_owner_id", "owner_id", "id"),
+        Index("ix_vault_items_owner_revision", "owner_id", "revision"),
+    )
     id: str = Field(primary_key=True, index=True)
     encrypted_data: str
+    # 密文摘要，manifest 只返回它而不返回密文
+    content_hash: Optional[str] = Field(default=None)
     updated_at: float = Field(default_factory=lambda: datetime.now().timestamp())
     is_deleted: bool = Field(default=False)
+    # 最后一次修改该条目时所属用户的 revision
+    revision: int = Field(default=0)
+    # 条目自身的版本号，每次被接受的写入加一，用于推送时的比较并交换
+    version: int = Field(default=0)
     owner_id: int = Field(foreign_key="users.id")
-    owner: User = Relationship(back_populates="items")
\ No newline at end of file
+    owner: User = Relationship(back_populates="items")
+
+
+# 只追加的变更日志，每次推送为每个被修改的条目记一行
+class VaultChange(SQLModel, table=True):
+    __tablename__: ClassVar[str] = "vault_changes"
+    __table_args__: ClassVar[tuple] = (
+        Index("ix_vault_changes_owner_revision", "owner_id", "revision", "seq"),
+    )
+    seq: Optional[int] = Field(default=None, primary_key=True)
+    owner_id: int = Field(foreign_key="users.id")
+    revision: int
+    item_id: str
+    content_hash: Optional[str] = None
+    is_deleted: bool = Field(default=False)
+    version: int = Field(default=0)
+
+
+# 每个用户按 ID 前缀分桶的摘要树节点，prefix 为空串的是根节点
+class VaultDigest(SQLModel, table=True):
+    __tablename__: ClassVar[str] = "vault_digests"
+    owner_id: int = Field(foreign_key="users.id", primary_key=True)
+    prefix: str = Field(primary_key=True)
+    digest: str
+    item_count: int = Field(default=0)
+
+
+
+# 分片模式下用户的 revision 记在分片自己的库里，与条目在同一个事务中递增，
+# 推送时不需要写目录库
+class VaultState(SQLModel, table=True):
+    __tablename__: ClassVar[str] = "vault_state"
+    owner_id: int = Field(primary_key=True)
+    revision: int = Field(default=0)
+    compacted_revision: int = Field(default=0)
+
+
+# 每台设备确认已同步到的 revision，压缩任务只清理所有活跃设备都已见过的删除标记
+class DeviceCursor(SQLModel, table=True):
+    __tablename__: ClassVar[str] = "device_cursors"
+    owner_id: int = Field(primary_key=True)
+    device_id: str = Field(primary_key=True)
+    revision: int = Field(default=0)
+    last_seen: float = Field(default_factory=lambda: datetime.now().timestamp())
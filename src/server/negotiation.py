@@ -0,0 +1,53 @@
+# src/server/negotiation.py
+# 按 Content-Type / Accept 在 JSON 与 MessagePack 之间切换同步接口的传输格式
+from typing import Any
+from fastapi import Request, Response
+from fastapi.routing import APIRoute
+
+from src.core import tracing, wire
+
+
+class MsgPackResponse(Response):
+    media_type = wire.MSGPACK_MEDIA_TYPE
+
+    def __init__(self, content: Any, **kwargs):
+        super().__init__(content, **kwargs)
+        # 同一 URL 按 Accept 返回不同格式，缓存需要区分
+        self.headers["Vary"] = "Accept"
+
+    def render(self, content: Any) -> bytes:
+        return wire.pack(content)
+
+
+class _MsgPackRequest(Request):
+    async def json(self) -> Any:
+        # FastAPI 解析请求体时调用 json()，这里换成 msgpack 解码，之后的校验流程不变
+        if not hasattr(self, "_json"):
+            self._json = wire.unpack(await self.body())
+        return self._json
+
+
+class WireRoute(APIRoute):
+    """请求体为 msgpack 时解码成与 JSON 相同的结构，再交给 FastAPI 做模型校验"""
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def route_handler(request: Request) -> Response:
+            if wire.MSGPACK_AVAILABLE and wire.is_msgpack(request.headers.get("content-type")):
+                headers = [(k, v) for k, v in request.scope["headers"] if k != b"content-type"]
+                headers.append((b"content-type", b"application/json"))
+                request = _MsgPackRequest(dict(request.scope, headers=headers), request.receive)
+            # 包含请求体解析、模型校验、依赖 (认证、打开会话) 与 JSON 响应的序列化
+            with tracing.span("handler"):
+                return await handler(request)
+
+        return route_handler
+
+
+def wants_msgpack(request: Request) -> bool:
+    return wire.prefers_msgpack(request.headers.get("accept"))
+
+
+def wants_ndjson(request: Request) -> bool:
+    return wire.accepts_ndjson(request.headers.get("accept"))
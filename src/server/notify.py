@@ -0,0 +1,71 @@
+# src/server/notify.py
+# 进程内的变更通知: sync_vault 提交后按用户广播新的 revision，/changes/stream 的长连接据此推送事件。
+# 通知里只有 revision 数字，不含条目 ID 和密文，设备收到后自行按 /changes 增量拉取。
+# 每个连接只占一个 Subscription 和一个 asyncio.Event，连续多次提交会合并成最新的 revision，
+# 慢连接不会堆积消息。多 worker 部署时只能通知到同一进程内的连接。
+import asyncio
+from typing import Dict, Set
+
+
+class Subscription:
+    __slots__ = ("user_id", "revision", "_event")
+
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        # 已知的最新 revision，只增不减
+        self.revision = 0
+        self._event = asyncio.Event()
+
+    def advance(self, revision: int):
+        if revision > self.revision:
+            self.revision = revision
+            self._event.set()
+
+    async def wait(self, timeout: float) -> bool:
+        """等待 revision 前进，超时返回 False"""
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        self._event.clear()
+        return True
+
+
+class ChangeHub:
+    def __init__(self):
+        self._subs: Dict[int, Set[Subscription]] = {}
+        self.connections = 0
+        self.published = 0
+        self.delivered = 0
+
+    def subscribe(self, user_id: int) -> Subscription:
+        sub = Subscription(user_id)
+        self._subs.setdefault(user_id, set()).add(sub)
+        self.connections += 1
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        subs = self._subs.get(sub.user_id)
+        if subs is None or sub not in subs:
+            return
+        subs.discard(sub)
+        if not subs:
+            del self._subs[sub.user_id]
+        self.connections -= 1
+
+    def publish(self, user_id: int, revision: int):
+        self.published += 1
+        for sub in self._subs.get(user_id, ()):
+            sub.advance(revision)
+            self.delivered += 1
+
+    def stats(self) -> dict:
+        return {
+            "connections": self.connections,
+            "users": len(self._subs),
+            "published": self.published,
+            "delivered": self.delivered,
+        }
+
+
+change_hub = ChangeHub()
@@ -0,0 +1,188 @@
+# src/server/ratelimit.py
+# 准入控制与限流中间件 (纯 ASGI，全部状态在进程内存中，单节点部署无需外部服务)
+# - 全局并发上限: 同时处理中的 API 请求超过上限时返回 503
+# - 令牌桶: 认证接口与同步接口各有独立的预算，分别按 IP 和按用户计量，超出时返回 429
+import math
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs
+
+from jose import JWTError, jwt
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .cache import user_cache
+from .config import settings
+
+# 登录表单只需要读出用户名，超过这个大小的请求体不解析
+_MAX_FORM_PEEK = 4096
+
+
+class TokenBuckets:
+    """按键分配的令牌桶，rate 为每秒补充的令牌数，burst 为桶容量；键数超过上限时淘汰最久未用的"""
+
+    def __init__(self, rate: float, burst: int, max_keys: int):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        # key -> (剩余令牌, 上次补充时间)
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    def acquire(self, key: str) -> float:
+        """取一个令牌。成功返回 0，否则返回需要等待的秒数"""
+        now = time.monotonic()
+        tokens, last = self._buckets.pop(key, (float(self.burst), now))
+        tokens = min(float(self.burst), tokens + (now - last) * self.rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / self.rate if self.rate > 0 else 60.0
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class RateLimiter:
+    """限流状态与计数器，中间件实例由 Starlette 延迟创建，状态放在模块级对象上便于 /stats 读取"""
+
+    def __init__(self):
+        max_keys = settings.RATE_LIMIT_MAX_KEYS
+        self.auth_ip = TokenBuckets(settings.AUTH_RATE_PER_IP, settings.AUTH_BURST_PER_IP, max_keys)
+        self.auth_user = TokenBuckets(settings.AUTH_RATE_PER_USER, settings.AUTH_BURST_PER_USER, max_keys)
+        self.sync_ip = TokenBuckets(settings.SYNC_RATE_PER_IP, settings.SYNC_BURST_PER_IP, max_keys)
+        self.sync_user = TokenBuckets(settings.SYNC_RATE_PER_USER, settings.SYNC_BURST_PER_USER, max_keys)
+        self.max_concurrent = settings.MAX_CONCURRENT_REQUESTS
+        self.in_flight = 0
+        self.rejected: Dict[str, int] = {
+            "concurrency": 0, "auth_ip": 0, "auth_user": 0, "sync_ip": 0, "sync_user": 0,
+        }
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "rejected": dict(self.rejected),
+            "tracked_keys": {
+                "auth_ip": len(self.auth_ip), "auth_user": len(self.auth_user),
+                "sync_ip": len(self.sync_ip), "sync_user": len(self.sync_user),
+            },
+        }
+
+
+rate_limiter = RateLimiter()
+
+
+class RateLimitMiddleware:
+    def __init__(self, app: ASGIApp, limiter: RateLimiter = rate_limiter):
+        self.app = app
+        self.limiter = limiter
+        self.api_prefix = settings.API_V1_STR
+        self.stream_path = settings.API_V1_STR + "/changes/stream"
+
+    def _route_class(self, path: str) -> Optional[str]:
+        if path.startswith("/auth/"):
+            return "auth"
+        if path.startswith(self.api_prefix + "/"):
+            return "sync"
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not settings.RATE_LIMIT_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        route = self._route_class(scope["path"])
+        if route is None:
+            await self.app(scope, receive, send)
+            return
+
+        limiter = self.limiter
+        # 变更通知是长期空闲的长连接，只按令牌桶计量建立连接的次数，不计入并发上限
+        streaming = scope["path"] == self.stream_path
+        if not streaming and limiter.in_flight >= limiter.max_concurrent:
+            await self._reject(scope, receive, send, "concurrency", 1.0)
+            return
+
+        headers = Headers(scope=scope)
+        client_ip = scope["client"][0] if scope.get("client") else "unknown"
+        user = self._user_from_token(headers)
+        if user is None and route == "auth" and scope["path"] == "/auth/token":
+            user, receive = await self._username_from_form(headers, receive)
+
+        ip_buckets, user_buckets = (
+            (limiter.auth_ip, limiter.auth_user) if route == "auth" else (limiter.sync_ip, limiter.sync_user)
+        )
+        wait = ip_buckets.acquire(client_ip)
+        if wait:
+            await self._reject(scope, receive, send, f"{route}_ip", wait)
+            return
+        if user is not None:
+            wait = user_buckets.acquire(user)
+            if wait:
+                await self._reject(scope, receive, send, f"{route}_user", wait)
+                return
+
+        if streaming:
+            await self.app(scope, receive, send)
+            return
+        limiter.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.in_flight -= 1
+
+    def _user_from_token(self, headers: Headers) -> Optional[str]:
+        scheme, _, token = headers.get("authorization", "").partition(" ")
+        if scheme.lower() != "bearer" or not token:
+            return None
+        cached = user_cache.peek(token)
+        if cached is not None:
+            return cached.username
+        # 未命中缓存时验签后取 sub，伪造的 token 不能消耗别人的预算
+        try:
+            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        except JWTError:
+            return None
+        sub = payload.get("sub")
+        return str(sub) if sub is not None else None
+
+    async def _username_from_form(self, headers: Headers, receive: Receive):
+        """登录请求按表单中的用户名计量，读出的请求体原样交还给下游"""
+        if not headers.get("content-type", "").startswith("application/x-www-form-urlencoded"):
+            return None, receive
+        length = headers.get("content-length", "")
+        if headers.get("content-encoding") or not length.isdigit() or int(length) > _MAX_FORM_PEEK:
+            return None, receive
+
+        messages = []
+        more_body = True
+        while more_body:
+            message = await receive()
+            messages.append(message)
+            if message["type"] != "http.request":
+                break
+            more_body = message.get("more_body", False)
+        body = b"".join(m.get("body", b"") for m in messages)
+
+        async def replay() -> Message:
+            if messages:
+                return messages.pop(0)
+            return await receive()
+
+        username = parse_qs(body.decode("latin-1")).get("username", [None])[0]
+        return username, replay
+
+    async def _reject(self, scope: Scope, receive: Receive, send: Send, reason: str, wait: float):
+        self.limiter.rejected[reason] += 1
+        status_code = 503 if reason == "concurrency" else 429
+        response = JSONResponse(
+            {"detail": "Too many requests" if status_code == 429 else "Server busy, please retry"},
+            status_code=status_code,
+            headers={"Retry-After": str(max(1, math.ceil(wait)))},
+        )
+        await response(scope, receive, send)
@@ -0,0 +1,103 @@
+# src/server/repository.py
+# 路由通过仓储访问数据，不直接关心数据在哪个库:
+# - UserRepository: 用户表，总在主库 (分片模式下即目录库)
+# - VaultRepository: 某个用户的条目、变更日志、摘要树和 revision，
+#   shared 后端在主库，sharded 后端在该用户自己的分片文件
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator, Hashable, List, Optional, Tuple
+
+from sqlalchemy import update
+from sqlmodel import select, col
+
+from .database import DBSession, write_lock
+from .models import DeviceCursor, User, VaultState
+from .shards import shard_store
+
+
+class UserRepository:
+    def __init__(self, session: DBSession):
+        self.session = session
+
+    async def get_by_username(self, username: str) -> Optional[User]:
+        statement = select(User).where(User.username == username)
+        return (await self.session.exec(statement)).first()
+
+    async def add(self, user: User) -> User:
+        self.session.add(user)
+        await self.session.commit()
+        await self.session.refresh(user)
+        return user
+
+    async def save(self, user: User):
+        self.session.add(user)
+        await self.session.commit()
+
+
+class VaultRepository:
+    def __init__(self, session: DBSession, user_id: int, sharded: bool = False):
+        self.session = session
+        self.user_id = user_id
+        self.sharded = sharded
+        # 分片模式下 revision 存在分片的 vault_state 表，shared 模式下在 users 表
+        if sharded:
+            self._state, self._owner_col = VaultState, VaultState.owner_id
+        else:
+            self._state, self._owner_col = User, User.id
+        self._revision_col = self._state.revision
+
+    @property
+    def lock_key(self) -> Hashable:
+        return ("shard", self.user_id) if self.sharded else None
+
+    def write_lock(self):
+        """写事务开始前取得的进程内锁: 主库全局一把，分片模式下每个分片一把"""
+        return write_lock(self.lock_key)
+
+    async def revision(self) -> int:
+        statement = select(self._revision_col).where(self._owner_col == self.user_id)
+        return (await self.session.exec(statement)).one()
+
+    async def state(self) -> Tuple[int, int]:
+        """(revision, compacted_revision)，一次主键查询"""
+        statement = select(self._revision_col, self._state.compacted_revision).where(self._owner_col == self.user_id)
+        revision, compacted = (await self.session.exec(statement)).one()
+        return revision, compacted
+
+    async def bump_revision(self, delta: int = 1) -> int:
+        """递增 revision 并返回新值。这条 UPDATE 取得写锁，同一用户的并发推送在此串行化"""
+        await self.session.exec(
+            update(self._state).where(self._owner_col == self.user_id)  # type: ignore
+            .values(revision=col(self._revision_col) + delta)
+        )
+        return await self.revision()
+
+    async def set_compacted(self, revision: int):
+        await self.session.exec(
+            update(self._state).where(self._owner_col == self.user_id)  # type: ignore
+            .values(compacted_revision=revision)
+        )
+
+    async def ack_device(self, device_id: str, revision: int, now: float) -> DeviceCursor:
+        """记录设备已同步到的 revision，游标只前进不后退"""
+        cursor = await self.session.get(DeviceCursor, (self.user_id, device_id))
+        if cursor is None:
+            cursor = DeviceCursor(owner_id=self.user_id, device_id=device_id, revision=revision)
+        cursor.revision = max(cursor.revision, revision)
+        cursor.last_seen = now
+        self.session.add(cursor)
+        await self.session.commit()
+        return cursor
+
+    async def devices(self) -> List[DeviceCursor]:
+        statement = select(DeviceCursor).where(DeviceCursor.owner_id == self.user_id)
+        return list((await self.session.exec(statement)).all())
+
+
+@asynccontextmanager
+async def open_vault(session: DBSession, user_id: int) -> AsyncGenerator[VaultRepository, None]:
+    """session 是主库会话；分片模式下另开该用户分片的会话"""
+    if shard_store is None:
+        yield VaultRepository(session, user_id)
+        return
+    async with shard_store.session(user_id) as shard_session:
+        yield VaultRepository(shard_session, user_id, sharded=True)
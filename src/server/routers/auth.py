@@ -2,13 +2,15 @@
 from typing import Annotated
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlmodel import Session, select
 from pydantic import BaseModel
 from jose import JWTError, jwt
 
-from ..database import get_session
+from ..database import DBSession, get_session
+from ..repository import UserRepository
+from ..cache import CachedUser, user_cache
 from ..models import User
-from ..security import get_password_hash, verify_password, create_access_token
+from ..security import get_password_hash, verify_and_update, create_access_token
+from ..hashing import HashPoolFull, hash_pool
 from ..config import settings
 
 router = APIRouter()
@@ -37,9 +39,28 @@ class UserCheckResponse(BaseModel):
 # tokenUrl 参数指向我们下面定义的登录接口地址，用于 Swagger UI 自动测试
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token")
 
+def get_users(session: DBSession = Depends(get_session)) -> UserRepository:
+    return UserRepository(session)
+
+async def _hash(fn, *args):
+    # Argon2 在专用工作池中计算，池已排满时快速失败，让客户端稍后重试
+    try:
+        return await hash_pool.run(fn, *args)
+    except HashPoolFull:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server busy, please retry",
+            headers={"Retry-After": str(settings.HASH_RETRY_AFTER)},
+        )
+
 async def get_current_user( token: Annotated[str, Depends(oauth2_scheme)],
-                            session: Session = Depends(get_session)
-                        ) -> User:
+                            users: UserRepository = Depends(get_users)
+                        ) -> CachedUser:
+    # 命中缓存时既不验签也不查库
+    cached = user_cache.get(token)
+    if cached is not None:
+        return cached
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -63,24 +84,23 @@ async def get_current_user( token: Annotated[str, Depends(oauth2_scheme)],
     except JWTError:
         raise credentials_exception
     
-    statement = select(User).where(User.username == username)
-    user = session.exec(statement).first()
+    user = await users.get_by_username(username)
     if user is None:
         raise credentials_exception
-    return user
+    current = CachedUser(id=user.id, username=user.username, kdf_salt=user.kdf_salt)  # type: ignore
+    user_cache.put(token, current, payload.get("exp"))
+    return current
 # --- 3. API 接口 ---
 
 @router.get("/check/{username}", response_model=UserCheckResponse)
-def check_user_exists(username: str, session: Session = Depends(get_session)):
-    statement = select(User).where(User.username == username)
-    user = session.exec(statement).first()
+async def check_user_exists(username: str, users: UserRepository = Depends(get_users)):
+    user = await users.get_by_username(username)
     return {"exists": user is not None}
 
 @router.post("/register", response_model=UserRead)
-def register(user_in: UserCreate, session: Session = Depends(get_session)):
+async def register(user_in: UserCreate, users: UserRepository = Depends(get_users)):
     # 1. 检查用户名是否已存在
-    statement = select(User).where(User.username == user_in.username)
-    existing_user = session.exec(statement).first()
+    existing_user = await users.get_by_username(user_in.username)
     if existing_user:
         raise HTTPException(
             status_code=400, 
@@ -91,31 +111,34 @@ def register(user_in: UserCreate, session: Session = Depends(get_session)):
     # 注意：这里存的是登录密码的哈希，和 kdf_salt
     new_user = User(
         username=user_in.username,
-        hashed_password=get_password_hash(user_in.password),
+        hashed_password=await _hash(get_password_hash, user_in.password),
         kdf_salt=user_in.kdf_salt
     )
     
-    session.add(new_user)
-    session.commit()
-    session.refresh(new_user)
-    return new_user
+    return await users.add(new_user)
 
 @router.post("/token", response_model=Token)
-def login_for_access_token(
+async def login_for_access_token(
     form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
-    session: Session = Depends(get_session)
+    users: UserRepository = Depends(get_users)
 ):
     # 1. 查找用户
-    statement = select(User).where(User.username == form_data.username)
-    user = session.exec(statement).first()
+    user = await users.get_by_username(form_data.username)
     
     # 2. 验证密码 (登录密码)
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    valid, new_hash = (False, None)
+    if user:
+        valid, new_hash = await _hash(verify_and_update, form_data.password, user.hashed_password)
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    # 哈希成本参数调整过，顺便按新参数保存
+    if new_hash:
+        user.hashed_password = new_hash
+        await users.save(user)
     
     # 3. 生成 Token
     access_token = create_access_token(subject=user.username)
@@ -123,7 +146,7 @@ def login_for_access_token(
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.get("/me", response_model=UserRead)
-def read_users_me(current_user: User = Depends(get_current_user)):
+async def read_users_me(current_user: CachedUser = Depends(get_current_user)):
     """
     获取当前登录用户的信息 (包括 kdf_salt)
     客户端登录后需要调用此接口获取 kdf_salt，才能解密本地数据
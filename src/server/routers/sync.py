@@ -1,95 +1,785 @@
 # sandbox/server/routers/sync.py
-from typing import List
+from typing import AsyncGenerator, AsyncIterator, List, Dict, Optional, Tuple
+import base64
+import json
 import time
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlmodel import Session, select
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, Request, Response, status
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from sqlmodel import Session, select, col
+from sqlalchemy import update, or_, and_
+from sqlalchemy.dialects import sqlite, postgresql
 from pydantic import BaseModel
 
-from ..database import get_session
-from ..models import VaultItem, User
+from src.core import tracing
+from src.core.crypto import content_hash
+from src.core.digest import DIGEST_DEPTH, prefix_upper_bound
+from src.core.wire import NDJSON_MEDIA_TYPE, items_to_wire
+from ..database import DBSession, get_session, session_scope, stream_partitions
+from ..repository import VaultRepository, open_vault
+from ..config import settings
+from ..writer import group_writer
+from ..notify import change_hub
+from ..snapshot import snapshot_store
+from ..negotiation import MsgPackResponse, WireRoute, wants_msgpack, wants_ndjson
+from .. import digest
+from ..models import VaultItem, VaultChange
 from .auth import get_current_user
+from ..cache import CachedUser
+from ..logs import get_logger
+from .. import metrics
 
-router = APIRouter()
+logger = get_logger("sync")
+
+# WireRoute 让请求体可以是 JSON 或 msgpack，响应格式按 Accept 协商
+router = APIRouter(route_class=WireRoute)
+
+# SQLite 单条语句的绑定参数有上限 (老版本为 999)，IN (...) 查询与批量插入都按块执行
+CHUNK_SIZE = 500
+
+# 分页拉取的默认与最大页大小
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+
+# 流式响应 (NDJSON) 每个数据块的条目数，也是服务端游标每次取回的行数
+STREAM_BATCH_SIZE = 500
+# 流式响应中每个条目行的字段顺序
+ITEM_FIELDS = ["id", "encrypted_data", "is_deleted", "updated_at", "revision", "version"]
+
+# manifest 每行的字段顺序
+MANIFEST_FIELDS = ["id", "updated_at", "is_deleted", "content_hash", "revision", "version"]
+# 变更日志每行的字段顺序
+CHANGES_FIELDS = ["id", "revision", "is_deleted", "content_hash", "version"]
 
 class VaultItemPush(BaseModel):
     id: str
     encrypted_data: str
     is_deleted: bool
+    # 客户端修改所基于的服务端版本，0 表示新建；
+    # 与服务端当前版本不一致时拒绝写入。不提供则按旧协议直接覆盖
+    base_version: Optional[int] = None
+
+class VaultItemConflict(BaseModel):
+    id: str
+    version: int
+    revision: int
+    encrypted_data: str
+    is_deleted: bool
 
 class SyncRequest(BaseModel):
     last_sync_timestamp: float = 0.0
-    push_items: List[VaultItemPush] 
+    # 提供时按 revision 增量拉取，优先于 last_sync_timestamp
+    since_revision: Optional[int] = None
+    # 为 False 时只推送，不在响应中返回拉取结果
+    pull: bool = True
+    push_items: List[VaultItemPush]
 
 class SyncResponse(BaseModel):
     server_timestamp: float
+    # 提交后用户的 revision，本次推送的条目都记在这个版本上
+    revision: int = 0
     pull_items: List[VaultItem]
     processed_ids: List[str] = []
-    
+    # 被接受条目的新版本号
+    versions: Dict[str, int] = {}
+    # 版本检查未通过而被拒绝的条目，附带服务端当前内容
+    conflicts: List[VaultItemConflict] = []
+
+class PullResponse(BaseModel):
+    server_timestamp: float
+    items: List[VaultItem]
+    # 为 None 表示已经拉取到最后一页
+    next_cursor: Optional[str] = None
+
+class ManifestResponse(BaseModel):
+    server_timestamp: float
+    revision: int
+    fields: List[str]
+    # 每行按 fields 顺序排列，比逐条对象节省键名开销
+    items: List[list]
+
+class DigestNode(BaseModel):
+    prefix: str
+    digest: str
+    count: int
+
+class DigestRequest(BaseModel):
+    # 默认请求根节点
+    prefixes: List[str] = [""]
+
+class ChangesResponse(BaseModel):
+    # 查询开始时用户的 revision
+    revision: int
+    # 压缩位置: 不大于它的删除标记和变更日志可能已被清理
+    compacted_revision: int = 0
+    fields: List[str]
+    items: List[list]
+    # 变更日志的 seq 游标，为 None 表示没有更多
+    next_cursor: Optional[int] = None
+
+class DigestResponse(BaseModel):
+    depth: int
+    revision: int = 0
+    # 同 ChangesResponse.compacted_revision。本地已同步过 (revision 不大于它) 而云端不存在的条目已在云端删除
+    compacted_revision: int = 0
+    nodes: List[DigestNode]
+    # 被请求的内部节点的子节点
+    children: List[DigestNode] = []
+    # 被请求的叶子桶内的条目，格式同 manifest
+    fields: List[str] = MANIFEST_FIELDS
+    items: List[list] = []
+
+class FetchRequest(BaseModel):
+    ids: List[str]
+
+class FetchResponse(BaseModel):
+    items: List[VaultItem]
+
+
+async def get_vault(
+    session: DBSession = Depends(get_session),
+    current_user: CachedUser = Depends(get_current_user)
+) -> AsyncGenerator[VaultRepository, None]:
+    # 当前用户的数据仓储: shared 后端沿用主库会话，sharded 后端打开该用户的分片
+    async with open_vault(session, current_user.id) as vault:
+        yield vault
+
+
+def _chunks(seq: list, size: int = CHUNK_SIZE):
+    for i in range(0, len(seq), size):
+        yield seq[i:i + size]
+
+
+def _fetch_existing(session: Session, ids: List[str]) -> Dict[str, Tuple[int, int]]:
+    """一次 IN (...) 查询拿到已存在条目的 (归属, 版本)，替代逐条 session.get"""
+    existing: Dict[str, Tuple[int, int]] = {}
+    for chunk in _chunks(ids):
+        rows = session.exec(
+            select(VaultItem.id, VaultItem.owner_id, VaultItem.version).where(VaultItem.id.in_(chunk))  # type: ignore
+        ).all()
+        existing.update({row_id: (owner_id, version) for row_id, owner_id, version in rows})
+    return existing
+
+
+def _apply_push(session: Session, rows: List[dict], user_id: int, revision: int):
+    """写入条目、变更日志并更新摘要树。同步代码，经 run_sync 在同一事务内执行"""
+    _bulk_upsert(session, rows, user_id)
+    session.bulk_insert_mappings(VaultChange, [  # type: ignore
+        {
+            "owner_id": user_id, "revision": revision, "item_id": r["id"],
+            "content_hash": r["content_hash"], "is_deleted": r["is_deleted"],
+            "version": r["version"],
+        }
+        for r in rows
+    ])
+    # 已持有写锁，在同一事务内更新摘要树
+    digest.refresh_digests(session, user_id, [r["id"] for r in rows])
+
+
+def _bulk_upsert(session: Session, rows: List[dict], user_id: int):
+    dialect = session.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+        for chunk in _chunks(rows):
+            stmt = insert(VaultItem).values(chunk)
+            # WHERE 条件保证并发写入时也不会覆盖他人的条目
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[VaultItem.id],
+                set_={
+                    "encrypted_data": stmt.excluded.encrypted_data,
+                    "content_hash": stmt.excluded.content_hash,
+                    "is_deleted": stmt.excluded.is_deleted,
+                    "updated_at": stmt.excluded.updated_at,
+                    "revision": stmt.excluded.revision,
+                    "version": stmt.excluded.version,
+                },
+                where=(VaultItem.owner_id == user_id),
+            )
+            session.exec(stmt)  # type: ignore
+        return
+
+    # 其他数据库: 按是否已存在拆成批量 UPDATE 与批量 INSERT
+    existing = set(_fetch_existing(session, [r["id"] for r in rows]))
+    updates = [r for r in rows if r["id"] in existing]
+    inserts = [r for r in rows if r["id"] not in existing]
+    if updates:
+        session.execute(update(VaultItem), updates)
+    if inserts:
+        session.bulk_insert_mappings(VaultItem, inserts)  # type: ignore
+
+
+def _to_wire(content: dict) -> dict:
+    # 只有条目列表 (pull_items / items / conflicts) 携带密文
+    return {
+        k: items_to_wire(v) if isinstance(v, list) and v and isinstance(v[0], dict) else v
+        for k, v in content.items()
+    }
+
+
+def _respond(request: Request, content, headers: Optional[Dict[str, str]] = None):
+    """客户端接受 msgpack 时直接序列化返回，否则交给 FastAPI 按 response_model 输出 JSON"""
+    if not wants_msgpack(request):
+        return content
+    if isinstance(content, BaseModel):
+        content = content.model_dump()
+    return MsgPackResponse(_to_wire(content), headers=headers)
+
+
+def _etag(request: Request, user_id: int, revision: int, compacted: int) -> str:
+    # 同一 URL 的响应体只由用户当前的 revision 和压缩位置决定；JSON 与 msgpack 是不同的表示，分开标记
+    return f'W/"{user_id}.{revision}.{compacted}-{"m" if wants_msgpack(request) else "j"}"'
+
+
+def _cache_headers(etag: str) -> Dict[str, str]:
+    # private: 响应属于当前用户；no-cache: 客户端每次都带 If-None-Match 重新验证
+    return {"ETag": etag, "Vary": "Accept", "Cache-Control": "private, no-cache"}
+
+
+def _not_modified(request: Request, etag: str) -> Optional[Response]:
+    """If-None-Match 命中时返回 304 (弱比较)，调用方不必再查询条目"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return None
+    tags = {t.strip().removeprefix("W/") for t in header.split(",")}
+    if "*" in tags or etag.removeprefix("W/") in tags:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=_cache_headers(etag))
+    return None
+
+
+def _ndjson(obj) -> str:
+    return json.dumps(obj, separators=(",", ":")) + "\n"
+
+
+def _stream_items(endpoint: str, user_id: int, header: dict, statements: List) -> StreamingResponse:
+    """
+    以 NDJSON 流式返回条目: 第一行是头部 (附带 fields)，之后每行一个条目，最后一行 {"done": true, "count": n}。
+    在生成器里另开会话用服务端游标分批读取，内存占用与条目总数无关；客户端没读到结束行即视为响应不完整
+    """
+    async def lines() -> AsyncIterator[str]:
+        yield _ndjson({**header, "fields": ITEM_FIELDS})
+        count = 0
+        # 在响应发送过程中执行，span 的耗时包含客户端读取的速度 (背压)
+        with tracing.span("stream.items", endpoint=endpoint) as span:
+            async with session_scope() as catalog, open_vault(catalog, user_id) as vault:
+                for statement in statements:
+                    async for rows in stream_partitions(vault.session, statement, STREAM_BATCH_SIZE):
+                        count += len(rows)
+                        yield "".join(_ndjson(list(r)) for r in rows)
+            span.set(items=count)
+        metrics.SYNC_PULLED.labels(endpoint).inc(count)
+        yield _ndjson({"done": True, "count": count})
+
+    return StreamingResponse(lines(), media_type=NDJSON_MEDIA_TYPE, headers={"Vary": "Accept"})
+
+
+def _item_rows():
+    return select(
+        VaultItem.id, VaultItem.encrypted_data, VaultItem.is_deleted, VaultItem.updated_at,
+        VaultItem.revision, VaultItem.version
+    )
+
+
+def encode_cursor(updated_at: float, item_id: str) -> str:
+    raw = json.dumps([updated_at, item_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[float, str]:
+    try:
+        updated_at, item_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return float(updated_at), str(item_id)
+    except Exception:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+async def _stage_push(
+    vault: VaultRepository, pushed: Dict[str, VaultItemPush], current_time: float
+) -> Tuple[int, List[str], Dict[str, int], List[VaultItemConflict]]:
+    """在当前事务中写入一次推送，由调用方提交 (直接提交或交给组提交队列)"""
+    session, user_id = vault.session, vault.user_id
+    processed_ids = []
+    # 先递增 revision: 这条 UPDATE 会取得写锁 (SQLite) / 行锁 (PostgreSQL)，
+    # 同一用户的并发推送在此串行化，版本号和摘要树都不会丢失更新
+    with tracing.span("push.lock_revision"):
+        revision = await vault.bump_revision()
+    with tracing.span("push.fetch_existing", items=len(pushed)):
+        existing = await session.run_sync(_fetch_existing, list(pushed))
+    rows = []
+    versions: Dict[str, int] = {}
+    rejected_ids: List[str] = []
+    # 对当前用户而言不存在的条目 (他人的 ID 也视为不存在，不能返回其内容)
+    missing_ids: List[str] = []
+    skipped_count = 0
+    compacted: Optional[int] = None
+    for item_id, item_in in pushed.items():
+        owner_id, current_version = existing.get(item_id, (None, 0))
+        # [诊断重点] 检查所有权
+        if owner_id is not None and owner_id != user_id:
+            logger.warning("push skipped: item owned by another user",
+                           extra={"item_id": item_id, "owner_id": owner_id, "user_id": user_id})
+            skipped_count += 1
+            missing_ids.append(item_id)
+            continue
+        # 比较并交换: 已持有该用户的写锁，读到的版本就是提交前的最终版本
+        if item_in.base_version is not None and item_in.base_version != current_version:
+            rejected_ids.append(item_id)
+            continue
+        if owner_id is None:
+            # 新建的条目: 这个 ID 可能曾经存在、删除标记已被压缩。被压缩的条目版本号不超过其 revision，
+            # 也就不超过压缩位置，从压缩位置之上开始编号，持有旧版本号的设备推送时仍会被拒绝
+            if compacted is None:
+                _, compacted = await vault.state()
+            current_version = compacted
+        versions[item_id] = current_version + 1
+        rows.append({
+            "id": item_id,
+            "encrypted_data": item_in.encrypted_data,
+            "content_hash": content_hash(item_in.encrypted_data),
+            "is_deleted": item_in.is_deleted,
+            "updated_at": current_time,
+            "revision": revision,
+            "version": current_version + 1,
+            "owner_id": user_id,
+        })
+        processed_ids.append(item_id)
+
+    conflicts = []
+    for chunk in _chunks(rejected_ids):
+        statement = select(VaultItem).where(col(VaultItem.id).in_(chunk), VaultItem.owner_id == user_id)
+        for item in (await session.exec(statement)).all():
+            conflicts.append(VaultItemConflict(
+                id=item.id, version=item.version, revision=item.revision,
+                encrypted_data=item.encrypted_data, is_deleted=item.is_deleted
+            ))
+    # 基于某个版本修改、但云端已没有这一行 (删除标记已被压缩): 以版本 0 的删除标记作为冲突返回，
+    # 否则客户端既收不到成功也收不到冲突，每次同步都会重新推送
+    found = {c.id for c in conflicts}
+    missing_ids.extend(i for i in rejected_ids if i not in found)
+    conflicts.extend(
+        VaultItemConflict(id=i, version=0, revision=0, encrypted_data="", is_deleted=True) for i in missing_ids
+    )
+
+    if rows:
+        with tracing.span("push.apply", rows=len(rows)):
+            await session.run_sync(_apply_push, rows, user_id, revision)
+    else:
+        # 全部被跳过时撤销递增，不占用版本号 (组提交时同一事务里还有别人的写入，不能回滚)
+        revision = await vault.bump_revision(-1)
+    updated_count = sum(1 for r in rows if r["id"] in existing)
+    logger.debug("push staged", extra={
+        "user_id": user_id, "revision": revision, "inserted": len(rows) - updated_count,
+        "updated": updated_count, "skipped": skipped_count, "conflicts": len(conflicts),
+    })
+    return revision, processed_ids, versions, conflicts
+
+
 @router.post("/sync", response_model=SyncResponse)
-def sync_vault(
+async def sync_vault(
     payload: SyncRequest,
-    session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user)
+    request: Request,
+    vault: VaultRepository = Depends(get_vault),
+    current_user: CachedUser = Depends(get_current_user)
 ):
-    user_id: int = current_user.id # type: ignore
+    session, user_id = vault.session, vault.user_id
     current_time = time.time()
-    
-    print(f"\n>>> [Sync Request] User: {current_user.username} (ID: {user_id})")
-    print(f">>> Payload: {len(payload.push_items)} items to PUSH")
-    processed_ids = []
+
+    logger.debug("sync request", extra={"user_id": user_id, "push_items": len(payload.push_items)})
     # 1. PUSH 处理
-    processed_count = 0
-    skipped_count = 0
-    
+    # 同一请求内重复的 ID 以最后一次为准 (ON CONFLICT 不允许同一语句内重复命中同一行)
+    pushed: Dict[str, VaultItemPush] = {}
     for item_in in payload.push_items:
-        db_item = session.get(VaultItem, item_in.id)
-        
-        if db_item:
-            # [诊断重点] 检查所有权
-            if db_item.owner_id != user_id:
-                print(f"!!! [SKIP] ID冲突/无权修改: {item_in.id} (Owner: {db_item.owner_id} != Current: {user_id})")
-                skipped_count += 1
-                continue 
-            
-            # 更新逻辑
-            db_item.encrypted_data = item_in.encrypted_data
-            db_item.is_deleted = item_in.is_deleted
-            db_item.updated_at = current_time
-            print(f"    [UPDATE] {item_in.id}")
-            processed_count += 1
-            processed_ids.append(item_in.id)
-        else:
-            # 新增逻辑
-            print(f"    [INSERT] {item_in.id}")
-            new_item = VaultItem(
-                id=item_in.id,
-                encrypted_data=item_in.encrypted_data,
-                is_deleted=item_in.is_deleted,
-                updated_at=current_time,
-                owner_id=user_id
-            )
-            session.add(new_item)
-            processed_count += 1
-            processed_ids.append(item_in.id)
-    
-    try:
-        session.commit()
-        print(f">>> [COMMIT] Success. Processed: {processed_count}, Skipped: {skipped_count}")
-    except Exception as e:
-        print(f"!!! [COMMIT ERROR] {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        pushed[item_in.id] = item_in
+
+    if pushed:
+        try:
+            if settings.SYNC_GROUP_COMMIT and not vault.sharded:
+                # 与其他并发推送合并成一个事务提交，提交完成 (已落盘) 后才返回
+                with tracing.span("push.group_commit", items=len(pushed)):
+                    revision, processed_ids, versions, conflicts = await group_writer.submit(
+                        lambda s: _stage_push(VaultRepository(s, user_id), pushed, current_time), weight=len(pushed)
+                    )
+            else:
+                # SQLite 只有一个写者: 进程内先排队，避免多个写事务在 busy_timeout 里轮询
+                # span 的自身耗时即排队等锁的时间
+                with tracing.span("push.write", items=len(pushed)):
+                    async with vault.write_lock():
+                        revision, processed_ids, versions, conflicts = await _stage_push(
+                            vault, pushed, current_time
+                        )
+                        with tracing.span("push.commit"):
+                            await session.commit()
+        except Exception as e:
+            logger.error("push commit failed", exc_info=True, extra={"user_id": user_id, "items": len(pushed)})
+            raise HTTPException(status_code=500, detail=str(e))
+        metrics.SYNC_PUSHED.inc(len(processed_ids))
+        metrics.SYNC_CONFLICTS.inc(len(conflicts))
+        # 已提交: 通知该用户其他在线设备
+        if processed_ids:
+            change_hub.publish(user_id, revision)
+    else:
+        revision = await vault.revision()
+        processed_ids, versions, conflicts = [], {}, []
 
     # 2. PULL 处理
+    server_items = []
+    streaming = wants_ndjson(request)
+    statements = []
+    # 客户端的游标已是最新 revision 时不必查询条目
+    if payload.pull and not (payload.since_revision is not None and payload.since_revision >= revision):
+        statement = (_item_rows() if streaming else select(VaultItem)).where(VaultItem.owner_id == user_id)
+        if payload.since_revision is not None:
+            statement = statement.where(VaultItem.revision > payload.since_revision)
+        else:
+            statement = statement.where(VaultItem.updated_at > payload.last_sync_timestamp)
+        statements.append(statement)
+
+    if streaming:
+        # 流式模式: 条目在发送响应的过程中逐批读取，请求本身的会话到此为止
+        await session.close()
+        header = SyncResponse(
+            server_timestamp=current_time, revision=revision, pull_items=[],
+            processed_ids=processed_ids, versions=versions, conflicts=conflicts,
+        ).model_dump(exclude={"pull_items"})
+        return _stream_items("sync", user_id, header, statements)
+
+    with tracing.span("pull.query") as span:
+        for statement in statements:
+            server_items = (await session.exec(statement)).all()
+        span.set(items=len(server_items))
+
+    metrics.SYNC_PULLED.labels("sync").inc(len(server_items))
+    logger.debug("sync pull", extra={"user_id": user_id, "items": len(server_items)})
+
+    return _respond(request, SyncResponse(
+        server_timestamp=current_time,
+        revision=revision,
+        pull_items=list(server_items),
+        processed_ids=processed_ids,
+        versions=versions,
+        conflicts=conflicts
+    ))
+
+
+@router.get("/pull", response_model=PullResponse)
+async def pull_vault(
+    request: Request,
+    response: Response,
+    since: float = 0.0,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    vault: VaultRepository = Depends(get_vault)
+):
+    """
+    分页增量拉取: 返回 updated_at > since 的条目，按 (updated_at, id) 排序。
+    游标是上一页最后一条的 (updated_at, id)，时间戳相同的条目也不会重复或遗漏。
+    支持 If-None-Match: revision 未变化时返回 304，不查询条目。
+    """
+    session, user_id = vault.session, vault.user_id
+    current_time = time.time()
+    etag = _etag(request, user_id, *(await vault.state()))
+    not_modified = _not_modified(request, etag)
+    if not_modified is not None:
+        return not_modified
+    response.headers.update(_cache_headers(etag))
+
     statement = select(VaultItem).where(
         VaultItem.owner_id == user_id,
-        VaultItem.updated_at > payload.last_sync_timestamp
+        VaultItem.updated_at > since
     )
-    server_items = session.exec(statement).all()
-    
-    print(f">>> [PULL] Returning {len(server_items)} items to client.\n")
+    if cursor:
+        cursor_ts, cursor_id = decode_cursor(cursor)
+        statement = statement.where(or_(
+            VaultItem.updated_at > cursor_ts,
+            and_(VaultItem.updated_at == cursor_ts, col(VaultItem.id) > cursor_id),
+        ))
+    # 多取一条用来判断是否还有下一页
+    statement = statement.order_by(col(VaultItem.updated_at), col(VaultItem.id)).limit(limit + 1)
+    with tracing.span("pull.query"):
+        items = list((await session.exec(statement)).all())
 
-    return SyncResponse(
-        server_timestamp=current_time,
-        pull_items=list(server_items),
-        processed_ids=processed_ids
-    )
\ No newline at end of file
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor(items[-1].updated_at, items[-1].id)
+    metrics.SYNC_PULLED.labels("pull").inc(len(items))
+
+    return _respond(
+        request, PullResponse(server_timestamp=current_time, items=items, next_cursor=next_cursor),
+        _cache_headers(etag),
+    )
+
+
+@router.get("/manifest", response_model=ManifestResponse)
+async def vault_manifest(
+    request: Request,
+    vault: VaultRepository = Depends(get_vault)
+):
+    """只返回元数据 (id, updated_at, is_deleted, content_hash)，不读取也不传输密文"""
+    session, user_id = vault.session, vault.user_id
+    # 先读 revision 再读条目: 返回的 revision 不会比条目新，客户端以它为游标不会漏掉变更
+    revision, compacted = await vault.state()
+    etag = _etag(request, user_id, revision, compacted)
+    not_modified = _not_modified(request, etag)
+    if not_modified is not None:
+        return not_modified
+    statement = select(
+        VaultItem.id, VaultItem.updated_at, VaultItem.is_deleted, VaultItem.content_hash,
+        VaultItem.revision, VaultItem.version
+    ).where(VaultItem.owner_id == user_id)
+    with tracing.span("manifest.query") as span:
+        rows = [list(row) for row in (await session.exec(statement)).all()]
+        span.set(items=len(rows))
+    content = {
+        "server_timestamp": time.time(),
+        "revision": revision,
+        "fields": MANIFEST_FIELDS,
+        "items": rows,
+    }
+    if wants_msgpack(request):
+        return MsgPackResponse(content, headers=_cache_headers(etag))
+    # 直接返回 JSONResponse，跳过对大量元组的逐条校验
+    return JSONResponse(content, headers=_cache_headers(etag))
+
+
+@router.post("/items", response_model=FetchResponse)
+async def fetch_items(
+    payload: FetchRequest,
+    request: Request,
+    vault: VaultRepository = Depends(get_vault)
+):
+    """按 ID 批量取回密文，只返回属于当前用户的条目。Accept 为 NDJSON 时流式返回"""
+    session, user_id = vault.session, vault.user_id
+    if wants_ndjson(request):
+        await session.close()
+        statements = [
+            _item_rows().where(VaultItem.owner_id == user_id, col(VaultItem.id).in_(chunk))
+            for chunk in _chunks(list(dict.fromkeys(payload.ids)))
+        ]
+        return _stream_items("items", user_id, {}, statements)
+    items: List[VaultItem] = []
+    with tracing.span("items.query", ids=len(payload.ids)):
+        for chunk in _chunks(list(dict.fromkeys(payload.ids))):
+            statement = select(VaultItem).where(
+                VaultItem.owner_id == user_id,
+                col(VaultItem.id).in_(chunk)
+            )
+            items.extend((await session.exec(statement)).all())
+    metrics.SYNC_PULLED.labels("items").inc(len(items))
+    return _respond(request, FetchResponse(items=items))
+
+
+def _to_node(node) -> DigestNode:
+    return DigestNode(prefix=node.prefix, digest=node.digest, count=node.item_count)
+
+
+@router.post("/digest", response_model=DigestResponse)
+async def vault_digest(
+    payload: DigestRequest,
+    request: Request,
+    vault: VaultRepository = Depends(get_vault)
+):
+    """
+    获取摘要树节点。内部节点附带子节点，叶子桶附带桶内条目的元数据，
+    客户端只需沿摘要不一致的分支逐层下探。
+    """
+    session, user_id = vault.session, vault.user_id
+    revision, compacted = await vault.state()
+    prefixes = [p for p in dict.fromkeys(payload.prefixes) if len(p) <= DIGEST_DEPTH]
+    inner = [p for p in prefixes if len(p) < DIGEST_DEPTH]
+    leaves = [p for p in prefixes if len(p) == DIGEST_DEPTH]
+
+    with tracing.span("digest.nodes", prefixes=len(prefixes)):
+        nodes = await session.run_sync(digest.get_nodes, user_id, prefixes)
+        children = await session.run_sync(digest.get_children, user_id, inner) if inner else []
+
+    rows: List[list] = []
+    with tracing.span("digest.leaves", leaves=len(leaves)):
+        for prefix in leaves:
+            statement = select(
+                VaultItem.id, VaultItem.updated_at, VaultItem.is_deleted, VaultItem.content_hash,
+                VaultItem.revision, VaultItem.version
+            ).where(
+                VaultItem.owner_id == user_id,
+                col(VaultItem.id) >= prefix,
+                col(VaultItem.id) < prefix_upper_bound(prefix)
+            )
+            rows.extend(list(r) for r in (await session.exec(statement)).all() if r[0].startswith(prefix))
+
+    return _respond(request, DigestResponse(
+        depth=DIGEST_DEPTH,
+        revision=revision,
+        compacted_revision=compacted,
+        nodes=[_to_node(n) for n in nodes],
+        children=[_to_node(n) for n in children],
+        items=rows,
+    ))
+
+
+@router.get("/changes", response_model=ChangesResponse)
+async def vault_changes(
+    request: Request,
+    response: Response,
+    since: int = 0,
+    cursor: Optional[int] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    vault: VaultRepository = Depends(get_vault)
+):
+    """
+    读取 revision > since 的变更日志，按 seq 顺序分页。
+    同一用户的 revision 在提交时串行分配，seq 顺序与 revision 顺序一致，
+    客户端读完所有页后即可把游标推进到见过的最大 revision，没有重叠窗口。
+    """
+    session, user_id = vault.session, vault.user_id
+    revision, compacted = await vault.state()
+    etag = _etag(request, user_id, revision, compacted)
+    not_modified = _not_modified(request, etag)
+    if not_modified is not None:
+        return not_modified
+    # 游标早于压缩位置: 中间的删除标记和变更日志可能已被清理，增量结果不完整
+    if since < compacted:
+        return JSONResponse(
+            {"detail": "Change history compacted, full resync required", "compacted_revision": compacted},
+            status_code=status.HTTP_410_GONE,
+        )
+    response.headers.update(_cache_headers(etag))
+    statement = select(
+        VaultChange.item_id, VaultChange.revision, VaultChange.is_deleted, VaultChange.content_hash,
+        VaultChange.version, VaultChange.seq
+    ).where(
+        VaultChange.owner_id == user_id,
+        VaultChange.revision > since
+    )
+    if cursor is not None:
+        statement = statement.where(col(VaultChange.seq) > cursor)
+    statement = statement.order_by(col(VaultChange.seq)).limit(limit + 1)
+    with tracing.span("changes.query"):
+        rows = (await session.exec(statement)).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1][5]
+
+    return _respond(request, ChangesResponse(
+        revision=revision,
+        compacted_revision=compacted,
+        fields=CHANGES_FIELDS,
+        items=[list(r[:5]) for r in rows],
+        next_cursor=next_cursor,
+    ), _cache_headers(etag))
+
+
+@router.get("/snapshot")
+async def vault_snapshot(vault: VaultRepository = Depends(get_vault)):
+    """
+    新设备首次同步: 下载压缩快照 (格式见 snapshot.py)，支持 Range / If-Range 断点续传。
+    X-Snapshot-Revision 是快照对应的 revision，之后以 since_revision 调用 /sync 拉取增量。
+    """
+    with tracing.span("snapshot.get"):
+        snapshot = await snapshot_store.get(vault)
+    # 下载可能持续较久，不占用数据库连接
+    await vault.session.close()
+    return FileResponse(
+        snapshot.path,
+        media_type=snapshot.media_type,
+        headers={
+            "ETag": snapshot.etag,
+            "Cache-Control": "private, no-cache",
+            "X-Snapshot-Revision": str(snapshot.revision),
+            "X-Snapshot-Items": str(snapshot.count),
+        },
+    )
+
+
+class CursorAck(BaseModel):
+    revision: int
+
+class DeviceInfo(BaseModel):
+    device_id: str
+    revision: int
+    last_seen: float
+
+
+@router.put("/devices/{device_id}/cursor", response_model=DeviceInfo)
+async def ack_device_cursor(
+    payload: CursorAck,
+    device_id: str = Path(min_length=1, max_length=64),
+    vault: VaultRepository = Depends(get_vault)
+):
+    """设备完成同步后确认已同步到的 revision，压缩任务据此判断删除标记是否还有设备需要"""
+    revision = await vault.revision()
+    async with vault.write_lock():
+        cursor = await vault.ack_device(device_id, min(payload.revision, revision), time.time())
+    return DeviceInfo(device_id=cursor.device_id, revision=cursor.revision, last_seen=cursor.last_seen)
+
+
+@router.get("/devices", response_model=List[DeviceInfo])
+async def list_devices(vault: VaultRepository = Depends(get_vault)):
+    return [
+        DeviceInfo(device_id=d.device_id, revision=d.revision, last_seen=d.last_seen)
+        for d in await vault.devices()
+    ]
+
+
+def _sse(revision: int) -> str:
+    # 事件只携带 revision，不含条目 ID 和密文
+    return f"id: {revision}\nevent: revision\ndata: {json.dumps({'revision': revision})}\n\n"
+
+
+@router.get("/changes/stream")
+async def vault_changes_stream(
+    request: Request,
+    since: Optional[int] = None,
+    session: DBSession = Depends(get_session),
+    current_user: CachedUser = Depends(get_current_user)
+):
+    """
+    Server-Sent Events: 用户的 revision 前进时推送一条 revision 事件，
+    设备收到后按 /changes?since=<本地游标> 拉取变更。
+    since 省略时先推送一次当前 revision；断线重连时浏览器会带上 Last-Event-ID。
+    """
+    if change_hub.connections >= settings.CHANGE_STREAM_MAX_CONNECTIONS:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many change streams",
+            headers={"Retry-After": str(int(settings.CHANGE_STREAM_HEARTBEAT))},
+        )
+    last_event_id = request.headers.get("last-event-id", "")
+    if since is None and last_event_id.isdigit():
+        since = int(last_event_id)
+
+    # 先订阅再读当前 revision，两者之间提交的推送也不会漏掉
+    sub = change_hub.subscribe(current_user.id)
+    try:
+        async with open_vault(session, current_user.id) as vault:
+            sub.advance(await vault.revision())
+        # 长连接期间不占用数据库连接
+        await session.close()
+    except BaseException:
+        change_hub.unsubscribe(sub)
+        raise
+
+    async def events():
+        sent = since if since is not None else -1
+        deadline = time.monotonic() + settings.CHANGE_STREAM_MAX_SECONDS
+        try:
+            while time.monotonic() < deadline:
+                if sub.revision > sent:
+                    sent = sub.revision
+                    yield _sse(sent)
+                    continue
+                if not await sub.wait(settings.CHANGE_STREAM_HEARTBEAT):
+                    yield ": keep-alive\n\n"
+        finally:
+            change_hub.unsubscribe(sub)
+
+    async def unsubscribe():
+        # 连接在生成器开始前就断开时 finally 不会执行，响应结束后再清理一次
+        change_hub.unsubscribe(sub)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(unsubscribe),
+    )
@@ -0,0 +1,124 @@
+# src/server/shards.py
+# 按用户分片的存储 (STORAGE_BACKEND=sharded): 每个用户一个 SQLite 文件，
+# 引擎在首次访问时打开，按 LRU 保留最多 SHARD_CACHE_SIZE 个，淘汰时关闭连接池。
+import os
+import threading
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator, Optional
+
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlmodel import SQLModel, Session
+from starlette.concurrency import run_in_threadpool
+
+from src.core.schema import add_missing_columns
+from .config import settings
+from .database import DBSession, create_engines, session_scope
+from .models import VaultItem, VaultChange, VaultDigest, VaultState, DeviceCursor
+
+# 分片库中的表。owner_id 列保留，路由里的查询在两种后端下完全一致
+SHARD_TABLES = [t.__table__ for t in (VaultItem, VaultChange, VaultDigest, VaultState, DeviceCursor)]  # type: ignore
+
+
+class Shard:
+    def __init__(self, user_id: int, engine: Engine, async_engine: Optional[AsyncEngine]):
+        self.user_id = user_id
+        self.engine = engine
+        self.async_engine = async_engine
+        # 正在使用该分片的会话数，大于 0 时不会被淘汰
+        self.refs = 0
+
+
+class ShardStore:
+    def __init__(self, directory: str, max_open: int):
+        self.directory = directory
+        self.max_open = max_open
+        self._shards: "OrderedDict[int, Shard]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.opens = 0
+        self.evictions = 0
+
+    def path(self, user_id: int) -> str:
+        return os.path.join(self.directory, f"user_{user_id}.db")
+
+    def _open(self, user_id: int) -> Shard:
+        # 在线程池中执行: 建表是阻塞 IO。持锁打开，同一分片不会被并发打开两次
+        with self._lock:
+            shard = self._shards.get(user_id)
+            if shard is not None:
+                shard.refs += 1
+                return shard
+            os.makedirs(self.directory, exist_ok=True)
+            engine, async_engine = create_engines(
+                f"sqlite:///{self.path(user_id)}", pool_size=settings.SHARD_POOL_SIZE
+            )
+            SQLModel.metadata.create_all(engine, tables=SHARD_TABLES)
+            # 旧版本创建的分片补上新增的列 (只处理分片中已存在的表)
+            add_missing_columns(engine, SQLModel.metadata)
+            with Session(engine) as session:
+                if session.get(VaultState, user_id) is None:
+                    session.add(VaultState(owner_id=user_id))
+                    session.commit()
+            shard = self._shards[user_id] = Shard(user_id, engine, async_engine)
+            shard.refs += 1
+            self.opens += 1
+            return shard
+
+    async def acquire(self, user_id: int) -> Shard:
+        with self._lock:
+            shard = self._shards.get(user_id)
+            if shard is not None:
+                self._shards.move_to_end(user_id)
+                shard.refs += 1
+                return shard
+        return await run_in_threadpool(self._open, user_id)
+
+    async def release(self, shard: Shard):
+        with self._lock:
+            shard.refs -= 1
+            evicted = []
+            # 只淘汰空闲的分片；全部在用时允许暂时超出上限
+            for user_id in list(self._shards):
+                if len(self._shards) - len(evicted) <= self.max_open:
+                    break
+                if self._shards[user_id].refs == 0:
+                    evicted.append(self._shards.pop(user_id))
+            self.evictions += len(evicted)
+        for old in evicted:
+            await self._dispose(old)
+
+    async def _dispose(self, shard: Shard):
+        if shard.async_engine is not None:
+            await shard.async_engine.dispose()
+        shard.engine.dispose()
+
+    @asynccontextmanager
+    async def session(self, user_id: int) -> AsyncGenerator[DBSession, None]:
+        shard = await self.acquire(user_id)
+        try:
+            async with session_scope((shard.engine, shard.async_engine)) as session:
+                yield session
+        finally:
+            await self.release(shard)
+
+    async def dispose_all(self):
+        with self._lock:
+            shards = list(self._shards.values())
+            self._shards.clear()
+        for shard in shards:
+            await self._dispose(shard)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "open": len(self._shards),
+                "in_use": sum(1 for s in self._shards.values() if s.refs),
+                "opens": self.opens,
+                "evictions": self.evictions,
+            }
+
+
+shard_store: Optional[ShardStore] = None
+if settings.STORAGE_BACKEND == "sharded":
+    shard_store = ShardStore(settings.SHARD_DIR, settings.SHARD_CACHE_SIZE)
@@ -0,0 +1,200 @@
+# src/server/snapshot.py
+# 新设备首次同步用的压缩快照: 每个用户一个文件，保存某个 revision 时全部条目 (含删除标记)。
+# 快照在被请求时按需重建，落后当前 revision 不超过 SNAPSHOT_MAX_LAG 时直接复用，
+# 客户端下载后再按 since_revision 拉取快照之后的增量。
+# 文件格式: 整个文件是一个 zstd (不可用时 gzip) 压缩流，解压后每行一个 JSON:
+#   第一行 {"revision": ..., "count": ..., "fields": [...]}，之后每行一个条目，按 fields 顺序排列
+# 文件名带 revision，重建时写临时文件再原子替换元数据，正在下载旧快照的连接不受影响。
+import asyncio
+import json
+import os
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+from sqlmodel import select, col
+from starlette.concurrency import run_in_threadpool
+
+from src.core import compression
+from .config import settings
+from .repository import VaultRepository
+from .models import VaultItem
+from .logs import get_logger
+
+logger = get_logger("snapshot")
+
+SNAPSHOT_FIELDS = ["id", "encrypted_data", "is_deleted", "updated_at", "revision", "version"]
+MEDIA_TYPES = {"zstd": "application/zstd", "gzip": "application/gzip"}
+_EXTENSIONS = {"zstd": "zst", "gzip": "gz"}
+# 每次压缩刷出的行数
+_ROWS_PER_BLOCK = 1000
+
+
+class Snapshot:
+    __slots__ = ("user_id", "revision", "count", "encoding", "path", "size", "built_at", "previous")
+
+    def __init__(self, user_id: int, revision: int, count: int, encoding: str, path: str, size: int,
+                 built_at: float, previous: Optional[str] = None):
+        self.user_id = user_id
+        self.revision = revision
+        self.count = count
+        self.encoding = encoding
+        self.path = path
+        self.size = size
+        self.built_at = built_at
+        # 上一个快照的文件名，下次重建时删除
+        self.previous = previous
+
+    @property
+    def etag(self) -> str:
+        # 同一 revision 的快照文件字节完全相同，可以用强校验标记配合 If-Range 续传
+        return f'"snap.{self.user_id}.{self.revision}.{self.encoding}"'
+
+    @property
+    def media_type(self) -> str:
+        return MEDIA_TYPES[self.encoding]
+
+    def to_meta(self) -> dict:
+        return {
+            "revision": self.revision, "count": self.count, "encoding": self.encoding,
+            "file": os.path.basename(self.path), "size": self.size, "built_at": self.built_at,
+            "previous": self.previous,
+        }
+
+
+def write_snapshot(path: str, encoding: str, revision: int, rows: List[tuple]) -> int:
+    """
+    把条目写成压缩快照 (先写临时文件再改名)，返回文件大小。在线程池中执行。
+    临时文件名唯一: 多个 worker 进程同时重建同一用户的快照时不会写到同一个文件里
+    """
+    compressor = compression.compressobj(encoding)
+    header = {"revision": revision, "count": len(rows), "fields": SNAPSHOT_FIELDS}
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), prefix=os.path.basename(path) + ".",
+                                     suffix=".tmp", delete=False) as f:
+        tmp = f.name
+        try:
+            f.write(compressor.flush(json.dumps(header).encode("utf-8") + b"\n"))
+            for i in range(0, len(rows), _ROWS_PER_BLOCK):
+                block = "".join(
+                    json.dumps(list(r), separators=(",", ":")) + "\n" for r in rows[i:i + _ROWS_PER_BLOCK]
+                )
+                f.write(compressor.flush(block.encode("utf-8")))
+            f.write(compressor.finish())
+            f.flush()
+            os.fsync(f.fileno())
+        except BaseException:
+            f.close()
+            os.remove(tmp)
+            raise
+    os.replace(tmp, path)
+    return os.path.getsize(path)
+
+
+class SnapshotStore:
+    def __init__(self, directory: str, max_lag: int):
+        self.directory = directory
+        self.max_lag = max_lag
+        self.encoding = compression.SUPPORTED_ENCODINGS[0]
+        # user_id -> 最近一次的快照；进程重启后从元数据文件恢复
+        self._snapshots: Dict[int, Snapshot] = {}
+        # 同一用户同时只重建一次，其他请求等待结果。锁一直保留 (与 _snapshots 一样每个用户一项)，
+        # 用完就删除的话，已取到旧锁正准备 acquire 的请求和新请求会各自持有一把锁并发重建
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self.builds = 0
+        self.hits = 0
+
+    def _meta_path(self, user_id: int) -> str:
+        return os.path.join(self.directory, f"user_{user_id}.json")
+
+    def _load(self, user_id: int) -> Optional[Snapshot]:
+        snapshot = self._snapshots.get(user_id)
+        # 多 worker 时其他进程可能已重建并删除了这里记住的文件
+        if snapshot is not None and os.path.exists(snapshot.path):
+            return snapshot
+        try:
+            with open(self._meta_path(user_id), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            path = os.path.join(self.directory, meta["file"])
+            if not os.path.exists(path):
+                return None
+            snapshot = Snapshot(user_id, meta["revision"], meta["count"], meta["encoding"],
+                                path, meta["size"], meta["built_at"], meta.get("previous"))
+        except (OSError, ValueError, KeyError):
+            return None
+        self._snapshots[user_id] = snapshot
+        return snapshot
+
+    def _usable(self, snapshot: Optional[Snapshot], revision: int, compacted: int) -> bool:
+        # 快照早于压缩位置时，增量里缺少已被清理的删除标记，必须重建
+        return (
+            snapshot is not None
+            and snapshot.encoding == self.encoding
+            and compacted <= snapshot.revision <= revision
+            and revision - snapshot.revision <= self.max_lag
+        )
+
+    async def get(self, vault: VaultRepository) -> Snapshot:
+        """返回可用的快照，过旧时重建"""
+        user_id = vault.user_id
+        revision, compacted = await vault.state()
+        snapshot = self._load(user_id)
+        if self._usable(snapshot, revision, compacted):
+            self.hits += 1
+            return snapshot  # type: ignore
+        lock = self._locks.setdefault(user_id, asyncio.Lock())
+        async with lock:
+            # 等锁期间可能已被其他请求重建
+            snapshot = self._load(user_id)
+            revision, compacted = await vault.state()
+            if self._usable(snapshot, revision, compacted):
+                self.hits += 1
+                return snapshot  # type: ignore
+            return await self._build(vault)
+
+    async def _build(self, vault: VaultRepository) -> Snapshot:
+        started = time.time()
+        user_id = vault.user_id
+        # 先读 revision 再读条目: 条目只会比 revision 新，客户端拉取增量时会再覆盖一次，不会遗漏
+        revision = await vault.revision()
+        statement = select(
+            VaultItem.id, VaultItem.encrypted_data, VaultItem.is_deleted, VaultItem.updated_at,
+            VaultItem.revision, VaultItem.version
+        ).where(VaultItem.owner_id == user_id).order_by(col(VaultItem.id))
+        rows = list((await vault.session.exec(statement)).all())
+        # 读完即结束读事务，压缩期间不占用连接上的快照
+        await vault.session.rollback()
+
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"user_{user_id}.r{revision}.snap.{_EXTENSIONS[self.encoding]}")
+        size = await run_in_threadpool(write_snapshot, path, self.encoding, revision, rows)
+        previous = self._load(user_id)
+        snapshot = Snapshot(user_id, revision, len(rows), self.encoding, path, size, started,
+                            os.path.basename(previous.path) if previous and previous.path != path else None)
+        await run_in_threadpool(self._publish, snapshot, previous)
+        self._snapshots[user_id] = snapshot
+        self.builds += 1
+        logger.info("snapshot built", extra={
+            "user_id": user_id, "revision": revision, "items": len(rows), "bytes": size,
+            "seconds": round(time.time() - started, 3),
+        })
+        return snapshot
+
+    def _publish(self, snapshot: Snapshot, previous: Optional[Snapshot]):
+        tmp = f"{self._meta_path(snapshot.user_id)}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(snapshot.to_meta(), f)
+        os.replace(tmp, self._meta_path(snapshot.user_id))
+        # 保留上一个快照，刚读到旧元数据的请求仍能打开它；再早一个删除
+        if previous is not None and previous.previous:
+            stale = os.path.join(self.directory, previous.previous)
+            if stale != snapshot.path:
+                try:
+                    os.remove(stale)
+                except OSError:
+                    pass
+
+    def stats(self) -> dict:
+        return {"cached": len(self._snapshots), "builds": self.builds, "hits": self.hits}
+
+
+snapshot_store = SnapshotStore(settings.SNAPSHOT_DIR, settings.SNAPSHOT_MAX_LAG)
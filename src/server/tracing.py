@@ -0,0 +1,39 @@
+# src/server/tracing.py
+# 服务端的链路追踪入口: 每个请求一个根 span ("方法 路由模板")，按请求头 traceparent 接到客户端的链路上，
+# 响应头 X-Trace-Id 返回 trace_id 便于在追踪文件中查找。路由内部的 span 用 src.core.tracing.span() 添加。
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.core import tracing
+from .metrics import RouteLabels
+
+TRACE_ID_HEADER = b"x-trace-id"
+
+
+class TracingMiddleware:
+    """放在压缩与限流之外: 根 span 的自身耗时包含解压、压缩与响应序列化"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self._route = RouteLabels()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not tracing.enabled():
+            await self.app(scope, receive, send)
+            return
+
+        traceparent = None
+        for name, value in scope["headers"]:
+            if name == b"traceparent":
+                traceparent = value.decode("latin-1")
+                break
+
+        with tracing.remote_span(f"{scope['method']} {self._route(scope)}", traceparent) as span:
+            trace_id = span.trace_id.encode("ascii")
+
+            async def traced_send(message: Message):
+                if message["type"] == "http.response.start":
+                    span.set(status=message["status"])
+                    message["headers"] = list(message.get("headers", [])) + [(TRACE_ID_HEADER, trace_id)]
+                await send(message)
+
+            await self.app(scope, receive, traced_send)
@@ -0,0 +1,121 @@
+# src/server/writer.py
+# 推送的组提交队列 (可选，SYNC_GROUP_COMMIT=True 时启用)
+# 并发的 sync_vault 请求把写入任务放进队列，后台任务每隔几毫秒或攒够 N 个条目后
+# 在同一个事务里依次执行并一次提交，多个请求共享一次 fsync。事务提交后才逐个返回结果。
+import asyncio
+import weakref
+from typing import Any, Awaitable, Callable, List, Tuple
+
+from src.core import tracing
+from .config import settings
+from .database import DBSession, session_scope, write_lock
+from .logs import get_logger
+
+logger = get_logger("writer")
+
+Job = Callable[[DBSession], Awaitable[Any]]
+
+
+class GroupCommitWriter:
+    def __init__(self, window_ms: float, max_items: int):
+        self.window = window_ms / 1000
+        self.max_items = max_items
+        # 每个事件循环一个队列和后台任务
+        self._queues: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Queue]" = weakref.WeakKeyDictionary()
+        self._tasks: set = set()
+        self.batches = 0
+        self.jobs = 0
+        self.max_batch = 0
+        self.fallbacks = 0
+
+    async def submit(self, job: Job, weight: int = 1) -> Any:
+        """
+        提交一个写入任务。job 在后台事务中执行，不能自行提交或回滚；
+        批量提交失败时会单独重跑，因此必须只通过传入的会话读写数据库。
+        """
+        loop = asyncio.get_running_loop()
+        queue = self._queues.get(loop)
+        if queue is None:
+            queue = self._queues[loop] = asyncio.Queue()
+            task = loop.create_task(self._run(queue))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        future = loop.create_future()
+        # 后台任务执行 job 时接续提交方的 span，写入的耗时记在原请求的链路上
+        queue.put_nowait((job, weight, future, tracing.current()))
+        return await future
+
+    async def _run(self, queue: asyncio.Queue):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await queue.get()]
+            total = batch[0][1]
+            deadline = loop.time() + self.window
+            while total < self.max_items:
+                try:
+                    if queue.empty():
+                        timeout = deadline - loop.time()
+                        if timeout <= 0:
+                            break
+                        item = await asyncio.wait_for(queue.get(), timeout)
+                    else:
+                        item = queue.get_nowait()
+                except asyncio.TimeoutError:
+                    break
+                batch.append(item)
+                total += item[1]
+            # 请求已断开的任务不再执行
+            batch = [entry for entry in batch if not entry[2].done()]
+            if batch:
+                await self._commit(batch)
+
+    async def _commit(self, batch: List[Tuple[Job, int, asyncio.Future, Any]]):
+        self.batches += 1
+        self.jobs += len(batch)
+        self.max_batch = max(self.max_batch, len(batch))
+        try:
+            async with write_lock(), session_scope() as session:
+                results = []
+                for job, _, _, parent in batch:
+                    with tracing.use(parent):
+                        results.append(await job(session))
+                await session.commit()
+        except Exception as e:
+            logger.warning("group commit failed, retrying one by one", extra={"jobs": len(batch), "error": str(e)})
+            self.fallbacks += 1
+            for entry in batch:
+                await self._commit_one(entry)
+            return
+        for (_, _, future, _), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def _commit_one(self, entry: Tuple[Job, int, asyncio.Future, Any]):
+        job, _, future, parent = entry
+        try:
+            async with write_lock(), session_scope() as session:
+                with tracing.use(parent):
+                    result = await job(session)
+                await session.commit()
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            return
+        if not future.done():
+            future.set_result(result)
+
+    def stop(self):
+        for task in list(self._tasks):
+            task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": settings.SYNC_GROUP_COMMIT,
+            "batches": self.batches,
+            "jobs": self.jobs,
+            "max_batch": self.max_batch,
+            "fallbacks": self.fallbacks,
+        }
+
+
+group_writer = GroupCommitWriter(settings.GROUP_COMMIT_WINDOW_MS, settings.GROUP_COMMIT_MAX_ITEMS)
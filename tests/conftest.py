@@ -0,0 +1,50 @@
+# 服务端协议测试: 在临时目录的 SQLite 库上启动应用，经 TestClient 调用接口
+#   python -m pytest tests
+import os
+import tempfile
+import uuid
+
+import pytest
+
+# 配置在导入服务端模块时读取，必须先于导入设置
+_TMP = tempfile.mkdtemp(prefix="vault_test_")
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{_TMP}/cloud_vault.db",
+    "SNAPSHOT_DIR": f"{_TMP}/snapshots",
+    "SHARD_DIR": f"{_TMP}/shards",
+    "RATE_LIMIT_ENABLED": "false",
+    "MAINTENANCE_INTERVAL_HOURS": "0",
+    "LOG_LEVEL": "WARNING",
+    # 测试不需要真实的哈希成本
+    "ARGON2_TIME_COST": "1",
+    "ARGON2_MEMORY_COST": "1024",
+    "ARGON2_PARALLELISM": "1",
+})
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from src.server.main import app  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def client():
+    # 进入上下文时执行 startup (建表)；client.portal 在应用的事件循环中运行协程
+    with TestClient(app) as c:
+        yield c
+
+
+@pytest.fixture
+def make_user(client):
+    """注册新用户，返回其请求头"""
+    def register():
+        username = f"test_{uuid.uuid4().hex[:10]}"
+        client.post("/auth/register", json={"username": username, "password": "pw", "kdf_salt": "c2FsdA=="})
+        resp = client.post("/auth/token", data={"username": username, "password": "pw"})
+        resp.raise_for_status()
+        return {"Authorization": f"Bearer {resp.json()['access_token']}"}
+    return register
+
+
+@pytest.fixture
+def user(make_user):
+    return make_user()
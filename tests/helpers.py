@@ -0,0 +1,11 @@
+# 测试共用的请求构造
+
+
+def push(client, headers, *items):
+    resp = client.post("/api/v1/sync", json={"pull": False, "push_items": list(items)}, headers=headers)
+    assert resp.status_code == 200, resp.text
+    return resp.json()
+
+
+def item(item_id, data="ciphertext", base_version=None, is_deleted=False):
+    return {"id": item_id, "encrypted_data": data, "is_deleted": is_deleted, "base_version": base_version}
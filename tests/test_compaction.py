@@ -0,0 +1,84 @@
+# 删除标记压缩: 按设备游标确定可清理的位置，游标早于压缩位置的增量请求返回 410
+import time
+import uuid
+
+from helpers import item, push
+from src.server.maintenance import maintenance
+
+
+def compact(client, headers):
+    user_id = client.get("/auth/me", headers=headers).json()["id"]
+    return client.portal.call(maintenance.compact_user, user_id, time.time())
+
+
+def ack(client, headers, device, revision):
+    resp = client.put(f"/api/v1/devices/{device}/cursor", json={"revision": revision}, headers=headers)
+    assert resp.status_code == 200, resp.text
+
+
+def create_tombstone(client, headers):
+    item_id = str(uuid.uuid4())
+    created = push(client, headers, item(item_id, base_version=0))
+    deleted = push(client, headers, item(item_id, is_deleted=True, base_version=created["versions"][item_id]))
+    return item_id, deleted["revision"]
+
+
+def test_changes_returns_410_after_compaction(client, user):
+    item_id, revision = create_tombstone(client, user)
+    ack(client, user, "device-a", revision)
+
+    tombstones, changes = compact(client, user)
+    assert (tombstones, changes) == (1, 2)
+
+    resp = client.get("/api/v1/changes", params={"since": 0}, headers=user)
+    assert resp.status_code == 410
+    assert resp.json()["compacted_revision"] == revision
+
+    resp = client.get("/api/v1/changes", params={"since": revision}, headers=user)
+    assert resp.status_code == 200
+    assert resp.json()["items"] == []
+    pulled = client.post("/api/v1/items", json={"ids": [item_id]}, headers=user).json()["items"]
+    assert pulled == []
+
+
+def test_offline_edit_of_compacted_item_conflicts(client, user):
+    item_id, revision = create_tombstone(client, user)
+    ack(client, user, "device-a", revision)
+    compact(client, user)
+
+    # 另一台设备离线时基于版本 1 修改了这一条
+    resp = push(client, user, item(item_id, "offline edit", base_version=1))
+    assert resp["processed_ids"] == []
+    assert [(c["id"], c["version"], c["is_deleted"]) for c in resp["conflicts"]] == [(item_id, 0, True)]
+
+    # 选择保留本地: 以版本 0 重新创建，版本号从压缩位置之上开始
+    recreated = push(client, user, item(item_id, "offline edit", base_version=0))
+    assert recreated["versions"] == {item_id: revision + 1}
+
+
+def test_stale_device_cannot_overwrite_recreated_item(client, user):
+    item_id, revision = create_tombstone(client, user)
+    ack(client, user, "device-a", revision)
+    compact(client, user)
+    recreated = push(client, user, item(item_id, "recreated", base_version=0))
+
+    # 仍持有删除前版本 1 的设备: 版本号不会重复，推送被拒绝并拿到重新创建的内容
+    stale = push(client, user, item(item_id, "stale edit", base_version=1))
+    assert stale["processed_ids"] == []
+    assert [(c["version"], c["encrypted_data"]) for c in stale["conflicts"]] == \
+        [(recreated["versions"][item_id], "recreated")]
+
+
+def test_lagging_active_device_blocks_compaction(client, user):
+    first = push(client, user, item(str(uuid.uuid4())))
+    ack(client, user, "slow-device", first["revision"])
+    item_id, revision = create_tombstone(client, user)
+    ack(client, user, "fast-device", revision)
+
+    # 只能清理到最慢的活跃设备的游标: 删除标记保留，之前的变更日志可以清理
+    assert compact(client, user) == (0, 1)
+    resp = client.get("/api/v1/changes", params={"since": first["revision"]}, headers=user)
+    assert resp.status_code == 200
+    page = resp.json()
+    changes = [dict(zip(page["fields"], row)) for row in page["items"]]
+    assert any(c["id"] == item_id and c["is_deleted"] for c in changes)
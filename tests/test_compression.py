@@ -0,0 +1,67 @@
+# 请求体解压与响应压缩协商
+import json
+import uuid
+
+import pytest
+
+from src.core import compression
+from helpers import item, push
+
+ENCODINGS = compression.SUPPORTED_ENCODINGS
+
+
+def raw_get(client, url, headers):
+    """读取未经 httpx 自动解压的响应体"""
+    with client.stream("GET", url, headers=headers) as resp:
+        return resp, b"".join(resp.iter_raw())
+
+
+@pytest.mark.parametrize("encoding", ENCODINGS)
+def test_compressed_request_body_is_decoded(client, user, encoding):
+    item_id = str(uuid.uuid4())
+    body = json.dumps({"pull": False, "push_items": [item(item_id)]}).encode()
+    resp = client.post(
+        "/api/v1/sync", content=compression.compress(body, encoding),
+        headers={**user, "Content-Type": "application/json", "Content-Encoding": encoding},
+    )
+    assert resp.status_code == 200, resp.text
+    assert resp.json()["processed_ids"] == [item_id]
+
+
+@pytest.mark.parametrize("encoding", ENCODINGS)
+def test_large_response_uses_negotiated_encoding(client, user, encoding):
+    push(client, user, *(item(str(uuid.uuid4()), data="x" * 200) for _ in range(20)))
+    resp, raw = raw_get(client, "/api/v1/manifest", {**user, "Accept-Encoding": f"br, {encoding}"})
+    assert resp.status_code == 200
+    assert resp.headers["content-encoding"] == encoding
+    assert "Accept-Encoding" in resp.headers["vary"]
+    assert len(json.loads(compression.decompress(raw, encoding))["items"]) == 20
+
+
+def test_zstd_is_preferred_over_gzip(client, user):
+    push(client, user, *(item(str(uuid.uuid4())) for _ in range(20)))
+    resp, _ = raw_get(client, "/api/v1/manifest", {**user, "Accept-Encoding": "gzip, zstd"})
+    assert resp.headers["content-encoding"] == ENCODINGS[0]
+
+
+def test_small_response_is_not_compressed(client, user):
+    resp, raw = raw_get(client, "/api/v1/manifest", {**user, "Accept-Encoding": "gzip"})
+    assert "content-encoding" not in resp.headers
+    assert json.loads(raw)["items"] == []
+
+
+def test_unsupported_request_encoding_is_rejected(client, user):
+    resp = client.post(
+        "/api/v1/sync", content=b"{}",
+        headers={**user, "Content-Type": "application/json", "Content-Encoding": "br"},
+    )
+    assert resp.status_code == 415
+    assert resp.headers["accept-encoding"] == ", ".join(ENCODINGS)
+
+
+def test_malformed_compressed_body_is_rejected(client, user):
+    resp = client.post(
+        "/api/v1/sync", content=b"not gzip",
+        headers={**user, "Content-Type": "application/json", "Content-Encoding": "gzip"},
+    )
+    assert resp.status_code == 400
@@ -0,0 +1,64 @@
+# 摘要树: 节点摘要与条目内容一致，单个条目变化只影响其路径上的节点
+import uuid
+
+from helpers import item, push
+from src.core.crypto import content_hash
+from src.core.digest import DIGEST_DEPTH, combine, entry_digest, to_hex
+
+
+def digest(client, headers, *prefixes):
+    resp = client.post("/api/v1/digest", json={"prefixes": list(prefixes)}, headers=headers)
+    assert resp.status_code == 200, resp.text
+    return resp.json()
+
+
+def nodes(resp, key="nodes"):
+    return {n["prefix"]: n["digest"] for n in resp[key]}
+
+
+def test_root_is_xor_of_item_digests(client, user):
+    items = {str(uuid.uuid4()): f"data-{n}" for n in range(50)}
+    push(client, user, *(item(i, data) for i, data in items.items()))
+
+    root = digest(client, user, "")
+    expected = combine(entry_digest(i, content_hash(data), False) for i, data in items.items())
+    assert nodes(root)[""] == to_hex(expected)
+    assert root["nodes"][0]["count"] == len(items)
+    assert sum(n["count"] for n in root["children"]) == len(items)
+
+
+def test_single_change_only_touches_its_path(client, user):
+    ids = [str(uuid.uuid4()) for _ in range(200)]
+    push(client, user, *(item(i) for i in ids))
+    before = digest(client, user, "")
+    target = ids[0]
+
+    push(client, user, item(target, "changed"))
+    after = digest(client, user, "")
+    assert nodes(after)[""] != nodes(before)[""]
+    changed = {p for p, d in nodes(after, "children").items() if nodes(before, "children").get(p) != d}
+    assert changed == {target[:1]}
+
+    # 下探到叶子桶: 只有该条目所在的桶不同，桶内返回新的内容摘要
+    inner = digest(client, user, target[:1])
+    leaf = digest(client, user, target[:DIGEST_DEPTH])
+    assert nodes(inner, "children")[target[:DIGEST_DEPTH]] == nodes(leaf)[target[:DIGEST_DEPTH]]
+    fields = leaf["fields"]
+    rows = {r[0]: dict(zip(fields, r)) for r in leaf["items"]}
+    assert all(i.startswith(target[:DIGEST_DEPTH]) for i in rows)
+    assert rows[target]["content_hash"] == content_hash("changed")
+
+
+def test_tombstone_changes_digest(client, user):
+    item_id = str(uuid.uuid4())
+    created = push(client, user, item(item_id, base_version=0))
+    before = nodes(digest(client, user, ""))[""]
+    push(client, user, item(item_id, is_deleted=True, base_version=created["versions"][item_id]))
+    assert nodes(digest(client, user, ""))[""] != before
+
+
+def test_digests_are_per_user(client, user, make_user):
+    other = make_user()
+    push(client, other, item(str(uuid.uuid4())))
+    empty = digest(client, user, "")
+    assert empty["nodes"] == [] and empty["children"] == []
@@ -0,0 +1,56 @@
+# /changes 与 /manifest 的 ETag / 304 Not Modified
+import uuid
+
+import pytest
+
+from src.core import wire
+from helpers import item, push
+
+ENDPOINTS = ["/api/v1/changes", "/api/v1/manifest"]
+
+
+@pytest.mark.parametrize("url", ENDPOINTS)
+def test_unchanged_vault_returns_304(client, user, url):
+    push(client, user, item(str(uuid.uuid4())))
+    first = client.get(url, headers=user)
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+    assert first.headers["cache-control"] == "private, no-cache"
+
+    resp = client.get(url, headers={**user, "If-None-Match": etag})
+    assert resp.status_code == 304
+    assert resp.content == b""
+    assert resp.headers["etag"] == etag
+
+
+@pytest.mark.parametrize("url", ENDPOINTS)
+def test_write_invalidates_etag(client, user, url):
+    etag = client.get(url, headers=user).headers["etag"]
+    push(client, user, item(str(uuid.uuid4())))
+
+    resp = client.get(url, headers={**user, "If-None-Match": etag})
+    assert resp.status_code == 200
+    assert resp.headers["etag"] != etag
+    assert len(resp.json()["items"]) == 1
+
+
+@pytest.mark.parametrize("url", ENDPOINTS)
+def test_json_and_msgpack_have_distinct_etags(client, user, url):
+    etag = client.get(url, headers=user).headers["etag"]
+    resp = client.get(url, headers={**user, "Accept": wire.MSGPACK_MEDIA_TYPE, "If-None-Match": etag})
+    assert resp.status_code == 200
+    assert resp.headers["etag"] != etag
+
+
+def test_etag_is_per_user(client, make_user):
+    alice, bob = make_user(), make_user()
+    etag = client.get("/api/v1/manifest", headers=alice).headers["etag"]
+    resp = client.get("/api/v1/manifest", headers={**bob, "If-None-Match": etag})
+    assert resp.status_code == 200
+
+
+def test_weak_comparison_and_tag_lists(client, user):
+    etag = client.get("/api/v1/changes", headers=user).headers["etag"]
+    strong = etag.removeprefix("W/")
+    resp = client.get("/api/v1/changes", headers={**user, "If-None-Match": f'"other", {strong}'})
+    assert resp.status_code == 304
@@ -0,0 +1,25 @@
+import asyncio
+
+import pytest
+
+from src.server.hashing import HashingPool
+
+
+def boom():
+    raise ValueError("bad hash")
+
+
+def test_failed_jobs_are_not_counted_as_completed():
+    pool = HashingPool(workers=1, queue_size=1)
+
+    async def scenario():
+        assert await pool.run(sum, [1, 2]) == 3
+        with pytest.raises(ValueError):
+            await pool.run(boom)
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        pool.shutdown()
+    stats = pool.stats()
+    assert (stats["pending"], stats["completed"], stats["failed"], stats["rejected"]) == (0, 1, 1, 0)
@@ -0,0 +1,53 @@
+# MessagePack 请求/响应与 JSON 的互通
+import base64
+import os
+import uuid
+
+import msgpack
+
+from src.core import wire
+from helpers import item, push
+
+MSGPACK = {"Content-Type": wire.MSGPACK_MEDIA_TYPE, "Accept": wire.MSGPACK_MEDIA_TYPE}
+
+
+def token():
+    # 与 Fernet token 相同的 urlsafe base64 文本
+    return base64.urlsafe_b64encode(os.urandom(90)).decode()
+
+
+def test_msgpack_push_and_pull_round_trip(client, user):
+    item_id, data = str(uuid.uuid4()), token()
+    body = {"pull": True, "since_revision": 0, "push_items": [item(item_id, data=data)]}
+    resp = client.post("/api/v1/sync", content=wire.pack(body), headers={**user, **MSGPACK})
+    assert resp.status_code == 200, resp.text
+    assert resp.headers["content-type"] == wire.MSGPACK_MEDIA_TYPE
+    assert "Accept" in resp.headers["vary"]
+
+    # 线上的密文是原始字节，解码后还原成同一个 token
+    raw = msgpack.unpackb(resp.content, raw=False)
+    assert raw["pull_items"][0]["encrypted_data"] == base64.urlsafe_b64decode(data)
+    decoded = wire.unpack(resp.content)
+    assert decoded["processed_ids"] == [item_id]
+    assert [(i["id"], i["encrypted_data"]) for i in decoded["pull_items"]] == [(item_id, data)]
+
+
+def test_msgpack_and_json_clients_see_the_same_items(client, user):
+    ids = [str(uuid.uuid4()) for _ in range(3)]
+    # 非 base64 的字符串原样以 str 传输
+    push(client, user, *(item(i, data=d) for i, d in zip(ids, [token(), "plain text", token()])))
+
+    as_json = client.post("/api/v1/items", json={"ids": ids}, headers=user).json()
+    as_msgpack = client.post("/api/v1/items", json={"ids": ids}, headers={**user, "Accept": wire.MSGPACK_MEDIA_TYPE})
+    assert wire.unpack(as_msgpack.content)["items"] == as_json["items"]
+
+
+def test_json_is_kept_when_preferred(client, user):
+    accept = f"application/json, {wire.MSGPACK_MEDIA_TYPE};q=0.5"
+    resp = client.get("/api/v1/manifest", headers={**user, "Accept": accept})
+    assert resp.headers["content-type"] == "application/json"
+
+
+def test_malformed_msgpack_body_is_rejected(client, user):
+    resp = client.post("/api/v1/sync", content=b"\xc1", headers={**user, **MSGPACK})
+    assert resp.status_code == 400
@@ -0,0 +1,50 @@
+# /sync 的 NDJSON 流式响应
+import json
+import uuid
+
+from src.core import wire
+from helpers import item, push
+
+NDJSON = {"Accept": f"{wire.NDJSON_MEDIA_TYPE}, application/json;q=0.5"}
+
+
+def stream_sync(client, headers, payload):
+    resp = client.post("/api/v1/sync", json=payload, headers={**headers, **NDJSON})
+    assert resp.status_code == 200, resp.text
+    assert resp.headers["content-type"].startswith(wire.NDJSON_MEDIA_TYPE)
+    header, *rows, end = [json.loads(line) for line in resp.text.splitlines()]
+    return header, [dict(zip(header["fields"], r)) for r in rows], end
+
+
+def test_stream_has_header_rows_and_end_marker(client, user):
+    ids = sorted(str(uuid.uuid4()) for _ in range(5))
+    result = push(client, user, *(item(i) for i in ids))
+
+    header, rows, end = stream_sync(client, user, {"pull": True, "since_revision": 0, "push_items": []})
+    assert header["revision"] == result["revision"]
+    assert "pull_items" not in header
+    assert sorted(r["id"] for r in rows) == ids
+    assert all(r["encrypted_data"] == "ciphertext" and r["version"] == 1 for r in rows)
+    assert end == {"done": True, "count": 5}
+
+
+def test_push_results_are_in_the_header(client, user):
+    item_id = str(uuid.uuid4())
+    header, rows, end = stream_sync(client, user, {"pull": True, "since_revision": 0, "push_items": [item(item_id)]})
+    assert header["processed_ids"] == [item_id]
+    assert header["versions"] == {item_id: 1}
+    assert [r["id"] for r in rows] == [item_id]
+    assert end["count"] == 1
+
+
+def test_up_to_date_cursor_streams_no_rows(client, user):
+    revision = push(client, user, item(str(uuid.uuid4())))["revision"]
+    _, rows, end = stream_sync(client, user, {"pull": True, "since_revision": revision, "push_items": []})
+    assert rows == []
+    assert end == {"done": True, "count": 0}
+
+
+def test_wildcard_accept_gets_plain_json(client, user):
+    resp = client.post("/api/v1/sync", json={"pull": True, "since_revision": 0, "push_items": []}, headers={**user, "Accept": "*/*"})
+    assert resp.headers["content-type"] == "application/json"
+    assert "pull_items" in resp.json()
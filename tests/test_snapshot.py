@@ -0,0 +1,67 @@
+# 新设备快照: 内容格式、Range / If-Range 断点续传、并发请求只重建一次
+import json
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from src.core import compression
+from src.server.snapshot import SNAPSHOT_FIELDS, snapshot_store
+from helpers import item, push
+
+
+def download(client, headers, **extra):
+    # 快照本身就是压缩文件，读取原始字节，不让 httpx 按 Content-Encoding 处理
+    with client.stream("GET", "/api/v1/snapshot", headers={**headers, **extra}) as resp:
+        return resp, b"".join(resp.iter_raw())
+
+
+def read_snapshot(raw, encoding):
+    header, *rows = [json.loads(line) for line in compression.decompress(raw, encoding).splitlines()]
+    return header, [dict(zip(header["fields"], r)) for r in rows]
+
+
+def test_snapshot_contains_all_items(client, user):
+    ids = sorted(str(uuid.uuid4()) for _ in range(10))
+    revision = push(client, user, *(item(i) for i in ids))["revision"]
+
+    resp, raw = download(client, user)
+    assert resp.status_code == 200
+    assert resp.headers["x-snapshot-revision"] == str(revision)
+    assert resp.headers["x-snapshot-items"] == "10"
+    assert resp.headers["accept-ranges"] == "bytes"
+    assert "content-encoding" not in resp.headers
+
+    header, rows = read_snapshot(raw, snapshot_store.encoding)
+    assert header == {"revision": revision, "count": 10, "fields": SNAPSHOT_FIELDS}
+    assert sorted(r["id"] for r in rows) == ids
+
+
+def test_range_resumes_download(client, user):
+    push(client, user, *(item(str(uuid.uuid4()), data="x" * 100) for _ in range(20)))
+    full, raw = download(client, user)
+    etag, size = full.headers["etag"], len(raw)
+    half = size // 2
+
+    resp, tail = download(client, user, Range=f"bytes={half}-", **{"If-Range": etag})
+    assert resp.status_code == 206
+    assert resp.headers["content-range"] == f"bytes {half}-{size - 1}/{size}"
+    assert raw[:half] + tail == raw
+
+
+def test_stale_if_range_returns_whole_file(client, user):
+    push(client, user, item(str(uuid.uuid4())))
+    full, raw = download(client, user)
+
+    resp, body = download(client, user, Range="bytes=10-", **{"If-Range": '"snap.0.0.gzip"'})
+    assert resp.status_code == 200
+    assert body == raw
+
+
+def test_concurrent_requests_build_once(client, user):
+    push(client, user, *(item(str(uuid.uuid4())) for _ in range(50)))
+    builds = snapshot_store.builds
+
+    with ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(lambda _: download(client, user), range(4)))
+    assert {resp.status_code for resp, _ in results} == {200}
+    assert len({body for _, body in results}) == 1
+    assert snapshot_store.builds == builds + 1
@@ -0,0 +1,51 @@
+# 分页拉取的游标稳定性
+import uuid
+
+from helpers import item, push
+
+
+def pull_all(client, headers, limit, between_pages=None):
+    ids, cursor, pages = [], None, 0
+    while True:
+        params = {"since": 0, "limit": limit}
+        if cursor:
+            params["cursor"] = cursor
+        resp = client.get("/api/v1/pull", params=params, headers=headers)
+        assert resp.status_code == 200, resp.text
+        page = resp.json()
+        ids.extend(i["id"] for i in page["items"])
+        pages += 1
+        cursor = page["next_cursor"]
+        if not cursor:
+            return ids, pages
+        if between_pages is not None:
+            between_pages(pages)
+
+
+def test_pages_cover_items_with_equal_timestamps(client, user):
+    # 同一次推送的条目 updated_at 相同，只按时间戳分页会重复或遗漏
+    ids = sorted(str(uuid.uuid4()) for _ in range(25))
+    push(client, user, *(item(i) for i in ids))
+
+    pulled, pages = pull_all(client, user, limit=10)
+    assert pulled == ids
+    assert pages == 3
+
+
+def test_writes_between_pages_do_not_shift_the_cursor(client, user):
+    ids = [str(uuid.uuid4()) for _ in range(25)]
+    push(client, user, *(item(i) for i in ids))
+    later = [str(uuid.uuid4()) for _ in range(5)]
+
+    def write(page):
+        if page == 1:
+            push(client, user, *(item(i) for i in later))
+
+    pulled, _ = pull_all(client, user, limit=10, between_pages=write)
+    assert len(pulled) == len(set(pulled))
+    assert set(pulled) == set(ids) | set(later)
+
+
+def test_invalid_cursor_is_rejected(client, user):
+    resp = client.get("/api/v1/pull", params={"cursor": "not-a-cursor"}, headers=user)
+    assert resp.status_code == 400
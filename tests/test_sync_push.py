@@ -0,0 +1,72 @@
+# 推送的版本检查 (比较并交换) 与 revision 分配
+import uuid
+
+from helpers import item, push
+
+
+def test_create_and_update_with_matching_version(client, user):
+    item_id = str(uuid.uuid4())
+    first = push(client, user, item(item_id, "v1", base_version=0))
+    assert first["processed_ids"] == [item_id]
+    assert first["versions"] == {item_id: 1}
+    assert first["conflicts"] == []
+
+    second = push(client, user, item(item_id, "v2", base_version=1))
+    assert second["versions"] == {item_id: 2}
+    assert second["revision"] == first["revision"] + 1
+
+
+def test_stale_version_is_rejected_with_current_content(client, user):
+    item_id = str(uuid.uuid4())
+    push(client, user, item(item_id, "server", base_version=0))
+
+    resp = push(client, user, item(item_id, "stale edit", base_version=0))
+    assert resp["processed_ids"] == []
+    assert resp["conflicts"] == [{
+        "id": item_id, "version": 1, "revision": resp["revision"], "encrypted_data": "server", "is_deleted": False,
+    }]
+
+
+def test_rejected_push_does_not_consume_a_revision(client, user):
+    item_id = str(uuid.uuid4())
+    created = push(client, user, item(item_id, base_version=0))
+    rejected = push(client, user, item(item_id, base_version=5))
+    assert rejected["revision"] == created["revision"]
+
+
+def test_missing_row_is_reported_as_conflict(client, user):
+    # 基于某个版本的修改，但云端没有这一行 (例如删除标记已被压缩)
+    item_id = str(uuid.uuid4())
+    resp = push(client, user, item(item_id, "offline edit", base_version=3))
+    assert resp["processed_ids"] == []
+    assert resp["conflicts"] == [{
+        "id": item_id, "version": 0, "revision": 0, "encrypted_data": "", "is_deleted": True,
+    }]
+
+
+def test_every_pushed_id_is_processed_or_conflicting(client, user):
+    ok, stale, missing = (str(uuid.uuid4()) for _ in range(3))
+    push(client, user, item(stale, base_version=0))
+    resp = push(client, user, item(ok, base_version=0), item(stale, base_version=0), item(missing, base_version=2))
+    assert resp["processed_ids"] == [ok]
+    assert {c["id"] for c in resp["conflicts"]} == {stale, missing}
+
+
+def test_other_users_item_is_not_overwritten_or_leaked(client, user, make_user):
+    item_id = str(uuid.uuid4())
+    push(client, user, item(item_id, "secret", base_version=0))
+
+    resp = push(client, make_user(), item(item_id, "hijack"))
+    assert resp["processed_ids"] == []
+    assert resp["conflicts"] == [{
+        "id": item_id, "version": 0, "revision": 0, "encrypted_data": "", "is_deleted": True,
+    }]
+    pulled = client.post("/api/v1/items", json={"ids": [item_id]}, headers=user).json()["items"]
+    assert pulled[0]["encrypted_data"] == "secret"
+
+
+def test_revisions_are_per_user(client, user, make_user):
+    first = push(client, user, item(str(uuid.uuid4())))
+    push(client, make_user(), item(str(uuid.uuid4())))
+    second = push(client, user, item(str(uuid.uuid4())))
+    assert second["revision"] == first["revision"] + 1